@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from . import metrics
+from . import utility as utils
+from .locks import SharedSlots
+
+# How often the first queued request checks for slots released by other processes, which are not handed over
+SHARED_SLOT_POLL_INTERVAL = 0.05
+
+UPLOADS_IN_FLIGHT = metrics.Gauge(
+    "nb_uploader_uploads_in_flight",
+    "Number of uploads currently working against GitHub",
+)
+UPLOAD_QUEUE_DEPTH = metrics.Gauge(
+    "nb_uploader_upload_queue_depth",
+    "Number of uploads waiting for an upload slot",
+)
+UPLOAD_QUEUE_WAIT = metrics.Summary(
+    "nb_uploader_upload_queue_wait_seconds",
+    "Time uploads spent waiting for an upload slot",
+)
+UPLOADS_REJECTED = metrics.Counter(
+    "nb_uploader_uploads_rejected_total",
+    "Number of uploads rejected because the server was at capacity",
+    labelled=True,
+)
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request cannot be admitted because the server is at capacity."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(
+            "The server is currently handling too many uploads. Please try again later."
+        )
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limit the number of requests doing a particular kind of work at once.
+
+    Up to `limit` requests are admitted at a time. Further requests wait in a first-in-first-out queue of
+    at most `max_queue` requests, for up to `max_wait` seconds. A request that arrives when the queue is full,
+    or that waits too long, is rejected with AdmissionRejectedError.
+
+    Given shared slots (with `limit` slots), the limit applies across all the processes using them,
+    while each process keeps its own queue.
+
+    NOTE: The controller must only be used from a single event loop (i.e., within one worker process).
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        max_queue: int,
+        max_wait: float,
+        shared_slots: SharedSlots | None = None,
+    ):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.shared_slots = shared_slots
+        self.in_flight = 0
+        # Futures set to the descriptor of the shared slot (if any) handed to the waiting request
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _update_gauges(self) -> None:
+        UPLOADS_IN_FLIGHT.set(self.in_flight)
+        UPLOAD_QUEUE_DEPTH.set(self.queue_depth)
+
+    def _reject(self, reason: str) -> AdmissionRejectedError:
+        UPLOADS_REJECTED.inc(reason=reason)
+        return AdmissionRejectedError(retry_after=math.ceil(self.max_wait))
+
+    def _try_admit(self) -> tuple[bool, int | None]:
+        """
+        Take a slot if one is free (in this process, and among the shared slots if there are any),
+        returning whether a slot was taken and the descriptor of the shared slot.
+        """
+        if self.in_flight >= self.limit:
+            return False, None
+        fd = None
+        if self.shared_slots is not None:
+            fd = self.shared_slots.try_acquire()
+            if fd is None:
+                return False, None
+        self.in_flight += 1
+        self._update_gauges()
+        return True, fd
+
+    async def _acquire(self) -> int | None:
+        """Wait for a slot, returning the descriptor of its shared slot (if there are shared slots)."""
+        if not self._waiters:
+            admitted, fd = self._try_admit()
+            if admitted:
+                return fd
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                poll = (
+                    self.shared_slots is not None
+                    and remaining > SHARED_SLOT_POLL_INTERVAL
+                )
+                try:
+                    # When a slot is released in this process, it is handed directly to the first waiter (see _release)
+                    return await asyncio.wait_for(
+                        asyncio.shield(waiter),
+                        timeout=(
+                            SHARED_SLOT_POLL_INTERVAL if poll else remaining
+                        ),
+                    )
+                except asyncio.TimeoutError:
+                    if not poll:
+                        # Since Python 3.12, wait_for can time out even though the waiter was just handed a slot, which must be passed on
+                        if waiter.done() and not waiter.cancelled():
+                            self._release(waiter.result())
+                        raise self._reject("wait_timeout")
+                    if waiter.done():
+                        return waiter.result()
+                    if waiter is self._waiters[0]:
+                        admitted, fd = self._try_admit()
+                        if admitted:
+                            waiter.set_result(fd)
+                            return fd
+        except asyncio.CancelledError:
+            # If the request was cancelled (e.g., the client disconnected) just after being handed a slot, pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result())
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            UPLOAD_QUEUE_WAIT.observe(time.monotonic() - start)
+            self._update_gauges()
+
+    def _release(self, fd: int | None) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(fd)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        if fd is not None:
+            self.shared_slots.release(fd)
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a slot, and hold it for the duration of the context."""
+        fd = await self._acquire()
+        try:
+            yield
+        finally:
+            self._release(fd)
+
+
+upload_admission = AdmissionController(
+    limit=utils.MAX_CONCURRENT_UPLOADS,
+    max_queue=utils.UPLOAD_QUEUE_SIZE,
+    max_wait=utils.UPLOAD_QUEUE_TIMEOUT,
+    shared_slots=SharedSlots(
+        utils.UPLOAD_SLOT_PATH, utils.MAX_CONCURRENT_UPLOADS
+    ),
+)
@@ -0,0 +1,138 @@
+"""
+Audit of the participants.json files of every dataset in the local mirror (see app/api/mirror.py)
+against the current data dictionary validation.
+
+Validation results are cached by blob SHA and a fingerprint of the validation code,
+so a rerun only revalidates files that changed since the last audit (or all files, if the validation changed).
+"""
+
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import orjson
+
+from . import dictionary_models, dictionary_utils, mappings, vocabulary
+from .cache import shared_cache
+from .mirror import DatasetMirror
+
+
+def get_validator_fingerprint() -> str:
+    """Return a hash of the modules, vocabularies and engine that define data dictionary validation."""
+    digest = hashlib.sha256(dictionary_utils.validation_engine.name.encode())
+    for module in (dictionary_models, dictionary_utils, mappings, vocabulary):
+        digest.update(Path(module.__file__).read_bytes())
+    for vocab_file in sorted(vocabulary.VOCAB_DIR.glob("*.json")):
+        digest.update(vocab_file.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+VALIDATOR_FINGERPRINT = get_validator_fingerprint()
+
+
+def validate_dictionary_file(content: bytes) -> dict:
+    """
+    Validate the raw contents of a data dictionary file,
+    returning its status ("valid", "warnings" or "invalid") with any error and all warnings.
+    """
+    errors, result_warnings = [], []
+    # NOTE: check_data_dict returns the warnings rather than warning, so files can be validated in several threads at once
+    try:
+        result_warnings = dictionary_utils.check_data_dict(
+            orjson.loads(content)
+        )
+    except orjson.JSONDecodeError:
+        errors.append("The file is not a valid JSON file.")
+    except (LookupError, ValueError) as e:
+        errors.append(str(e))
+
+    if errors:
+        status = "invalid"
+    elif result_warnings:
+        status = "warnings"
+    else:
+        status = "valid"
+    return {"status": status, "errors": errors, "warnings": result_warnings}
+
+
+def validation_cache_key(blob_sha: str) -> str:
+    return f"audit:{VALIDATOR_FINGERPRINT}:{blob_sha}"
+
+
+def get_validation_result(content: bytes, blob_sha: str) -> dict:
+    """Return the validation result of a data dictionary file, validating it only if no result is cached for its blob."""
+    if (result := shared_cache.get(validation_cache_key(blob_sha))) is None:
+        result = validate_dictionary_file(content)
+        shared_cache.set(validation_cache_key(blob_sha), result)
+    return result
+
+
+def audit_mirror(
+    mirror: DatasetMirror, max_workers: int | None = None
+) -> dict:
+    """
+    Validate the participants.json file of every dataset in the mirror and return a report of the results.
+    Files are validated in parallel across processes, skipping files whose results are already cached.
+    """
+    index = mirror.load_index()
+    results = {}
+    to_validate = {}
+    for dataset_id, entry in sorted(index.items()):
+        blob_sha = entry["blob_sha"]
+        if blob_sha is None:
+            results[dataset_id] = {
+                "status": "missing",
+                "errors": [],
+                "warnings": [],
+                "cached": False,
+            }
+            continue
+        cached = shared_cache.get(validation_cache_key(blob_sha))
+        if cached is not None:
+            results[dataset_id] = {**cached, "cached": True}
+        elif (mirrored_file := mirror.read(dataset_id)) is not None:
+            to_validate.setdefault(blob_sha, (mirrored_file.content, []))
+            to_validate[blob_sha][1].append(dataset_id)
+        else:
+            results[dataset_id] = {
+                "status": "missing",
+                "errors": [],
+                "warnings": [],
+                "cached": False,
+            }
+
+    # Identical files (e.g., copies of a template) are only validated once
+    if to_validate:
+        blob_shas = list(to_validate)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            validated = pool.map(
+                validate_dictionary_file,
+                [to_validate[blob_sha][0] for blob_sha in blob_shas],
+                chunksize=max(1, len(blob_shas) // 64),
+            )
+            for blob_sha, result in zip(blob_shas, validated):
+                shared_cache.set(validation_cache_key(blob_sha), result)
+                for dataset_id in to_validate[blob_sha][1]:
+                    results[dataset_id] = {**result, "cached": False}
+
+    for dataset_id, result in results.items():
+        result["blob_sha"] = index[dataset_id]["blob_sha"]
+        result["html_url"] = index[dataset_id]["html_url"]
+
+    summary = {
+        status: sum(result["status"] == status for result in results.values())
+        for status in ("valid", "warnings", "invalid", "missing")
+    }
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "validator": VALIDATOR_FINGERPRINT,
+        "summary": {
+            **summary,
+            "total": len(results),
+            "revalidated": sum(
+                len(dataset_ids) for _, dataset_ids in to_validate.values()
+            ),
+        },
+        "datasets": dict(sorted(results.items())),
+    }
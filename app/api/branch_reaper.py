@@ -0,0 +1,256 @@
+"""
+Deletion of orphaned bot branches, i.e., branches created for uploads (see utility.create_random_branch_name)
+that have no open pull request, e.g., because committing the data dictionary or opening the pull request failed,
+or because the pull request was closed or merged without deleting its branch.
+
+Branches of failed uploads are deleted in the background right after the failure,
+and a periodic sweep of every dataset repository deletes any that remain, in rate-limited batches.
+"""
+
+import fcntl
+import logging
+import os
+import tempfile
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from github import Github
+from github.GitCommit import GitCommit
+from github.GithubException import GithubException
+
+from . import github_client, metrics
+from . import utility as utils
+from .cache import shared_cache
+from .dataset_index import DatasetIndex
+
+# How long a newly created bot branch is protected from sweeps, so that a branch whose upload is still
+# committing the data dictionary or opening its pull request is not mistaken for an orphan
+NEW_BRANCH_GRACE_PERIOD = 60 * 60
+# Commits made with an installation token are authored by the GitHub App's bot user,
+# whose email address is <user ID>+<app name>[bot]@users.noreply.github.com
+BOT_EMAIL_SUFFIX = "[bot]@users.noreply.github.com"
+SWEEP_LOCK_PATH = os.path.join(
+    tempfile.gettempdir(), "nb_uploader_api_branch_sweep.lock"
+)
+
+BRANCHES_DELETED = metrics.Counter(
+    "nb_uploader_bot_branches_deleted_total",
+    "Number of orphaned bot branches deleted, by reason (failed_upload or sweep)",
+    labelled=True,
+)
+BRANCH_DELETIONS_FAILED = metrics.Counter(
+    "nb_uploader_bot_branch_deletions_failed_total",
+    "Number of orphaned bot branches that could not be deleted",
+)
+ORPHANED_BRANCHES_FOUND = metrics.Gauge(
+    "nb_uploader_orphaned_bot_branches",
+    "Number of orphaned bot branches found by the last sweep (including those it deleted)",
+)
+
+logger = logging.getLogger(__name__)
+
+# Deletions of the branches of failed uploads run one at a time, outside of the request that failed
+_deletions = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="branch-deletion"
+)
+
+
+@dataclass
+class SweepSummary:
+    checked: int = 0
+    skipped: int = 0
+    orphaned: int = 0
+    deleted: int = 0
+    failed: int = 0
+    dry_run: bool = False
+    orphaned_branches: list[str] = field(default_factory=list, repr=False)
+
+
+def _new_branch_key(full_name: str, branch: str) -> str:
+    return f"new-branch:{full_name}:{branch}"
+
+
+def _clean_repo_key(full_name: str) -> str:
+    return f"branch-sweep:clean:{full_name}"
+
+
+def register_new_branch(full_name: str, branch: str) -> None:
+    """Protect a bot branch that was just created for an upload from being deleted by sweeps for a while."""
+    shared_cache.set(
+        _new_branch_key(full_name, branch), True, ttl=NEW_BRANCH_GRACE_PERIOD
+    )
+
+
+def forget_clean_repo(full_name: str) -> None:
+    """Have the next sweep check a repository even if it was not pushed to since it was last found clean."""
+    shared_cache.delete(_clean_repo_key(full_name))
+
+
+def delete_branch(g: Github, full_name: str, branch: str) -> None:
+    """Delete a branch of a repository. Raises GithubException if the deletion fails."""
+    ref = urllib.parse.quote(f"heads/{branch}")
+    g.requester.requestJsonAndCheck(
+        "DELETE", f"/repos/{full_name}/git/refs/{ref}"
+    )
+
+
+def _delete_branch_of_failed_upload(org: str, full_name: str, branch: str):
+    try:
+        delete_branch(
+            github_client.get_installation_github(org), full_name, branch
+        )
+        BRANCHES_DELETED.inc(reason="failed_upload")
+    except (GithubException, github_client.GitHubUnavailableError) as e:
+        # The branch is left for the next sweep
+        BRANCH_DELETIONS_FAILED.inc()
+        logger.warning(
+            f"Could not delete branch {branch} of {full_name} after a failed upload: {e}"
+        )
+
+
+def schedule_deletion(org: str, full_name: str, branch: str) -> None:
+    """Delete the branch of a failed upload in the background."""
+    _deletions.submit(_delete_branch_of_failed_upload, org, full_name, branch)
+
+
+def is_bot_commit(commit: GitCommit) -> bool:
+    """Return whether a commit was made by the bot for an upload (see utility.create_commit_message)."""
+    return (
+        commit.message.startswith("[bot] ")
+        and commit.author is not None
+        and commit.author.email.endswith(BOT_EMAIL_SUFFIX)
+    )
+
+
+def find_orphaned_branches(g: Github, full_name: str) -> tuple[list, bool]:
+    """
+    Return the refs of the bot branches of a repository that have no open pull request,
+    and whether the repository has no bot branches left other than those (i.e., is clean once they are deleted).
+
+    A branch whose name merely looks like a bot branch (e.g., update-readme) is only treated as one
+    if its head commit was made by the bot, and a bot branch is protected for NEW_BRANCH_GRACE_PERIOD seconds
+    after its head commit, even when the sweep runs in a process that did not see it being created.
+    """
+    repo = g.withLazy(True).get_repo(full_name)
+    bot_refs = [
+        ref
+        for ref in repo.get_git_matching_refs("heads/")
+        if utils.BOT_BRANCH_NAME_PATTERN.fullmatch(
+            ref.ref.removeprefix("refs/heads/")
+        )
+    ]
+    if not bot_refs:
+        return [], True
+
+    open_pull_heads = {pull.head.ref for pull in repo.get_pulls(state="open")}
+    orphaned = []
+    is_clean = True
+    for ref in bot_refs:
+        branch = ref.ref.removeprefix("refs/heads/")
+        if branch in open_pull_heads:
+            # The branch becomes orphaned when its pull request is closed, which does not count as a push
+            is_clean = False
+            continue
+        if shared_cache.get(_new_branch_key(full_name, branch)) is not None:
+            is_clean = False
+            continue
+        head_commit = repo.get_git_commit(ref.object.sha)
+        if not is_bot_commit(head_commit):
+            # A human's branch is left alone (and does not stop the repository from being clean)
+            continue
+        age = datetime.now(timezone.utc) - head_commit.committer.date
+        if age.total_seconds() < NEW_BRANCH_GRACE_PERIOD:
+            is_clean = False
+            continue
+        orphaned.append(ref)
+    return orphaned, is_clean
+
+
+def sweep(
+    g: Github,
+    index: DatasetIndex,
+    dry_run: bool = False,
+    batch_size: int = 20,
+    batch_interval: float = 10,
+) -> SweepSummary:
+    """
+    Delete the orphaned bot branches of every dataset repository, waiting batch_interval seconds
+    after every batch_size deletions to stay well within GitHub's limits on content-changing requests.
+
+    Repositories that were clean at the end of a previous sweep and have not been pushed to since are skipped.
+    In a dry run, orphaned branches are only listed.
+    """
+    summary = SweepSummary(dry_run=dry_run)
+    index.refresh(g)
+    deleted_in_batch = 0
+    for name, metadata in sorted(index.datasets.items()):
+        full_name = f"{index.org}/{name}"
+        pushed_at = metadata.get("pushed_at")
+        if (
+            pushed_at is not None
+            and shared_cache.get(_clean_repo_key(full_name)) == pushed_at
+        ):
+            summary.skipped += 1
+            continue
+
+        summary.checked += 1
+        try:
+            orphaned, is_clean = find_orphaned_branches(g, full_name)
+        except (GithubException, github_client.GitHubUnavailableError) as e:
+            logger.warning(f"Could not list branches of {full_name}: {e}")
+            summary.failed += 1
+            continue
+        summary.orphaned += len(orphaned)
+        summary.orphaned_branches.extend(
+            f"{full_name}:{ref.ref.removeprefix('refs/heads/')}"
+            for ref in orphaned
+        )
+        if dry_run:
+            continue
+
+        for ref in orphaned:
+            if deleted_in_batch >= batch_size:
+                time.sleep(batch_interval)
+                deleted_in_batch = 0
+            try:
+                ref.delete()
+                summary.deleted += 1
+                deleted_in_batch += 1
+                BRANCHES_DELETED.inc(reason="sweep")
+            except (
+                GithubException,
+                github_client.GitHubUnavailableError,
+            ) as e:
+                logger.warning(
+                    f"Could not delete {ref.ref} of {full_name}: {e}"
+                )
+                summary.failed += 1
+                BRANCH_DELETIONS_FAILED.inc()
+                is_clean = False
+        if is_clean and pushed_at is not None:
+            # Deleting branches is itself a push, so the repository is checked once more by the next sweep
+            shared_cache.set(_clean_repo_key(full_name), pushed_at)
+
+    ORPHANED_BRANCHES_FOUND.set(summary.orphaned)
+    return summary
+
+
+def sweep_exclusively(
+    g: Github, index: DatasetIndex, **kwargs
+) -> SweepSummary | None:
+    """
+    Sweep the dataset repositories unless another process (e.g., another worker) is already sweeping them,
+    in which case return None.
+    """
+    with open(SWEEP_LOCK_PATH, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            return sweep(g, index, **kwargs)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,395 @@
+"""
+Caches for data derived from GitHub (installation tokens, repository metadata, file contents, etc.).
+
+All caches implement the same interface, so callers do not need to know which backend is in use:
+- entries can expire after a TTL
+- the cache is bounded by a number of entries and a total size in bytes, with least-recently-used entries evicted first
+- an ETag can be stored with an entry, so that an expired entry can be revalidated with a conditional request
+  (If-None-Match) instead of being fetched again
+- hits, misses and evictions are counted
+
+The backend is selected with NB_UPLOADER_API_CACHE_BACKEND:
+- "sqlite" (default): stored in a SQLite file, which is shared by all worker processes and survives restarts
+- "memory": stored in the memory of each worker process
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import orjson
+
+from . import metrics
+from . import utility as utils
+
+# Version of the table layout used by SQLiteCache
+SCHEMA_VERSION = 2
+# How long (in seconds) SQLiteCache waits before recording another use of an entry,
+# so that most hits are reads only, at the cost of least-recently-used order being approximate to this interval
+LAST_USED_TOUCH_INTERVAL = 60
+
+
+@dataclass
+class CacheEntry:
+    """A cached value and its validation info."""
+
+    value: Any
+    etag: str | None = None
+    expires_at: float | None = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.expires_at is None or self.expires_at > time.time()
+
+
+@dataclass
+class CacheStats:
+    """Counts of cache lookups and evictions since the cache was created."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+
+class Cache(ABC):
+    """
+    Interface shared by all cache backends.
+
+    Values must be JSON-serializable. The size of an entry is the length of its serialized value,
+    for both backends, so that size limits mean the same thing regardless of the backend.
+    """
+
+    def __init__(self, max_entries: int | None, max_bytes: int | None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+    def _exceeds_bounds(self, n_entries: int, size: int) -> bool:
+        return (
+            self.max_entries is not None and n_entries > self.max_entries
+        ) or (self.max_bytes is not None and size > self.max_bytes)
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self._stats, stat, getattr(self._stats, stat) + n)
+
+    def get(self, key: str) -> Any | None:
+        """Return the value stored for a key, or None if there is no fresh entry for it."""
+        entry = self.get_entry(key)
+        if entry is None or not entry.is_fresh:
+            return None
+        return entry.value
+
+    def get_entry(self, key: str) -> CacheEntry | None:
+        """
+        Return the entry stored for a key, including an expired entry if it has an ETag
+        (so that it can be revalidated), or None if there is no such entry.
+        """
+        entry = self._get(key)
+        if entry is not None and not entry.is_fresh and entry.etag is None:
+            self.delete(key)
+            entry = None
+        self._count(
+            "hits" if entry is not None and entry.is_fresh else "misses"
+        )
+        return entry
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float | None = None,
+        etag: str | None = None,
+    ) -> None:
+        """Store a value for a key, optionally expiring after ttl seconds and with an ETag for revalidation."""
+        serialized = orjson.dumps(value)
+        if self.max_bytes is not None and len(serialized) > self.max_bytes:
+            # The value could never fit, so do not evict everything else trying to make room for it
+            self.delete(key)
+            return
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._set(key, serialized, etag, expires_at)
+        self._count("evictions", self._evict())
+
+    def revalidated(self, key: str, ttl: float | None = None) -> None:
+        """Mark an entry as fresh again after the upstream data was confirmed unchanged (e.g., by a 304 response)."""
+        entry = self._get(key)
+        if entry is not None:
+            self.set(key, entry.value, ttl=ttl, etag=entry.etag)
+
+    def stats(self) -> CacheStats:
+        with self._stats_lock:
+            stats = CacheStats(**asdict(self._stats))
+        stats.entries, stats.size_bytes = self._usage()
+        return stats
+
+    @abstractmethod
+    def _get(self, key: str) -> CacheEntry | None:
+        """Return the entry for a key regardless of expiry, marking it as recently used."""
+
+    @abstractmethod
+    def _set(
+        self,
+        key: str,
+        serialized: bytes,
+        etag: str | None,
+        expires_at: float | None,
+    ) -> None:
+        """Store a serialized value for a key."""
+
+    @abstractmethod
+    def _evict(self) -> int:
+        """Evict least-recently-used entries until the cache is within its bounds, and return how many were evicted."""
+
+    @abstractmethod
+    def _usage(self) -> tuple[int, int]:
+        """Return the current number of entries and their total size in bytes."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the entry for a key, if there is one."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all entries."""
+
+
+class MemoryCache(Cache):
+    """A cache stored in the memory of the current process."""
+
+    def __init__(
+        self, max_entries: int | None = None, max_bytes: int | None = None
+    ):
+        super().__init__(max_entries, max_bytes)
+        # Ordered from least to most recently used
+        self._entries: OrderedDict[
+            str, tuple[bytes, str | None, float | None]
+        ] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> CacheEntry | None:
+        with self._lock:
+            if (item := self._entries.get(key)) is None:
+                return None
+            self._entries.move_to_end(key)
+        serialized, etag, expires_at = item
+        return CacheEntry(orjson.loads(serialized), etag, expires_at)
+
+    def _set(self, key, serialized, etag, expires_at) -> None:
+        with self._lock:
+            if (old := self._entries.pop(key, None)) is not None:
+                self._size -= len(old[0])
+            self._entries[key] = (serialized, etag, expires_at)
+            self._size += len(serialized)
+
+    def _evict(self) -> int:
+        evicted = 0
+        with self._lock:
+            while self._entries and self._exceeds_bounds(
+                len(self._entries), self._size
+            ):
+                _, (serialized, _, _) = self._entries.popitem(last=False)
+                self._size -= len(serialized)
+                evicted += 1
+        return evicted
+
+    def _usage(self) -> tuple[int, int]:
+        with self._lock:
+            return len(self._entries), self._size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if (old := self._entries.pop(key, None)) is not None:
+                self._size -= len(old[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class SQLiteCache(Cache):
+    """
+    A cache stored in a SQLite file.
+
+    Because the file is shared, every worker process of the API sees the same entries, and entries survive restarts.
+    Each thread gets its own connection, since SQLite connections should not be shared across threads.
+
+    A hit only records the use of an entry if it was last used more than touch_interval seconds ago,
+    so that hits do not all become write transactions on the shared file, and the number of entries and their total size
+    are kept up to date by triggers, so that checking the bounds after a write does not scan the table.
+    NOTE: Statistics are counted per process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        touch_interval: float = LAST_USED_TOUCH_INTERVAL,
+    ):
+        super().__init__(max_entries, max_bytes)
+        self.path = path
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        # The cache holds GitHub installation tokens, so only the user running the API may read it
+        # (SQLite creates its -wal and -shm files with the same permissions as the database file)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Including a file created with the default umask by an earlier version
+            os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
+        conn = self._connect()
+        # Cached data can always be fetched again, so a file written with an older schema is simply reset
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS cache")
+            conn.execute("DROP TABLE IF EXISTS cache_usage")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, etag TEXT, expires_at REAL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)"
+        )
+        # Running totals of the cache table (a single row), maintained by triggers on every insert, update and delete
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_usage ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, size INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO cache_usage (id, entries, size) VALUES (0, 0, 0)"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN "
+            "UPDATE cache_usage SET entries = entries + 1, size = size + NEW.size; END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS cache_updated AFTER UPDATE OF size ON cache BEGIN "
+            "UPDATE cache_usage SET size = size - OLD.size + NEW.size; END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN "
+            "UPDATE cache_usage SET entries = entries - 1, size = size - OLD.size; END"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None means every statement is committed immediately
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            # WAL mode allows readers in other processes to proceed while one process writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> CacheEntry | None:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, etag, expires_at, last_used FROM cache WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        value, etag, expires_at, last_used = row
+        now = time.time()
+        if now - last_used >= self.touch_interval:
+            conn.execute(
+                "UPDATE cache SET last_used = ? WHERE key = ?", (now, key)
+            )
+        return CacheEntry(orjson.loads(value), etag, expires_at)
+
+    def _set(self, key, serialized, etag, expires_at) -> None:
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete would not fire the usage trigger
+        self._connect().execute(
+            "INSERT INTO cache (key, value, etag, expires_at, size, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+            "value = excluded.value, etag = excluded.etag, expires_at = excluded.expires_at, "
+            "size = excluded.size, last_used = excluded.last_used",
+            (key, serialized, etag, expires_at, len(serialized), time.time()),
+        )
+
+    def _evict(self) -> int:
+        if self.max_entries is None and self.max_bytes is None:
+            return 0
+        conn = self._connect()
+        n_entries, size = self._usage()
+        evicted = 0
+        # Delete the least recently used entries in batches until the cache is within its bounds
+        while self._exceeds_bounds(n_entries, size):
+            rows = conn.execute(
+                "SELECT key, size FROM cache ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, entry_size in rows:
+                if not self._exceeds_bounds(n_entries, size):
+                    break
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                n_entries -= 1
+                size -= entry_size
+                evicted += 1
+        return evicted
+
+    def _usage(self) -> tuple[int, int]:
+        n_entries, size = (
+            self._connect()
+            .execute("SELECT entries, size FROM cache_usage")
+            .fetchone()
+        )
+        return n_entries, size
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM cache")
+
+
+def create_cache() -> Cache:
+    """Create a cache using the backend and bounds configured by environment variables."""
+    if utils.CACHE_BACKEND == "memory":
+        return MemoryCache(
+            max_entries=utils.CACHE_MAX_ENTRIES,
+            max_bytes=utils.CACHE_MAX_BYTES,
+        )
+    if utils.CACHE_BACKEND == "sqlite":
+        return SQLiteCache(
+            utils.CACHE_PATH,
+            max_entries=utils.CACHE_MAX_ENTRIES,
+            max_bytes=utils.CACHE_MAX_BYTES,
+        )
+    raise ValueError(
+        f"Unsupported cache backend: {utils.CACHE_BACKEND!r}. "
+        "NB_UPLOADER_API_CACHE_BACKEND must be one of 'sqlite' or 'memory'."
+    )
+
+
+# NOTE: Entries are only shared between worker processes when using the SQLite backend
+shared_cache = create_cache()
+
+CACHE_STAT_DESCRIPTIONS = {
+    "hits": "Number of cache lookups that found a fresh entry (in this worker)",
+    "misses": "Number of cache lookups that found no fresh entry (in this worker)",
+    "evictions": "Number of cache entries evicted to stay within the cache bounds (by this worker)",
+    "entries": "Number of entries in the cache",
+    "size_bytes": "Total size of the values in the cache, in bytes",
+}
+for _stat, _description in CACHE_STAT_DESCRIPTIONS.items():
+    metrics.Gauge(
+        f"nb_uploader_cache_{_stat}",
+        _description,
+        function=lambda stat=_stat: getattr(shared_cache.stats(), stat),
+    )
@@ -0,0 +1,77 @@
+import math
+import threading
+import time
+from enum import Enum
+
+
+class CircuitState(Enum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit is open."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(
+            f"Requests are being rejected after repeated failures. Please retry after {retry_after} seconds."
+        )
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to an upstream service that keeps failing.
+
+    - closed: requests are sent normally. After failure_threshold consecutive failures, the circuit opens.
+    - open: requests are rejected immediately with CircuitOpenError, until reset_timeout seconds have passed.
+    - half-open: a single probe request is let through. If it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError if a request should not be sent right now."""
+        with self._lock:
+            if self.state is CircuitState.CLOSED:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state is CircuitState.OPEN and remaining <= 0:
+                self.state = CircuitState.HALF_OPEN
+            if (
+                self.state is CircuitState.HALF_OPEN
+                and not self._probe_in_flight
+            ):
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(retry_after=max(math.ceil(remaining), 1))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if (
+                self.state is CircuitState.HALF_OPEN
+                or self._consecutive_failures >= self.failure_threshold
+            ):
+                self.state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Let another probe through after a request whose outcome says nothing about the upstream service (e.g., a bug)."""
+        with self._lock:
+            self._probe_in_flight = False
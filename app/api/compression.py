@@ -0,0 +1,199 @@
+"""
+Decompression of compressed uploads, with a limit on the decompressed size so that a small compressed upload
+cannot expand into an arbitrarily large one (a "zip bomb").
+
+Data dictionaries are repetitive JSON that compress well, so clients on slow connections can send them compressed, either:
+- as a compressed file part (e.g., participants.json.gz), detected from the magic bytes of the part
+- as a compressed request body, declared with a Content-Encoding header (see DecompressRequestMiddleware)
+
+gzip is always supported, and zstd when the optional zstandard package is installed.
+"""
+
+import io
+import zlib
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import utility as utils
+from .models import FailedUpload
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+SUPPORTED_ENCODINGS = ("gzip", "zstd") if zstandard is not None else ("gzip",)
+
+
+class DecompressionError(Exception):
+    """Raised when an upload cannot be decompressed, with the status code of the response to send."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _too_large(max_size: int) -> DecompressionError:
+    return DecompressionError(
+        f"The decompressed upload is larger than the limit of {max_size} bytes.",
+        status_code=413,
+    )
+
+
+def _decompress_gzip(data: bytes, max_size: int) -> bytes:
+    # wbits=16+MAX_WBITS only accepts the gzip format
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    try:
+        content = decompressor.decompress(data, max_size + 1)
+    except zlib.error as e:
+        raise DecompressionError(
+            f"The upload is not valid gzip data: {e}"
+        ) from e
+    if len(content) > max_size:
+        raise _too_large(max_size)
+    if not decompressor.eof:
+        raise DecompressionError("The gzip data of the upload is truncated.")
+    return content
+
+
+def _decompress_zstd(data: bytes, max_size: int) -> bytes:
+    if zstandard is None:
+        raise DecompressionError(
+            "zstd-compressed uploads are not supported by this server.",
+            status_code=415,
+        )
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(
+            io.BytesIO(data)
+        ) as reader:
+            content = reader.read(max_size + 1)
+    except zstandard.ZstdError as e:
+        raise DecompressionError(
+            f"The upload is not valid zstd data: {e}"
+        ) from e
+    if len(content) > max_size:
+        raise _too_large(max_size)
+    return content
+
+
+def decompress(data: bytes, encoding: str, max_size: int) -> bytes:
+    """
+    Decompress data in the given content coding, reading at most max_size + 1 bytes of output.
+
+    Raises DecompressionError if the coding is not supported (415), the data is not valid (400)
+    or the decompressed data is larger than max_size bytes (413).
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        if len(data) > max_size:
+            raise _too_large(max_size)
+        return data
+    if encoding in ("gzip", "x-gzip"):
+        return _decompress_gzip(data, max_size)
+    if encoding == "zstd":
+        return _decompress_zstd(data, max_size)
+    raise DecompressionError(
+        f"Unsupported Content-Encoding: {encoding!r}. Supported encodings: {', '.join(SUPPORTED_ENCODINGS)}.",
+        status_code=415,
+    )
+
+
+def decompress_file_part(content: bytes, max_size: int | None = None) -> bytes:
+    """
+    Return the contents of an uploaded file part, decompressing them if they are gzip or zstd data
+    (which, unlike JSON, start with the magic bytes of the format).
+    """
+    max_size = utils.MAX_DECOMPRESSED_SIZE if max_size is None else max_size
+    if content.startswith(GZIP_MAGIC):
+        return decompress(content, "gzip", max_size)
+    if content.startswith(ZSTD_MAGIC):
+        return decompress(content, "zstd", max_size)
+    return content
+
+
+class DecompressRequestMiddleware:
+    """
+    ASGI middleware that decompresses request bodies sent with a Content-Encoding header,
+    so that routes receive the decompressed body (with the Content-Encoding header removed).
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int | None = None):
+        self.app = app
+        # Defaults to NB_UPLOADER_API_MAX_DECOMPRESSED_SIZE
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        encoding = headers.get(b"content-encoding", b"").decode("latin-1")
+        if encoding.strip().lower() in ("", "identity"):
+            return await self.app(scope, receive, send)
+
+        max_size = (
+            utils.MAX_DECOMPRESSED_SIZE
+            if self.max_size is None
+            else self.max_size
+        )
+        # Compressed data is (all but) never larger than the data it decompresses to,
+        # so a body over the limit is rejected as soon as that many bytes were received, instead of being buffered whole
+        chunks = []
+        received = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            received += len(chunks[-1])
+            if received > max_size:
+                return await self._send_error(
+                    scope,
+                    receive,
+                    send,
+                    DecompressionError(
+                        f"The compressed upload is larger than the limit of {max_size} bytes.",
+                        status_code=413,
+                    ),
+                )
+            more_body = message.get("more_body", False)
+        try:
+            body = decompress(b"".join(chunks), encoding, max_size)
+        except DecompressionError as e:
+            return await self._send_error(scope, receive, send, e)
+
+        scope = {
+            **scope,
+            "headers": [
+                (key, value)
+                for key, value in scope["headers"]
+                if key not in (b"content-encoding", b"content-length")
+            ]
+            + [(b"content-length", str(len(body)).encode())],
+        }
+        sent = False
+
+        async def receive_decompressed() -> Message:
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, receive_decompressed, send)
+
+    async def _send_error(
+        self, scope: Scope, receive: Receive, send: Send, error
+    ):
+        headers = {}
+        if error.status_code == 415:
+            headers["Accept-Encoding"] = ", ".join(SUPPORTED_ENCODINGS)
+        response = JSONResponse(
+            status_code=error.status_code,
+            content=FailedUpload(error=str(error)).model_dump(),
+            headers=headers,
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,216 @@
+"""
+Annotation coverage statistics of the participants.json files of every dataset in the local mirror (see app/api/mirror.py):
+which concepts the datasets annotate, with which variable types and terms.
+
+A summary of each file is cached by blob SHA and a fingerprint of the summarization code, and the organization-level counts
+are kept up to date by only replacing the contributions of datasets whose file changed since the last refresh,
+so a refresh after a single pull request was merged only reads the mirror index and summarizes one file.
+"""
+
+import hashlib
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import dictionary_utils
+from . import utility as utils
+from .cache import shared_cache
+from .mirror import DatasetMirror
+
+
+def get_summary_fingerprint() -> str:
+    """Return a hash of the modules that define the summaries of data dictionaries."""
+    digest = hashlib.sha256()
+    for module_file in (__file__, dictionary_utils.__file__):
+        digest.update(Path(module_file).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+SUMMARY_FINGERPRINT = get_summary_fingerprint()
+
+
+def summary_cache_key(blob_sha: str) -> str:
+    return f"coverage:{SUMMARY_FINGERPRINT}:{blob_sha}"
+
+
+def _column_terms(annotations: dict) -> set[str]:
+    """Return the terms a column is annotated with: its levels, format or assessment tool, depending on its variable type."""
+    terms = {
+        level["TermURL"] for level in annotations.get("Levels", {}).values()
+    }
+    for key in ("Format", "IsPartOf"):
+        if key in annotations:
+            terms.add(annotations[key]["TermURL"])
+    return terms
+
+
+def summarize_dictionary_file(content: bytes) -> dict:
+    """
+    Summarize the annotations of the raw contents of a data dictionary file:
+    the number of annotated columns, and for each concept the columns are about, the number of columns
+    and the variable types and terms they are annotated with.
+    Files that cannot be summarized (e.g., that are not valid JSON) are summarized with an error.
+    """
+    try:
+        data_dict = utils.load_json_bytes(content)
+        annotated_columns = dictionary_utils.get_annotated_columns(data_dict)
+        concepts = {}
+        for concept in sorted(
+            {
+                column["Annotations"]["IsAbout"]["TermURL"]
+                for _, column in annotated_columns
+            }
+        ):
+            variable_types, terms = set(), set()
+            columns = dictionary_utils.get_columns_about(data_dict, concept)
+            for column in columns:
+                annotations = data_dict[column]["Annotations"]
+                variable_types.add(annotations["VariableType"])
+                terms.update(_column_terms(annotations))
+            concepts[concept] = {
+                "columns": len(columns),
+                "variable_types": sorted(variable_types),
+                "terms": sorted(terms),
+            }
+    except ValueError:
+        return {"error": "The file is not a valid JSON file."}
+    except (AttributeError, KeyError, TypeError) as e:
+        return {"error": f"The annotations of the file are malformed: {e!r}"}
+    return {
+        "error": None,
+        "annotated_columns": len(annotated_columns),
+        "concepts": concepts,
+    }
+
+
+def _contributions(summary: dict | None) -> Counter:
+    """Return what a dataset's summary (None if the dataset has no participants.json) adds to the organization-level counts."""
+    if summary is None:
+        return Counter({("datasets", "missing"): 1})
+    if summary["error"] is not None:
+        return Counter({("datasets", "unreadable"): 1})
+    counts = Counter(
+        {
+            (
+                "datasets",
+                "annotated" if summary["concepts"] else "unannotated",
+            ): 1
+        }
+    )
+    for concept, concept_summary in summary["concepts"].items():
+        counts[("concept_datasets", concept)] += 1
+        counts[("concept_columns", concept)] += concept_summary["columns"]
+        for variable_type in concept_summary["variable_types"]:
+            counts[("variable_types", concept, variable_type)] += 1
+        for term in concept_summary["terms"]:
+            counts[("terms", concept, term)] += 1
+    return counts
+
+
+class CoverageStatistics:
+    """
+    Organization-level annotation coverage counts, kept up to date with a mirror by refresh.
+    Each dataset is counted at most once per concept, variable type and term, however many of its columns use them.
+    """
+
+    def __init__(self):
+        # Dataset ID -> (blob SHA of its participants.json, summary of the file)
+        self._summaries: dict[str, tuple[str | None, dict | None]] = {}
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _summarize(
+        self,
+        dataset_mirror: DatasetMirror,
+        dataset_id: str,
+        blob_sha: str | None,
+    ) -> dict | None:
+        if blob_sha is None:
+            return None
+        if (
+            summary := shared_cache.get(summary_cache_key(blob_sha))
+        ) is not None:
+            return summary
+        if (mirrored_file := dataset_mirror.read(dataset_id)) is None:
+            return None
+        summary = summarize_dictionary_file(mirrored_file.content)
+        shared_cache.set(summary_cache_key(blob_sha), summary)
+        return summary
+
+    def refresh(self, dataset_mirror: DatasetMirror) -> int:
+        """
+        Bring the counts up to date with the mirror, only summarizing the files of datasets whose blob changed
+        since the last refresh (and whose summary is not already cached).
+        Returns the number of datasets whose contributions were replaced.
+        """
+        with self._lock:
+            index = dataset_mirror.load_index()
+            changed = 0
+            for dataset_id in self._summaries.keys() - index.keys():
+                self._counts.subtract(
+                    _contributions(self._summaries.pop(dataset_id)[1])
+                )
+                changed += 1
+            for dataset_id, entry in index.items():
+                blob_sha = entry["blob_sha"]
+                previous = self._summaries.get(dataset_id)
+                if previous is not None and previous[0] == blob_sha:
+                    continue
+                summary = self._summarize(dataset_mirror, dataset_id, blob_sha)
+                if previous is not None:
+                    self._counts.subtract(_contributions(previous[1]))
+                self._counts.update(_contributions(summary))
+                self._summaries[dataset_id] = (blob_sha, summary)
+                changed += 1
+            return changed
+
+    def report(self, include_datasets: bool = False) -> dict:
+        """Return the organization-level counts by concept, variable type and term (and optionally the summary of each dataset)."""
+        with self._lock:
+            counts = +self._counts
+            summaries = dict(self._summaries)
+        concepts = {}
+        for key, count in sorted(counts.items()):
+            if key[0] == "datasets":
+                continue
+            concept = concepts.setdefault(
+                key[1],
+                {
+                    "datasets": 0,
+                    "columns": 0,
+                    "variable_types": {},
+                    "terms": {},
+                },
+            )
+            if key[0] == "concept_datasets":
+                concept["datasets"] = count
+            elif key[0] == "concept_columns":
+                concept["columns"] = count
+            else:
+                concept[key[0]][key[2]] = count
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "summary": {
+                status: counts[("datasets", status)]
+                for status in (
+                    "annotated",
+                    "unannotated",
+                    "unreadable",
+                    "missing",
+                )
+            }
+            | {"total": len(summaries)},
+            "concepts": concepts,
+        }
+        if include_datasets:
+            report["datasets"] = {
+                dataset_id: {"blob_sha": blob_sha, "summary": summary}
+                for dataset_id, (blob_sha, summary) in sorted(
+                    summaries.items()
+                )
+            }
+        return report
+
+
+coverage_statistics = CoverageStatistics()
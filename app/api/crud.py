@@ -0,0 +1,1139 @@
+"""CRUD functions that interact with the OpenNeuroDatasets-JSONLD repositories on GitHub."""
+
+import base64
+import difflib
+import hashlib
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+
+import orjson
+from github import InputGitTreeElement
+from github.GithubException import GithubException, UnknownObjectException
+from github.Repository import Repository
+
+from . import audit, branch_reaper, github_client, metrics
+from . import utility as utils
+from .branch_reaper import SweepSummary
+from .cache import shared_cache
+from .dataset_index import DatasetIndex
+from .locks import KeyedLock, LockTimeoutError
+from .mirror import PARTICIPANTS_FILE, ParticipantsFile, SyncSummary, mirror
+from .models import (
+    ChangeType,
+    Contributor,
+    DataDictionaryDetails,
+    DataDictionaryFormatting,
+    DataDictionaryValidation,
+    SuccessfulUpload,
+    SuccessfulUploadWithWarnings,
+    UploadPreview,
+)
+
+DATASETS_ORG = "OpenNeuroDatasets-JSONLD"
+# How long to remember a successful upload, so that an identical resubmission (e.g., a client retry)
+# returns the existing pull request instead of opening a duplicate one
+UPLOAD_DEDUP_TTL = 10 * 60
+# The contents API only includes the contents of files up to 1 MB
+CONTENTS_API_MAX_SIZE = 1024 * 1024
+UNKNOWN_DATASET_MESSAGE = "404: Not Found. Please ensure you have provided a correct existing dataset ID."
+DUPLICATE_UPLOAD_WARNING = "An identical data dictionary was recently submitted for this dataset. No new pull request was opened."
+FOLLOW_UP_UPLOAD_WARNING = "Your open pull request for this dataset was updated with this upload. No new pull request was opened."
+# Shared cache key of the time of the last change to the organization's repositories reported by a webhook,
+# which tells every worker to refresh its dataset index
+DATASET_INDEX_CHANGED_KEY = "dataset-index:changed-at"
+# How long the state of a dataset's default branch (as read by the last upload) is kept in the shared cache,
+# for reuse by the next upload and to reject uploads that waited while a conflicting pull request was opened
+DATASET_STATE_TTL = 10 * 60
+
+PREVIEW_CACHE_LOOKUPS = metrics.Counter(
+    "nb_uploader_preview_cache_lookups_total",
+    "Number of upload previews looked up in the cache, by result (hit or miss)",
+    labelled=True,
+)
+
+DICTIONARY_CACHE_LOOKUPS = metrics.Counter(
+    "nb_uploader_dictionary_cache_lookups_total",
+    "Number of current data dictionaries looked up in the cache, by result (fresh, not_modified or modified)",
+    labelled=True,
+)
+
+FOLLOW_UP_UPLOADS = metrics.Counter(
+    "nb_uploader_follow_up_uploads_total",
+    "Number of uploads by a contributor with a remembered pull request for the dataset, by result "
+    "(pushed onto its branch, or a new pull request because the base_moved, it was closed or its branch_changed)",
+    labelled=True,
+)
+
+logger = logging.getLogger(__name__)
+
+dataset_index = DatasetIndex(
+    DATASETS_ORG,
+    refresh_interval=utils.DATASET_INDEX_REFRESH_INTERVAL,
+    min_refresh_interval=utils.DATASET_INDEX_MIN_REFRESH_INTERVAL,
+    missing_ttl=utils.DATASET_INDEX_MISSING_TTL,
+)
+
+
+class UploadError(Exception):
+    """Raised when an upload cannot be completed because of a problem with the request or the target dataset."""
+
+
+class UploadConflictError(UploadError):
+    """Raised when an upload cannot be completed because of another upload to the same dataset."""
+
+
+@dataclass
+class DatasetState:
+    """The state of the default branch of a dataset as read by the last upload to it, and the pull request it opened."""
+
+    head_sha: str
+    participants_file: ParticipantsFile | None
+    pull_request_url: str | None = None
+    # Wall-clock time (comparable between worker processes) the pull request was opened at
+    pull_request_opened_at: float | None = None
+    # Other data dictionary files (e.g., of phenotype files) read at head_sha, by path (None if the file does not exist)
+    other_files: dict[str, ParticipantsFile | None] = field(
+        default_factory=dict
+    )
+
+
+@dataclass
+class UploadedFile:
+    """An (already validated) uploaded data dictionary and the path in the dataset repository to upload it to."""
+
+    path: str
+    data_dict: dict
+    validation_warnings: list[str]
+
+
+# The read-modify-commit section of uploads is serialized per dataset (across all worker processes),
+# so that an upload never reads a dataset while another upload is opening a pull request against it
+dataset_locks = KeyedLock(
+    wait_time=metrics.Summary(
+        "nb_uploader_dataset_lock_wait_seconds",
+        "Time uploads spent waiting for another upload to the same dataset to finish",
+    ),
+    directory=utils.DATASET_LOCK_PATH,
+)
+
+
+def _dataset_state_key(dataset_id: str) -> str:
+    return f"dataset-state:{dataset_id}"
+
+
+def _dump_file(file: ParticipantsFile | None) -> dict | None:
+    if file is None:
+        return None
+    return {
+        "content": base64.b64encode(file.content).decode(),
+        "sha": file.sha,
+        "path": file.path,
+    }
+
+
+def _load_file(value: dict | None) -> ParticipantsFile | None:
+    if value is None:
+        return None
+    return ParticipantsFile(
+        content=base64.b64decode(value["content"]),
+        sha=value["sha"],
+        path=value["path"],
+    )
+
+
+def get_dataset_state(dataset_id: str) -> DatasetState | None:
+    """
+    Return the state of a dataset read by the last upload to it, from any worker process.
+    The state is kept in the shared cache, so that it is only changed by uploads holding the dataset lock.
+    """
+    value = shared_cache.get(_dataset_state_key(dataset_id))
+    if value is None:
+        return None
+    return DatasetState(
+        head_sha=value["head_sha"],
+        participants_file=_load_file(value["participants_file"]),
+        pull_request_url=value["pull_request_url"],
+        pull_request_opened_at=value["pull_request_opened_at"],
+        other_files={
+            path: _load_file(file)
+            for path, file in value["other_files"].items()
+        },
+    )
+
+
+def set_dataset_state(dataset_id: str, state: DatasetState) -> None:
+    shared_cache.set(
+        _dataset_state_key(dataset_id),
+        {
+            "head_sha": state.head_sha,
+            "participants_file": _dump_file(state.participants_file),
+            "pull_request_url": state.pull_request_url,
+            "pull_request_opened_at": state.pull_request_opened_at,
+            "other_files": {
+                path: _dump_file(file)
+                for path, file in state.other_files.items()
+            },
+        },
+        ttl=DATASET_STATE_TTL,
+    )
+
+
+def forget_dataset_state(dataset_id: str) -> bool:
+    """Forget the state of a dataset read by the last upload to it (e.g., after its default branch moved)."""
+    if shared_cache.get(_dataset_state_key(dataset_id)) is None:
+        return False
+    shared_cache.delete(_dataset_state_key(dataset_id))
+    return True
+
+
+def upload_dedup_key(
+    kind: str, dataset_id: str, contributor: Contributor, content_digest: str
+) -> str:
+    """
+    Return the shared cache key under which the pull request of an upload is remembered, so that the same contributor
+    resubmitting the same content (e.g., retrying after a timeout) gets the same pull request instead of opening another one.
+    The contributor is part of the key, so that someone else uploading the same content is not handed that pull request.
+    """
+    contributor_digest = hashlib.sha256(
+        json.dumps(
+            [
+                contributor.name,
+                contributor.email.strip().lower(),
+                (contributor.gh_username or "").lower(),
+            ]
+        ).encode()
+    ).hexdigest()[:32]
+    return f"{kind}:{dataset_id}:{contributor_digest}:{content_digest}"
+
+
+def _pull_request_upload_key(pull_request_url: str) -> str:
+    return f"pull-request-upload:{pull_request_url}"
+
+
+def forget_pull_request(pull_request_url: str) -> bool:
+    """
+    Forget the upload that opened a pull request (e.g., after the pull request was closed), so that
+    resubmitting the same data dictionary opens a new pull request, later uploads to the dataset are not rejected as conflicting,
+    and follow-up uploads of the contributor are not committed onto its branch.
+    Returns whether the pull request was opened by a remembered upload.
+    """
+    forgotten = False
+    if (
+        dedup_key := shared_cache.get(
+            _pull_request_upload_key(pull_request_url)
+        )
+    ) is not None:
+        shared_cache.delete(dedup_key)
+        shared_cache.delete(_pull_request_upload_key(pull_request_url))
+        forgotten = True
+    if _forget_contributor_pull_request(pull_request_url):
+        forgotten = True
+    # Pull request URLs look like https://github.com/<org>/<dataset>/pull/<number>
+    dataset_id = pull_request_url.split("/")[-3]
+    state = get_dataset_state(dataset_id)
+    if state is not None and state.pull_request_url == pull_request_url:
+        state.pull_request_opened_at = None
+        set_dataset_state(dataset_id, state)
+        forgotten = True
+    return forgotten
+
+
+def _contributor_pull_requests_key(dataset_id: str) -> str:
+    return f"contributor-pull-requests:{dataset_id}"
+
+
+def _contributor_identity(contributor: Contributor) -> str:
+    """
+    Return what identifies a contributor's remembered pull request: their GitHub username and a hash of their email address,
+    since the username alone is self-reported and anyone could upload with someone else's.
+    """
+    email_digest = hashlib.sha256(
+        contributor.email.strip().lower().encode()
+    ).hexdigest()[:32]
+    return f"{contributor.gh_username.lower()}:{email_digest}"
+
+
+def find_open_pull_request(
+    repo: Repository, contributor: Contributor, head_sha: str
+) -> dict | None:
+    """
+    Return the pull request last opened by an upload of a contributor (with the same GitHub username and email address)
+    to a dataset (see remember_pull_request), if it is still open and based on the given head commit of the default branch,
+    so that a follow-up upload can be committed onto its branch. Otherwise, the pull request is forgotten and None is returned.
+
+    Raises GitHubUnavailableError if GitHub fails to return the pull request.
+    """
+    key = _contributor_pull_requests_key(repo.name)
+    identity = _contributor_identity(contributor)
+    pull_requests = shared_cache.get(key) or {}
+    pull_request = pull_requests.get(identity)
+    if pull_request is None:
+        return None
+    if pull_request["base_sha"] != head_sha:
+        # The pull request would no longer show only the contributor's changes against the default branch
+        result = "base_moved"
+    else:
+        try:
+            is_open = repo.get_pull(pull_request["number"]).state == "open"
+        except GithubException as e:
+            if e.status >= 500:
+                raise _github_unavailable_error(e) from e
+            # The pull request was deleted or is no longer accessible, so it is treated as closed
+            is_open = False
+        if is_open:
+            return pull_request
+        result = "closed"
+    FOLLOW_UP_UPLOADS.inc(result=result)
+    del pull_requests[identity]
+    shared_cache.set(
+        key, pull_requests, ttl=utils.CONTRIBUTOR_PULL_REQUEST_TTL
+    )
+    return None
+
+
+def remember_pull_request(
+    dataset_id: str, contributor: Contributor, pull_request: dict
+) -> None:
+    """Remember the pull request (and the state of its branch) last opened or updated by an upload of a contributor to a dataset."""
+    key = _contributor_pull_requests_key(dataset_id)
+    pull_requests = shared_cache.get(key) or {}
+    pull_requests[_contributor_identity(contributor)] = pull_request
+    shared_cache.set(
+        key, pull_requests, ttl=utils.CONTRIBUTOR_PULL_REQUEST_TTL
+    )
+
+
+def _forget_contributor_pull_request(pull_request_url: str) -> bool:
+    # Pull request URLs look like https://github.com/<org>/<dataset>/pull/<number>
+    key = _contributor_pull_requests_key(pull_request_url.split("/")[-3])
+    pull_requests = shared_cache.get(key) or {}
+    remaining = {
+        identity: pull_request
+        for identity, pull_request in pull_requests.items()
+        if pull_request["url"] != pull_request_url
+    }
+    if remaining == pull_requests:
+        return False
+    shared_cache.set(key, remaining, ttl=utils.CONTRIBUTOR_PULL_REQUEST_TTL)
+    return True
+
+
+def publish_dataset_index_change() -> None:
+    """
+    Tell every worker that the organization's repositories changed (e.g., one was created or renamed),
+    so that their dataset index is refreshed on its next use (see apply_dataset_index_changes).
+    The index of this worker is expected to have been updated directly.
+    """
+    changed_at = time.time()
+    dataset_index.changed_at = changed_at
+    shared_cache.set(DATASET_INDEX_CHANGED_KEY, changed_at)
+
+
+def apply_dataset_index_changes() -> None:
+    """Invalidate the dataset index of this worker if another worker was told about a change to the repositories since."""
+    changed_at = shared_cache.get(DATASET_INDEX_CHANGED_KEY)
+    if changed_at is not None and changed_at > dataset_index.changed_at:
+        dataset_index.invalidate(changed_at)
+
+
+def sync_mirror() -> SyncSummary | None:
+    """
+    Sync the local mirror of every dataset's participants.json with GitHub,
+    unless another process is already syncing it (in which case None is returned).
+    """
+    g = github_client.get_installation_github(DATASETS_ORG)
+    return mirror.sync_exclusively(
+        g, DATASETS_ORG, max_workers=utils.MIRROR_SYNC_CONCURRENCY
+    )
+
+
+def sweep_branches(
+    dry_run: bool = False,
+    batch_size: int | None = None,
+    batch_interval: float | None = None,
+) -> SweepSummary | None:
+    """
+    Delete the orphaned bot branches of every dataset repository (or only list them, in a dry run),
+    unless another process is already sweeping them (in which case None is returned).
+    """
+    g = github_client.get_installation_github(DATASETS_ORG)
+    return branch_reaper.sweep_exclusively(
+        g,
+        dataset_index,
+        dry_run=dry_run,
+        batch_size=batch_size or utils.BRANCH_SWEEP_BATCH_SIZE,
+        batch_interval=(
+            utils.BRANCH_SWEEP_BATCH_INTERVAL
+            if batch_interval is None
+            else batch_interval
+        ),
+    )
+
+
+def get_default_branch_head(repo: Repository, repo_metadata: dict) -> str:
+    """
+    Return the SHA of the head commit of a dataset's default branch (as listed in the dataset index).
+
+    Raises UploadError if the repository no longer exists (e.g., it was renamed or deleted since the index was refreshed),
+    in which case it is also removed from the index of every worker.
+    """
+    try:
+        return repo.get_branch(repo_metadata["default_branch"]).commit.sha
+    except UnknownObjectException as e:
+        dataset_index.remove(repo.name)
+        publish_dataset_index_change()
+        raise UploadError(UNKNOWN_DATASET_MESSAGE) from e
+
+
+def get_participants_file(repo: Repository, head_sha: str) -> ParticipantsFile:
+    """
+    Get the participants.json file of a dataset at the given head commit of its default branch.
+    If enabled, the file is read from the local mirror when the mirror is up to date with that commit,
+    saving a request to GitHub.
+
+    Raises UnknownObjectException if the file does not exist.
+    """
+    if utils.READ_FROM_MIRROR:
+        if (mirrored_file := mirror.read(repo.name, head_sha)) is not None:
+            return mirrored_file
+    return get_dataset_file(repo, head_sha, PARTICIPANTS_FILE)
+
+
+def get_dataset_file(
+    repo: Repository, head_sha: str, path: str
+) -> ParticipantsFile:
+    """
+    Get a file of a dataset at the given head commit of its default branch from GitHub.
+
+    Raises UnknownObjectException if the file does not exist.
+    """
+    current_file = repo.get_contents(path, ref=head_sha)
+    if current_file.size <= CONTENTS_API_MAX_SIZE:
+        content = base64.b64decode(current_file.content)
+    else:
+        # The contents API does not include the contents of larger files, so fetch them as a raw blob instead
+        content = github_client.get_blob_content(
+            DATASETS_ORG, repo.full_name, current_file.sha
+        )
+    return ParticipantsFile(
+        content=content, sha=current_file.sha, path=current_file.path
+    )
+
+
+def read_dataset_state(
+    repo: Repository, head_sha: str, remember: bool
+) -> DatasetState:
+    """
+    Return the state of a dataset at the given head commit of its default branch.
+    If the default branch has not moved since the previous upload read it, that upload's state (incl. its participants.json)
+    is reused, otherwise participants.json is read again (and, if remember is True, kept for the next upload).
+    """
+    state = get_dataset_state(repo.name)
+    if state is not None and state.head_sha == head_sha:
+        return state
+    # Get participants.json contents if the file exists
+    try:
+        current_file = get_participants_file(repo, head_sha)
+    except UnknownObjectException:
+        current_file = None
+    state = DatasetState(head_sha=head_sha, participants_file=current_file)
+    if remember:
+        set_dataset_state(repo.name, state)
+    return state
+
+
+def read_dataset_file(
+    repo: Repository, state: DatasetState, path: str
+) -> ParticipantsFile | None:
+    """
+    Return a data dictionary file of a dataset at the head commit of a dataset state (None if the file does not exist).
+    Files other than participants.json are read on first use and kept in the state, like participants.json.
+    """
+    if path == PARTICIPANTS_FILE:
+        return state.participants_file
+    if path not in state.other_files:
+        try:
+            state.other_files[path] = get_dataset_file(
+                repo, state.head_sha, path
+            )
+        except UnknownObjectException:
+            state.other_files[path] = None
+    return state.other_files[path]
+
+
+def _current_dictionary_key(dataset_id: str) -> str:
+    return f"dictionary:{dataset_id}"
+
+
+def forget_current_data_dictionary(dataset_id: str) -> None:
+    """Forget the cached current participants.json of a dataset (e.g., after a push changed it)."""
+    shared_cache.delete(_current_dictionary_key(dataset_id))
+
+
+def _cached_dictionary_file(value: dict) -> ParticipantsFile | None:
+    if value["sha"] is None:
+        return None
+    return ParticipantsFile(
+        content=base64.b64decode(value["content"]), sha=value["sha"]
+    )
+
+
+def get_current_data_dictionary(dataset_id: str) -> ParticipantsFile | None:
+    """
+    Return the participants.json file on the default branch of a dataset (None if the file does not exist).
+
+    The file is cached for NB_UPLOADER_API_DICTIONARY_CACHE_TTL seconds, after which it is revalidated
+    with a conditional request, so an unchanged file is not downloaded again (and the request does not count
+    against the rate limit of the GitHub App).
+
+    Raises UploadError if the dataset does not exist or GitHub refuses the request,
+    and GitHubUnavailableError if GitHub fails to complete it.
+
+    NOTE: This function makes blocking calls to the GitHub API, so should be run in a worker thread.
+    """
+    key = _current_dictionary_key(dataset_id)
+    entry = shared_cache.get_entry(key)
+    if entry is not None and entry.is_fresh:
+        DICTIONARY_CACHE_LOOKUPS.inc(result="fresh")
+        return _cached_dictionary_file(entry.value)
+
+    g = github_client.get_installation_github(DATASETS_ORG)
+    if dataset_index.get(g, dataset_id) is None:
+        raise UploadError(UNKNOWN_DATASET_MESSAGE)
+    # Without a ref, the contents API reads the default branch
+    status, response_headers, body = g.requester.requestJson(
+        "GET",
+        f"/repos/{DATASETS_ORG}/{dataset_id}/contents/{PARTICIPANTS_FILE}",
+        headers={"If-None-Match": entry.etag} if entry is not None else {},
+    )
+    if status == 304:
+        DICTIONARY_CACHE_LOOKUPS.inc(result="not_modified")
+        shared_cache.revalidated(key, ttl=utils.DICTIONARY_CACHE_TTL)
+        return _cached_dictionary_file(entry.value)
+    DICTIONARY_CACHE_LOOKUPS.inc(result="modified")
+    if status == 404:
+        current_file = None
+        value = {"sha": None, "content": None}
+    elif status == 200:
+        metadata = orjson.loads(body)
+        if metadata["size"] <= CONTENTS_API_MAX_SIZE:
+            content = base64.b64decode(metadata["content"])
+        else:
+            content = github_client.get_blob_content(
+                DATASETS_ORG, f"{DATASETS_ORG}/{dataset_id}", metadata["sha"]
+            )
+        current_file = ParticipantsFile(content=content, sha=metadata["sha"])
+        value = {
+            "sha": current_file.sha,
+            "content": base64.b64encode(content).decode(),
+        }
+    else:
+        try:
+            data = orjson.loads(body or "{}")
+        except orjson.JSONDecodeError:
+            data = {}
+        e = GithubException(status, data, response_headers)
+        if status >= 500:
+            raise _github_unavailable_error(e)
+        raise UploadError(
+            f"Something went wrong when reading the {PARTICIPANTS_FILE} file of {dataset_id}. {status}: {data.get('message')}"
+        )
+    shared_cache.set(
+        key,
+        value,
+        ttl=utils.DICTIONARY_CACHE_TTL,
+        etag=response_headers.get("etag"),
+    )
+    return current_file
+
+
+def describe_data_dictionary(
+    current_file: ParticipantsFile, formatting: bool, validation: bool
+) -> DataDictionaryDetails:
+    """
+    Return the contents of a data dictionary file with (if requested) the formatting style that uploads are formatted to match,
+    and the result of validating it (cached by blob SHA, and shared with the audit).
+    """
+    details = DataDictionaryDetails(
+        sha=current_file.sha,
+        content=current_file.content.decode("utf-8", errors="replace"),
+    )
+    if formatting:
+        sample = utils.get_formatting_sample(current_file.content)
+        try:
+            indent_char, indent_level = utils.get_indentation(sample)
+        except ValueError:
+            pass
+        else:
+            newline_char, multiline = utils.get_newline_info(sample)
+            details.formatting = DataDictionaryFormatting(
+                indent_char=indent_char,
+                indent_level=indent_level,
+                newline_char=newline_char,
+                multiline=multiline,
+            )
+    if validation:
+        details.validation = DataDictionaryValidation(
+            **audit.get_validation_result(
+                current_file.content, current_file.sha
+            )
+        )
+    return details
+
+
+@dataclass
+class PreparedFile:
+    """An uploaded data dictionary formatted to match the existing file of a dataset, ready to be committed."""
+
+    path: str
+    content: str
+    commit_body: str
+    change_type: ChangeType
+    warnings: list[str]
+
+
+def prepare_data_dictionary_file(
+    uploaded_dict: dict,
+    current_file: ParticipantsFile | None,
+    validation_warnings: list[str],
+    path: str = PARTICIPANTS_FILE,
+) -> PreparedFile:
+    """
+    Format an (already validated) uploaded data dictionary to match the formatting of the existing file at path
+    (participants.json by default), if any, and classify how it changes the existing file.
+
+    Raises UploadError if the formatting of the existing file cannot be matched or nothing would change.
+    """
+    upload_warnings = []
+    file_exists = current_file is not None
+    if file_exists:
+        # Parse the raw bytes directly, and only decode the part of the file needed to detect its formatting
+        current_content_dict = utils.load_json_bytes(current_file.content)
+        current_formatting_sample = utils.get_formatting_sample(
+            current_file.content
+        )
+    else:
+        upload_warnings.append(
+            f"No existing {path} file found in the repository. A new file will be created."
+        )
+
+    upload_warnings.extend(validation_warnings)
+
+    if file_exists:
+        commit_body = f"Update {path}"
+        change_type = "annotations_only"
+
+        if not utils.only_annotation_changes(
+            current_content_dict, uploaded_dict
+        ):
+            upload_warnings.append(
+                "The uploaded data dictionary may contain changes that are not related to Neurobagel annotations."
+            )
+            commit_body += (
+                "\n- includes changes unrelated to Neurobagel annotations"
+            )
+            change_type = "includes_non_annotation_changes"
+        # TODO: See if we actually need this check - it seems redundant with a subsequent check which compares
+        # the actual existing and uploaded JSON contents after having matched indentation (new_content_json vs. current_file.content)
+        #
+        # Compare dictionaries directly to check for identical contents (ignoring formatting and item order)
+        if current_content_dict == uploaded_dict:
+            upload_warnings.append(
+                "The (unformatted) dictionary contents of the uploaded JSON file are the same as the existing JSON file."
+            )
+            change_type = "formatting_only"
+
+        # Match indentation
+        try:
+            current_indent_char, current_indent_level = utils.get_indentation(
+                current_formatting_sample
+            )
+            current_newline_char, is_multiline = utils.get_newline_info(
+                current_formatting_sample
+            )
+            new_content_json = utils.dict_to_formatted_json(
+                data_dict=uploaded_dict,
+                indent_char=current_indent_char,
+                indent_num=current_indent_level,
+                newline_char=current_newline_char,
+                multiline=is_multiline,
+            )
+        except ValueError as e:
+            raise UploadError(str(e)) from e
+
+        # NOTE: Comparing base64 strings doesn't seem to be sufficient for detecting changes. Might be because of differences in encoding?
+        # So, we'll compare the JSON strings instead (we do this instead of comparing the dictionaries directly to be able to detect changes in indentation, etc.).
+        if new_content_json.encode("utf-8") == current_file.content:
+            raise UploadError(
+                "The content selected for upload is the same as in the target file."
+            )
+    else:
+        commit_body = f"Add {path}"
+        change_type = "new_file"
+        new_content_json = json.dumps(uploaded_dict, indent=4)
+
+    return PreparedFile(
+        path=path,
+        content=new_content_json,
+        commit_body=commit_body,
+        change_type=change_type,
+        warnings=upload_warnings,
+    )
+
+
+def preview_data_dictionary(
+    dataset_id: str,
+    uploaded_dict: dict,
+    preview_key: str,
+    validation_warnings: list[str],
+) -> UploadPreview:
+    """
+    Return what the pull request for an (already validated) uploaded data dictionary would contain, without any writes to GitHub:
+    the participants.json file as it would be committed, a unified diff against the existing file, and the upload warnings.
+
+    Previews are cached by preview_key (identifying the dataset and uploaded file) together with the head commit of the
+    default branch they were made against, so a repeat preview only checks that the default branch has not moved.
+
+    NOTE: This function makes blocking calls to the GitHub API, so should be run in a worker thread.
+    """
+    g = github_client.get_installation_github(DATASETS_ORG)
+    repo_metadata = dataset_index.get(g, dataset_id)
+    if repo_metadata is None:
+        raise UploadError(UNKNOWN_DATASET_MESSAGE)
+    repo = g.withLazy(True).get_repo(f"{DATASETS_ORG}/{dataset_id}")
+    head_sha = get_default_branch_head(repo, repo_metadata)
+
+    cached = shared_cache.get(preview_key)
+    if cached is not None and cached["head_sha"] == head_sha:
+        PREVIEW_CACHE_LOOKUPS.inc(result="hit")
+        return UploadPreview(**cached["preview"])
+    PREVIEW_CACHE_LOOKUPS.inc(result="miss")
+
+    # Previews do not hold the dataset lock, so they must not replace the state an upload may be using
+    current_file = read_dataset_state(
+        repo, head_sha, remember=False
+    ).participants_file
+    prepared = prepare_data_dictionary_file(
+        uploaded_dict, current_file, validation_warnings
+    )
+    current_content = (
+        current_file.content.decode("utf-8", errors="replace")
+        if current_file is not None
+        else ""
+    )
+    diff = "".join(
+        difflib.unified_diff(
+            current_content.splitlines(keepends=True),
+            prepared.content.splitlines(keepends=True),
+            fromfile=(
+                f"a/{PARTICIPANTS_FILE}"
+                if current_file is not None
+                else "/dev/null"
+            ),
+            tofile=f"b/{PARTICIPANTS_FILE}",
+        )
+    )
+    preview = UploadPreview(
+        change_type=prepared.change_type,
+        content=prepared.content,
+        diff=diff,
+        warnings=prepared.warnings,
+    )
+    shared_cache.set(
+        preview_key,
+        {"head_sha": head_sha, "preview": preview.model_dump()},
+        ttl=utils.PREVIEW_CACHE_TTL,
+    )
+    return preview
+
+
+def upload_data_dictionary(
+    dataset_id: str,
+    uploaded_dict: dict,
+    contributor: Contributor,
+    dedup_key: str,
+    validation_warnings: list[str],
+) -> SuccessfulUpload | SuccessfulUploadWithWarnings:
+    """
+    Open a pull request adding or updating participants.json in a dataset repository with an (already validated)
+    uploaded data dictionary, matching the formatting of any existing file.
+
+    Uploads to the same dataset are handled one at a time (uploads to different datasets are not affected).
+    An upload that had to wait reuses the state of the dataset read by the previous upload if the default branch
+    has not moved since, and is rejected if the previous upload opened a pull request from the same base in the meantime,
+    since both pull requests would change participants.json and so conflict.
+
+    A follow-up upload of a contributor with a GitHub username is instead committed onto the branch of their
+    open pull request for the dataset, as long as the default branch has not moved since it was opened (see find_open_pull_request).
+
+    NOTE: This function makes blocking calls to the GitHub API, so should be run in a worker thread.
+    """
+    return upload_data_dictionaries(
+        dataset_id=dataset_id,
+        uploaded_files=[
+            UploadedFile(
+                path=PARTICIPANTS_FILE,
+                data_dict=uploaded_dict,
+                validation_warnings=validation_warnings,
+            )
+        ],
+        contributor=contributor,
+        dedup_key=dedup_key,
+    )
+
+
+def upload_data_dictionaries(
+    dataset_id: str,
+    uploaded_files: list[UploadedFile],
+    contributor: Contributor,
+    dedup_key: str,
+) -> SuccessfulUpload | SuccessfulUploadWithWarnings:
+    """
+    Open a single pull request adding or updating one or more data dictionary files (e.g., participants.json
+    and the data dictionaries of phenotype files) in a dataset repository, matching the formatting of each existing file.
+    Several files are committed together in a single commit (see upload_data_dictionary for how uploads are serialized).
+
+    NOTE: This function makes blocking calls to the GitHub API, so should be run in a worker thread.
+    """
+    # Wall-clock time, since the upload that opened a pull request may have run in another worker process
+    requested_at = time.time()
+    try:
+        with dataset_locks.hold(
+            dataset_id, timeout=utils.DATASET_LOCK_TIMEOUT
+        ):
+            return _upload_data_dictionaries(
+                dataset_id=dataset_id,
+                uploaded_files=uploaded_files,
+                contributor=contributor,
+                dedup_key=dedup_key,
+                requested_at=requested_at,
+            )
+    except LockTimeoutError as e:
+        raise UploadConflictError(
+            "Another upload to this dataset is still in progress. Please try again in a few moments."
+        ) from e
+
+
+def combine_commit_bodies(prepared_files: list[PreparedFile]) -> str:
+    """Combine the commit bodies of several prepared files into one, listing the change to each file."""
+    if len(prepared_files) == 1:
+        return prepared_files[0].commit_body
+    lines = [f"Update {len(prepared_files)} data dictionaries"]
+    for prepared in prepared_files:
+        first_line, *details = prepared.commit_body.splitlines()
+        lines.append(f"- {first_line}")
+        lines.extend(f"  {detail}" for detail in details)
+    return "\n".join(lines)
+
+
+def _create_commit(
+    repo: Repository,
+    head_sha: str,
+    prepared_files: list[PreparedFile],
+    commit_message: str,
+) -> str:
+    """
+    Create a commit of several prepared files on top of the given head commit with the Git database API,
+    without updating any branch, and return its SHA.
+    Unlike committing each file with the contents API, this takes the same number of writes for any number of files.
+    """
+    head_commit = repo.get_git_commit(head_sha)
+    tree = repo.create_git_tree(
+        [
+            InputGitTreeElement(
+                prepared.path, "100644", "blob", content=prepared.content
+            )
+            for prepared in prepared_files
+        ],
+        base_tree=head_commit.tree,
+    )
+    return repo.create_git_commit(commit_message, tree, [head_commit]).sha
+
+
+def _github_unavailable_error(
+    e: GithubException,
+) -> github_client.GitHubUnavailableError:
+    # The failure is on GitHub's side (and was already retried if safe), so the upload may succeed later
+    return github_client.GitHubUnavailableError(
+        f"GitHub could not complete the request ({e.status}). Please try again later.",
+        retry_after=math.ceil(github_client.breaker.reset_timeout),
+    )
+
+
+def _check_for_conflicting_upload(
+    state: DatasetState, requested_at: float
+) -> None:
+    """Raise UploadConflictError if another upload opened a pull request from the same base while this upload was waiting."""
+    if (
+        state.pull_request_opened_at is not None
+        and state.pull_request_opened_at > requested_at
+    ):
+        raise UploadConflictError(
+            "Another data dictionary was uploaded to this dataset while this upload was waiting, "
+            f"and is awaiting review in {state.pull_request_url}. "
+            "Since both would change the same participants.json file, no pull request was opened for this upload. "
+            "Please upload your changes again once that pull request has been reviewed."
+        )
+
+
+def _comment_on_pull_request(
+    repo: Repository, pull_request: dict, body: str
+) -> None:
+    """
+    Comment on a pull request (e.g., with the changes summary of a follow-up upload, which reviewers would otherwise not see).
+    The upload was already committed, so a failure to comment is only logged.
+    """
+    try:
+        repo.get_issue(pull_request["number"]).create_comment(body)
+    except (GithubException, github_client.GitHubUnavailableError) as e:
+        logger.warning(f"Could not comment on {pull_request['url']}: {e}")
+
+
+def _push_to_pull_request(
+    repo: Repository,
+    pull_request: dict,
+    prepared_files: list[PreparedFile],
+    commit_message: str,
+) -> None:
+    """
+    Commit prepared files onto the branch of an open pull request, updating the state of its branch in place.
+    The commit is made on top of the branch as last committed to and the branch is only fast-forwarded to it
+    (even for a single file, which the contents API would commit onto whatever the branch points to),
+    so this raises GithubException if the branch changed since.
+    """
+    branch_sha = _create_commit(
+        repo, pull_request["head_sha"], prepared_files, commit_message
+    )
+    repo.requester.requestJsonAndCheck(
+        "PATCH",
+        f"{repo.url}/git/refs/heads/{pull_request['branch']}",
+        input={"sha": branch_sha, "force": False},
+    )
+    pull_request["head_sha"] = branch_sha
+    pull_request["files"].update(
+        (prepared.path, utils.git_blob_sha(prepared.content.encode("utf-8")))
+        for prepared in prepared_files
+    )
+
+
+def _open_pull_request(
+    repo: Repository,
+    repo_metadata: dict,
+    head_sha: str,
+    prepared_files: list[PreparedFile],
+    current_files: dict[str, ParticipantsFile | None],
+    commit_body: str,
+    commit_message: str,
+    contributor: Contributor,
+) -> dict:
+    """
+    Commit prepared files to a new branch and open a pull request from it,
+    returning the pull request and the state of its branch (see remember_pull_request).
+    """
+    branch_name = utils.create_random_branch_name(contributor.gh_username)
+    branch_created = False
+    try:
+        if len(prepared_files) == 1:
+            # A single file is committed with the contents API once the branch exists
+            branch_sha = head_sha
+        else:
+            # Several files are committed together before the branch is created at their commit
+            branch_sha = _create_commit(
+                repo, head_sha, prepared_files, commit_message
+            )
+        repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=branch_sha)
+        branch_created = True
+        branch_reaper.register_new_branch(repo.full_name, branch_name)
+
+        if len(prepared_files) == 1:
+            (prepared,) = prepared_files
+            if (current_file := current_files[prepared.path]) is not None:
+                result = repo.update_file(
+                    current_file.path,
+                    commit_message,
+                    prepared.content,
+                    current_file.sha,
+                    branch=branch_name,
+                )
+            else:
+                result = repo.create_file(
+                    prepared.path,
+                    commit_message,
+                    prepared.content,
+                    branch=branch_name,
+                )
+            branch_sha = result["commit"].sha
+
+        pr_body = utils.create_pull_request_body(
+            contributor=contributor, commit_body=commit_body
+        )
+        pr = repo.create_pull(
+            base=repo_metadata["default_branch"],
+            head=branch_name,
+            # Get the first line of the commit body as the PR title
+            title=commit_body.splitlines()[0],
+            body=pr_body,
+        )
+    except github_client.GitHubUnavailableError:
+        # The branch is of no use without a pull request
+        if branch_created:
+            branch_reaper.schedule_deletion(
+                DATASETS_ORG, repo.full_name, branch_name
+            )
+        raise
+    except GithubException as e:
+        if branch_created:
+            branch_reaper.schedule_deletion(
+                DATASETS_ORG, repo.full_name, branch_name
+            )
+        if e.status >= 500:
+            raise _github_unavailable_error(e) from e
+        paths = ", ".join(prepared.path for prepared in prepared_files)
+        raise UploadError(
+            f"Something went wrong when updating or creating {paths} in {repo_metadata['html_url']}. {e.status}: {e.data['message']}"
+        ) from e
+
+    return {
+        "url": pr.html_url,
+        "number": pr.number,
+        "branch": branch_name,
+        "base_sha": head_sha,
+        "head_sha": branch_sha,
+        "files": {
+            prepared.path: utils.git_blob_sha(prepared.content.encode("utf-8"))
+            for prepared in prepared_files
+        },
+    }
+
+
+def _upload_data_dictionaries(
+    dataset_id: str,
+    uploaded_files: list[UploadedFile],
+    contributor: Contributor,
+    dedup_key: str,
+    requested_at: float,
+) -> SuccessfulUpload | SuccessfulUploadWithWarnings:
+    # An identical upload may have completed while this one was waiting
+    if (existing_pr_url := shared_cache.get(dedup_key)) is not None:
+        return SuccessfulUploadWithWarnings(
+            pull_request_url=existing_pr_url,
+            warnings=[DUPLICATE_UPLOAD_WARNING],
+        )
+
+    # Get a GitHub instance authenticated as the Neurobagel Bot app installation for the OpenNeuroDatasets-JSONLD organization
+    g = github_client.get_installation_github(DATASETS_ORG)
+
+    # Check if the dataset exists
+    # NOTE: Renamed repositories are not listed under their old names. With webhooks enabled, renames are applied
+    # to the index as they happen (see app/api/webhooks.py), otherwise with the next refresh
+    repo_metadata = dataset_index.get(g, dataset_id)
+    if repo_metadata is None:
+        raise UploadError(UNKNOWN_DATASET_MESSAGE)
+
+    # The repository is known to exist, so we can skip fetching it again
+    repo = g.withLazy(True).get_repo(f"{DATASETS_ORG}/{dataset_id}")
+    head_sha = get_default_branch_head(repo, repo_metadata)
+
+    state = read_dataset_state(repo, head_sha, remember=True)
+    # A contributor's follow-up upload is committed onto their open pull request for the dataset, if there is one
+    # (which does not conflict with the pull request, even if it was opened by their previous upload while this one was waiting)
+    pull_request = None
+    if contributor.gh_username and utils.CONTRIBUTOR_PULL_REQUEST_TTL > 0:
+        pull_request = find_open_pull_request(repo, contributor, head_sha)
+    if pull_request is None:
+        _check_for_conflicting_upload(state, requested_at)
+    current_files = {
+        uploaded.path: read_dataset_file(repo, state, uploaded.path)
+        for uploaded in uploaded_files
+    }
+    prepared_files = []
+    upload_warnings = []
+    for uploaded in uploaded_files:
+        try:
+            prepared = prepare_data_dictionary_file(
+                uploaded.data_dict,
+                current_files[uploaded.path],
+                uploaded.validation_warnings,
+                path=uploaded.path,
+            )
+        except UploadError as e:
+            if len(uploaded_files) == 1:
+                raise
+            raise UploadError(f"{uploaded.path}: {e}") from e
+        prepared_files.append(prepared)
+        # With several files, say which file each warning is about
+        upload_warnings.extend(
+            prepared.warnings
+            if len(uploaded_files) == 1
+            else [
+                f"{uploaded.path}: {warning}" for warning in prepared.warnings
+            ]
+        )
+    commit_body = combine_commit_bodies(prepared_files)
+
+    commit_message = utils.create_commit_message(
+        contributor=contributor, commit_body=commit_body
+    )
+    if pull_request is not None:
+        try:
+            _push_to_pull_request(
+                repo, pull_request, prepared_files, commit_message
+            )
+        except GithubException as e:
+            if e.status >= 500:
+                raise _github_unavailable_error(e) from e
+            # The branch was changed (e.g., by a reviewer) or deleted since the last upload committed to it
+            FOLLOW_UP_UPLOADS.inc(result="branch_changed")
+            pull_request = None
+            _check_for_conflicting_upload(state, requested_at)
+        else:
+            FOLLOW_UP_UPLOADS.inc(result="pushed")
+            upload_warnings.append(FOLLOW_UP_UPLOAD_WARNING)
+            _comment_on_pull_request(
+                repo,
+                pull_request,
+                utils.create_follow_up_comment(
+                    contributor=contributor, commit_body=commit_body
+                ),
+            )
+            # An earlier version resubmitted now is no longer what the pull request contains
+            if (
+                previous_dedup_key := shared_cache.get(
+                    _pull_request_upload_key(pull_request["url"])
+                )
+            ) is not None:
+                shared_cache.delete(previous_dedup_key)
+    if pull_request is None:
+        pull_request = _open_pull_request(
+            repo,
+            repo_metadata,
+            head_sha,
+            prepared_files,
+            current_files,
+            commit_body,
+            commit_message,
+            contributor,
+        )
+    pull_request_url = pull_request["url"]
+    if contributor.gh_username and utils.CONTRIBUTOR_PULL_REQUEST_TTL > 0:
+        remember_pull_request(dataset_id, contributor, pull_request)
+
+    shared_cache.set(dedup_key, pull_request_url, ttl=UPLOAD_DEDUP_TTL)
+    shared_cache.set(
+        _pull_request_upload_key(pull_request_url),
+        dedup_key,
+        ttl=UPLOAD_DEDUP_TTL,
+    )
+    state.pull_request_url = pull_request_url
+    state.pull_request_opened_at = time.time()
+    # Including any other files read by this upload
+    set_dataset_state(dataset_id, state)
+
+    if upload_warnings:
+        return SuccessfulUploadWithWarnings(
+            pull_request_url=pull_request_url, warnings=upload_warnings
+        )
+    return SuccessfulUpload(pull_request_url=pull_request_url)
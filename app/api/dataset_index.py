@@ -0,0 +1,200 @@
+"""
+An in-memory index of the repositories (datasets) in an organization, used to look up a dataset's metadata
+and to reject unknown dataset IDs without making requests to GitHub.
+
+The index is built from the organization's repository list, which is refreshed with conditional requests:
+each page of the list is requested with the ETag of its last response, and unchanged pages
+are answered with a 304 Not Modified (which does not count against the GitHub API rate limit).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+from github import Github
+from github.GithubException import GithubException
+
+from . import metrics
+
+DATASET_LOOKUPS = metrics.Counter(
+    "nb_uploader_dataset_index_lookups_total",
+    "Number of dataset ID lookups in the known-dataset index, by result",
+    labelled=True,
+)
+DATASET_INDEX_SIZE = metrics.Gauge(
+    "nb_uploader_dataset_index_size",
+    "Number of datasets in the known-dataset index",
+)
+
+
+class DatasetIndex:
+    """
+    Metadata (default branch, URL) of every repository in an organization, keyed by repository name.
+
+    - The index is refreshed when it is older than refresh_interval seconds.
+    - A lookup of a name that is not in the index triggers a refresh (at most once every min_refresh_interval seconds),
+      in case the repository was created since the last refresh.
+    - Names that are still missing after a refresh are remembered as missing for missing_ttl seconds
+      (up to max_missing names, beyond which the oldest are forgotten).
+    """
+
+    def __init__(
+        self,
+        org: str,
+        refresh_interval: float,
+        min_refresh_interval: float,
+        missing_ttl: float,
+        max_missing: int = 10_000,
+        per_page: int = 100,
+    ):
+        self.org = org
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.missing_ttl = missing_ttl
+        self.max_missing = max_missing
+        self.per_page = per_page
+        self.datasets: dict[str, dict] = {}
+        self.refreshed_at = float("-inf")
+        # Time of the last change to the repositories this index was told about (see invalidate)
+        self.changed_at = float("-inf")
+        # Page URL -> (ETag, repositories listed on the page, URL of the next page)
+        self._pages: dict[str, tuple[str | None, list[dict], str | None]] = {}
+        # Name -> time after which the name is no longer known to be missing
+        self._missing: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._missing_lock = threading.Lock()
+
+    def is_known_missing(self, name: str) -> bool:
+        """Return whether a name was recently confirmed not to be a repository in the organization."""
+        expires_at = self._missing.get(name)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            self._missing.pop(name, None)
+            return False
+        DATASET_LOOKUPS.inc(result="known_missing")
+        return True
+
+    def _fetch_page(self, g: Github, url: str, parameters: dict | None):
+        etag, repos, next_url = self._pages.get(url, (None, [], None))
+        headers = {"If-None-Match": etag} if etag else {}
+        status, response_headers, body = g.requester.requestJson(
+            "GET", url, parameters=parameters, headers=headers
+        )
+        if status == 304:
+            return repos, next_url
+        if status != 200:
+            raise GithubException(
+                status, orjson.loads(body or "{}"), response_headers
+            )
+        repos = [
+            {
+                "name": repo["name"],
+                # Needed because some repos in OpenNeuroDatasets-JSONLD have "main" default, others have "master"
+                "default_branch": repo["default_branch"],
+                "html_url": repo["html_url"],
+                "pushed_at": repo.get("pushed_at"),
+            }
+            for repo in orjson.loads(body)
+        ]
+        next_url = None
+        for link in response_headers.get("link", "").split(","):
+            if 'rel="next"' in link:
+                next_url = link.split(";")[0].strip().strip("<>")
+        self._pages[url] = (response_headers.get("etag"), repos, next_url)
+        return repos, next_url
+
+    def refresh(self, g: Github, max_age: float = 0) -> None:
+        """
+        Refresh the index from the organization's repository list,
+        unless it was refreshed less than max_age seconds ago (e.g., by another thread).
+        """
+        with self._lock:
+            if time.monotonic() - self.refreshed_at < max_age:
+                return
+            datasets = {}
+            url = f"/orgs/{self.org}/repos"
+            parameters = {"per_page": self.per_page}
+            seen_pages = set()
+            while url is not None and url not in seen_pages:
+                seen_pages.add(url)
+                repos, url = self._fetch_page(g, url, parameters)
+                # The query parameters are part of the URLs of subsequent pages
+                parameters = None
+                datasets.update((repo["name"], repo) for repo in repos)
+            # Forget pages that are no longer part of the list
+            self._pages = {
+                page: self._pages[page]
+                for page in seen_pages
+                if page in self._pages
+            }
+            self.datasets = datasets
+            self.refreshed_at = time.monotonic()
+            DATASET_INDEX_SIZE.set(len(datasets))
+
+    def get(self, g: Github, name: str) -> dict | None:
+        """
+        Return the metadata of a repository in the organization, or None if there is no such repository.
+
+        NOTE: This may refresh the index, which makes blocking requests to GitHub.
+        """
+        if self.is_known_missing(name):
+            return None
+        self.refresh(g, max_age=self.refresh_interval)
+        if name not in self.datasets:
+            # The repository may have been created since the last refresh
+            self.refresh(g, max_age=self.min_refresh_interval)
+
+        if (metadata := self.datasets.get(name)) is not None:
+            DATASET_LOOKUPS.inc(result="found")
+            return metadata
+        with self._missing_lock:
+            self._missing[name] = time.monotonic() + self.missing_ttl
+            self._missing.move_to_end(name)
+            while len(self._missing) > self.max_missing:
+                self._missing.popitem(last=False)
+        DATASET_LOOKUPS.inc(result="missing")
+        return None
+
+    def upsert(self, metadata: dict) -> None:
+        """Add or update the metadata of a single repository (e.g., from a webhook event) without a refresh."""
+        with self._lock:
+            self.datasets = {
+                **self.datasets,
+                metadata["name"]: {
+                    **self.datasets.get(metadata["name"], {}),
+                    **metadata,
+                },
+            }
+            DATASET_INDEX_SIZE.set(len(self.datasets))
+        with self._missing_lock:
+            self._missing.pop(metadata["name"], None)
+
+    def remove(self, name: str) -> None:
+        """Remove a single repository (e.g., from a webhook event) without a refresh."""
+        with self._lock:
+            self.datasets = {
+                key: value
+                for key, value in self.datasets.items()
+                if key != name
+            }
+            DATASET_INDEX_SIZE.set(len(self.datasets))
+
+    def invalidate(self, changed_at: float) -> None:
+        """
+        Mark the index as out of date because of a change to the organization's repositories at the given (wall-clock) time,
+        so that the next lookup refreshes it, and forget which names were missing.
+        """
+        with self._lock:
+            self.refreshed_at = float("-inf")
+            self.changed_at = changed_at
+        with self._missing_lock:
+            self._missing.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.datasets = {}
+            self.refreshed_at = float("-inf")
+            self._pages = {}
+            self._missing.clear()
@@ -1,15 +1,50 @@
 # This file is adapted from https://github.com/neurobagel/bagel-cli/blob/main/bagel/utilities/pheno_utils.py
 # and contains only the functions needed for validation of a Neurobagel data dictionary itself.
 
+import hashlib
+import re
+import threading
 import warnings
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
 from typing import List, Tuple
 
 import jsonschema
+import orjson
 import pydantic
 
-from . import dictionary_models, mappings
+from . import dictionary_models, mappings, metrics
+from . import utility as utils
+from . import vocabulary
 
 DICTIONARY_SCHEMA = dictionary_models.DataDictionary.model_json_schema()
+# Created once, so that the schema itself is not re-checked on every validation (as by jsonschema.validate)
+DICTIONARY_VALIDATOR = jsonschema.validators.validator_for(DICTIONARY_SCHEMA)(
+    DICTIONARY_SCHEMA
+)
+
+# Created once, so that the validation schema of the models is not rebuilt on every validation
+DICTIONARY_ADAPTER = pydantic.TypeAdapter(dictionary_models.DataDictionary)
+# The names pydantic adds to error locations to say which member of a union (of columns or of annotations) failed
+UNION_MEMBER_NAMES = {
+    model.__name__
+    for model in (
+        dictionary_models.Column,
+        dictionary_models.ContinuousColumn,
+        dictionary_models.CategoricalColumn,
+        dictionary_models.CategoricalNeurobagel,
+        dictionary_models.ContinuousNeurobagel,
+        dictionary_models.IdentifierNeurobagel,
+        dictionary_models.CollectionNeurobagel,
+    )
+}
+
+VALIDATION_CACHE_LOOKUPS = metrics.Counter(
+    "nb_uploader_validation_cache_lookups_total",
+    "Number of data dictionary columns looked up in the validation cache, by result (hit or miss)",
+    labelled=True,
+)
 
 
 def get_columns_about(data_dict: dict, concept: str) -> list:
@@ -91,94 +126,418 @@ def get_mismatched_categorical_levels(data_dict: dict) -> list:
     return mismatched_cols
 
 
-def validate_data_dict(data_dict: dict) -> None:
-    try:
-        jsonschema.validate(data_dict, DICTIONARY_SCHEMA)
-    except jsonschema.ValidationError as e:
+# Keys that can be written in the dot notation of JSONPath
+JSON_PATH_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _format_json_path_element(element: str | int) -> str:
+    if isinstance(element, int):
+        return f"[{element}]"
+    if JSON_PATH_IDENTIFIER.fullmatch(element):
+        return f".{element}"
+    # Other keys (e.g., column names with spaces or dots) use the bracket notation
+    escaped = element.replace("\\", "\\\\").replace("'", "\\'")
+    return f"['{escaped}']"
+
+
+def format_json_path(path: tuple) -> str:
+    """
+    Format the path of an entry in a data dictionary as a JSONPath expression,
+    e.g. $.age.Annotations.Format or $['participant id'].Description
+    """
+    return "$" + "".join(
+        _format_json_path_element(element) for element in path
+    )
+
+
+@dataclass(frozen=True)
+class SchemaError:
+    """An entry of a data dictionary that does not match the data dictionary schema."""
+
+    # The keys (and list indices) leading to the entry, from the top of the data dictionary
+    path: tuple[str | int, ...]
+    message: str
+    # The error raised by the validation engine, kept to chain it to the error reported to the user
+    cause: Exception | None = field(default=None, compare=False)
+
+    @property
+    def column(self) -> str | None:
+        """The column with the error, or None if the error is with the entire document."""
+        return self.path[0] if self.path else None
+
+    @property
+    def entry(self) -> str | int:
+        return self.path[-1] if self.path else "Entire document"
+
+    @property
+    def json_path(self) -> str:
+        return format_json_path(self.path)
+
+
+class DataDictionarySchemaError(ValueError):
+    """
+    Raised when a data dictionary does not match the data dictionary schema,
+    with the schema errors of its invalid columns (up to NB_UPLOADER_API_VALIDATION_MAX_ERRORS), in column order.
+    """
+
+    def __init__(self, message: str, schema_errors: list[SchemaError]):
+        super().__init__(message)
+        self.schema_errors = schema_errors
+
+
+class ValidationEngine(ABC):
+    """Checks data dictionaries against the data dictionary schema (i.e., the models in dictionary_models)."""
+
+    name: str
+
+    @abstractmethod
+    def find_errors(self, data_dict) -> list[SchemaError]:
+        """
+        Return the most relevant schema error of each invalid column of a data dictionary, in column order,
+        or a single error for the entire document if it is not an object.
+        """
+
+
+class JSONSchemaEngine(ValidationEngine):
+    """Validates against the JSON schema generated from the models, reporting errors as jsonschema.validate would."""
+
+    name = "jsonschema"
+
+    def find_errors(self, data_dict) -> list[SchemaError]:
+        # Every error of a data dictionary object is the failure of one column to match any of the column models,
+        # so the best match within each of these errors is the error jsonschema.validate reports for the column
+        schema_errors = []
+        for error in DICTIONARY_VALIDATOR.iter_errors(data_dict):
+            best = jsonschema.exceptions.best_match([error])
+            schema_errors.append(
+                SchemaError(
+                    path=tuple(best.absolute_path),
+                    message=best.message,
+                    cause=best,
+                )
+            )
+        return schema_errors
+
+
+class PydanticEngine(ValidationEngine):
+    """
+    Validates with a pydantic TypeAdapter of the DataDictionary model, which is faster than jsonschema
+    since the validation is compiled once (in pydantic-core) instead of interpreting the schema on every call.
+
+    Pydantic reports every error of every member of a union, so for each invalid column,
+    the first error of the union member with the fewest errors (i.e., the closest match) is reported,
+    located by its path in the data dictionary and worded like the equivalent jsonschema error.
+    """
+
+    name = "pydantic"
+
+    def find_errors(self, data_dict) -> list[SchemaError]:
+        try:
+            DICTIONARY_ADAPTER.validate_python(data_dict)
+        except pydantic.ValidationError as e:
+            errors_by_column: dict[tuple, list] = {}
+            for error in e.errors(include_url=False):
+                path, members = self._split_location(data_dict, error["loc"])
+                errors_by_column.setdefault(path[:1], []).append(
+                    (members, path, error)
+                )
+            schema_errors = []
+            for column_errors in errors_by_column.values():
+                # Errors are reported in the order of the fields, so the first error of the closest match is reported
+                _, path, error = self._closest_match(column_errors)[0]
+                schema_errors.append(self._to_schema_error(path, error, e))
+            return schema_errors
+        return []
+
+    @classmethod
+    def _closest_match(cls, errors: list) -> list:
+        """
+        Return the errors of the union members with the fewest errors, in their original order,
+        where the errors of a member are its own errors plus those of its closest nested union member.
+        """
+        errors_by_member: dict[str, list] = {}
+        for members, path, error in errors:
+            if members:
+                errors_by_member.setdefault(members[0], []).append(
+                    (members[1:], path, error)
+                )
+        if not errors_by_member:
+            return errors
+        closest = min(
+            map(cls._closest_match, errors_by_member.values()), key=len
+        )
+        closest_ids = {id(error) for _, _, error in closest}
+        return [
+            item
+            for item in errors
+            if not item[0] or id(item[2]) in closest_ids
+        ]
+
+    @staticmethod
+    def _split_location(data_dict, loc: tuple) -> tuple[tuple, tuple]:
+        """
+        Split the location of a pydantic error into the path of the entry in the data dictionary
+        and the names of the union members that the error belongs to.
+        """
+        path, members = [], []
+        node = data_dict
+        for element in loc:
+            # Union member names follow a column name, or the Annotations key of a column
+            at_union = len(path) == 1 or path[1:] == ["Annotations"]
+            if (
+                at_union
+                and len(members) < len(path)
+                and element in (UNION_MEMBER_NAMES)
+            ):
+                members.append(element)
+            elif isinstance(node, dict) and element in node:
+                path.append(element)
+                node = node[element]
+            elif isinstance(node, list) and isinstance(element, int):
+                path.append(element)
+                node = node[element]
+            else:
+                # A missing key, which (as in jsonschema) is reported at the object that lacks it
+                break
+        return tuple(path), tuple(members)
+
+    @staticmethod
+    def _to_schema_error(
+        path: tuple, error: dict, cause: pydantic.ValidationError
+    ) -> SchemaError:
+        if error["type"] == "missing":
+            message = f"{error['loc'][-1]!r} is a required property"
+        elif error["type"] == "extra_forbidden":
+            message = f"Additional properties are not allowed ({path[-1]!r} was unexpected)"
+            path = path[:-1]
+        else:
+            message = error["msg"]
+        return SchemaError(path=path, message=message, cause=cause)
+
+
+VALIDATION_ENGINES = {
+    engine.name: engine for engine in (JSONSchemaEngine, PydanticEngine)
+}
+
+
+def create_validation_engine() -> ValidationEngine:
+    """Create the validation engine configured by environment variables."""
+    if utils.VALIDATION_ENGINE not in VALIDATION_ENGINES:
         raise ValueError(
+            f"Unsupported validation engine: {utils.VALIDATION_ENGINE!r}. "
+            "NB_UPLOADER_API_VALIDATION_ENGINE must be one of 'jsonschema' or 'pydantic'."
+        )
+    return VALIDATION_ENGINES[utils.VALIDATION_ENGINE]()
+
+
+validation_engine = create_validation_engine()
+
+
+@dataclass(frozen=True)
+class ColumnFacts:
+    """
+    The results of the checks of a single data dictionary column,
+    from which the checks of the whole data dictionary are derived.
+    """
+
+    schema_error: SchemaError | None = None
+    is_annotated: bool = False
+    about: str | None = None
+    lacks_bids_levels: bool = False
+    has_mismatched_levels: bool = False
+    unrecognized_terms: tuple[str, ...] = ()
+
+
+def check_column(column: str, content) -> ColumnFacts:
+    """Run every check of a data dictionary that only depends on a single column."""
+    column_dict = {column: content}
+    # Validating the column as a single-column data dictionary produces the same error (with the same path)
+    # as validating the whole data dictionary would for this column
+    if schema_errors := validation_engine.find_errors(column_dict):
+        return ColumnFacts(schema_error=schema_errors[0])
+    if "Annotations" not in content:
+        return ColumnFacts()
+    return ColumnFacts(
+        is_annotated=True,
+        about=content["Annotations"]["IsAbout"]["TermURL"],
+        lacks_bids_levels=not categorical_cols_have_bids_levels(column_dict),
+        has_mismatched_levels=bool(
+            get_mismatched_categorical_levels(column_dict)
+        ),
+        unrecognized_terms=tuple(
+            vocabulary.get_unrecognized_terms(column_dict)
+        ),
+    )
+
+
+class ColumnFactsCache:
+    """
+    A bounded cache of the checks of data dictionary columns, with least-recently-used columns evicted first.
+
+    Columns are keyed by a hash of their name and contents as serialized JSON (and of the validation engine),
+    so the same column is only checked again when either changes.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, ColumnFacts] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, column: str, content) -> ColumnFacts:
+        if self.max_entries <= 0:
+            return check_column(column, content)
+        try:
+            # Keys are sorted, so that a column whose keys were only reordered (e.g., by an editor) is a hit
+            key = hashlib.blake2b(
+                orjson.dumps({column: content}, option=orjson.OPT_SORT_KEYS),
+                digest_size=16,
+                person=validation_engine.name.encode(),
+            ).digest()
+        except orjson.JSONEncodeError:
+            # e.g., integers too large for orjson, which json.loads accepts
+            return check_column(column, content)
+
+        with self._lock:
+            facts = self._entries.get(key)
+            if facts is not None:
+                self._entries.move_to_end(key)
+        if facts is not None:
+            VALIDATION_CACHE_LOOKUPS.inc(result="hit")
+            return facts
+
+        VALIDATION_CACHE_LOOKUPS.inc(result="miss")
+        facts = check_column(column, content)
+        with self._lock:
+            self._entries[key] = facts
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return facts
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+validation_cache = ColumnFactsCache(utils.VALIDATION_CACHE_SIZE)
+metrics.Gauge(
+    "nb_uploader_validation_cache_entries",
+    "Number of data dictionary columns in the validation cache",
+    function=lambda: len(validation_cache),
+)
+
+
+def validate_data_dict(data_dict: dict) -> None:
+    """Validate a data dictionary, raising an error if it is invalid and warning about any potential issues (see check_data_dict)."""
+    for message in check_data_dict(data_dict):
+        warnings.warn(message)
+
+
+def check_data_dict(data_dict: dict) -> list[str]:
+    """
+    Validate a data dictionary, raising an error if it is invalid and returning the warnings about any potential issues.
+    Unlike catching the warnings of validate_data_dict, this does not change the process-wide warning filters,
+    so is safe to call from several threads at once.
+
+    Every column is checked against the schema, so a DataDictionarySchemaError lists the errors of all invalid columns
+    (up to NB_UPLOADER_API_VALIDATION_MAX_ERRORS) rather than only the first one.
+    The checks of each column are looked up in (or added to) the validation cache,
+    so only the checks that span columns (e.g., the number of participant ID columns) are run on every call.
+    """
+    if isinstance(data_dict, dict):
+        column_facts = {
+            column: validation_cache.get(column, content)
+            for column, content in data_dict.items()
+        }
+        schema_errors = [
+            facts.schema_error
+            for facts in column_facts.values()
+            if facts.schema_error is not None
+        ]
+    else:
+        column_facts = {}
+        schema_errors = validation_engine.find_errors(data_dict)
+
+    # Report the error that jsonschema.validate would report for the whole data dictionary:
+    # its best_match ranks the (otherwise equally relevant) errors of columns by path, so the column whose name sorts last
+    if schema_errors:
+        e = max(schema_errors, key=lambda error: error.path[:1])
+        raise DataDictionarySchemaError(
             "The data dictionary is not a valid Neurobagel data dictionary. "
-            f"Entry that failed validation: {e.path[-1] if e.path else 'Entire document'}\n"
+            f"Entry that failed validation: {e.entry}\n"
             f"Details: {e.message}\n"
-            "TIP: Ensure each annotated column contains an 'Annotations' key."
-        ) from e
+            "TIP: Ensure each annotated column contains an 'Annotations' key.",
+            schema_errors=schema_errors[: utils.VALIDATION_MAX_ERRORS],
+        ) from e.cause
 
-    if get_annotated_columns(data_dict) == []:
+    annotated_columns = [
+        facts for facts in column_facts.values() if facts.is_annotated
+    ]
+    if annotated_columns == []:
         raise LookupError(
             "The data dictionary must contain at least one column with Neurobagel annotations."
         )
 
-    if (
-        len(
-            get_columns_about(
-                data_dict, concept=mappings.NEUROBAGEL["participant"]
-            )
-        )
-        == 0
-    ):
+    n_columns_about = Counter(facts.about for facts in annotated_columns)
+    if n_columns_about[mappings.NEUROBAGEL["participant"]] == 0:
         raise LookupError(
             "The data dictionary must contain at least one column annotated as being about participant ID."
         )
 
     # TODO: remove this validation when we start handling multiple participant and / or session ID columns
-    if (
-        len(
-            get_columns_about(
-                data_dict, concept=mappings.NEUROBAGEL["participant"]
-            )
-        )
-        > 1
-    ) | (
-        len(
-            get_columns_about(
-                data_dict, concept=mappings.NEUROBAGEL["session"]
-            )
-        )
-        > 1
+    if (n_columns_about[mappings.NEUROBAGEL["participant"]] > 1) | (
+        n_columns_about[mappings.NEUROBAGEL["session"]] > 1
     ):
         raise ValueError(
             "The data dictionary has more than one column about participant ID or session ID. "
             "Please ensure only one column is annotated for participant and session IDs."
         )
 
-    if (
-        len(get_columns_about(data_dict, concept=mappings.NEUROBAGEL["sex"]))
-        > 1
-    ):
-        warnings.warn(
+    if unrecognized_terms := [
+        term
+        for facts in annotated_columns
+        for term in facts.unrecognized_terms
+    ]:
+        raise ValueError(
+            "The data dictionary contains TermURLs that are not in the controlled vocabularies supported by Neurobagel: "
+            + "; ".join(unrecognized_terms)
+        )
+
+    validation_warnings = []
+    if n_columns_about[mappings.NEUROBAGEL["sex"]] > 1:
+        validation_warnings.append(
             "The data dictionary indicates more than one column about sex. "
             "Neurobagel cannot resolve multiple sex values per subject-session, and so will use only the first identified column for sex data."
         )
 
-    if (
-        len(get_columns_about(data_dict, concept=mappings.NEUROBAGEL["age"]))
-        > 1
-    ):
-        warnings.warn(
+    if n_columns_about[mappings.NEUROBAGEL["age"]] > 1:
+        validation_warnings.append(
             "The data dictionary indicates more than one column about age. "
             "Neurobagel cannot resolve multiple age values per subject-session, so will use only the first identified column for age data."
         )
 
     # NOTE: We don't yet expect/allow subject group annotations, but we keep this logic in the data dictionary check
     # for consistency with the CLI, since our data model technically supports subject group.
-    if (
-        len(
-            get_columns_about(
-                data_dict, concept=mappings.NEUROBAGEL["subject_group"]
-            )
-        )
-        > 1
-    ):
-        warnings.warn(
+    if n_columns_about[mappings.NEUROBAGEL["subject_group"]] > 1:
+        validation_warnings.append(
             "The data dictionary indicates more than one column about subject group. "
             "Neurobagel cannot resolve multiple subject group values per subject-session, and so will use only the first identified column for subject group data."
         )
 
-    if not categorical_cols_have_bids_levels(data_dict):
-        warnings.warn(
+    if any(facts.lacks_bids_levels for facts in annotated_columns):
+        validation_warnings.append(
             "The data dictionary contains at least one column that looks categorical but lacks a BIDS 'Levels' attribute."
         )
 
-    if mismatched_cols := get_mismatched_categorical_levels(data_dict):
-        warnings.warn(
+    if mismatched_cols := [
+        column
+        for column, facts in column_facts.items()
+        if facts.has_mismatched_levels
+    ]:
+        validation_warnings.append(
             f"The data dictionary contains columns with mismatched levels between the BIDS and Neurobagel annotations: {mismatched_cols}"
         )
+
+    return validation_warnings
@@ -0,0 +1,291 @@
+import math
+import socket
+from datetime import datetime, timezone
+
+import requests
+import urllib3
+from github import Auth, Github, GithubIntegration, GithubRetry
+from github.GithubException import GithubException, UnknownObjectException
+from github.Requester import Requester, RequestsResponse
+
+from . import metrics
+from . import utility as utils
+from .cache import shared_cache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# Installation tokens are valid for one hour. We stop using a cached token a bit before it expires
+# so that it cannot expire partway through an upload.
+TOKEN_EXPIRY_MARGIN = 5 * 60
+
+GITHUB_REQUESTS = metrics.Counter(
+    "nb_uploader_github_requests_total",
+    "Number of HTTP requests sent to the GitHub API",
+)
+GITHUB_CONNECTIONS_OPENED = metrics.Counter(
+    "nb_uploader_github_connections_opened_total",
+    "Number of new (TCP/TLS) connections opened to the GitHub API; requests minus connections opened is the number of reused connections",
+)
+
+
+GITHUB_CIRCUIT_STATE = metrics.Gauge(
+    "nb_uploader_github_circuit_state",
+    "State of the circuit breaker for GitHub API requests (0 = closed, 1 = half-open, 2 = open)",
+    function=lambda: breaker.state.value,
+)
+GITHUB_REQUESTS_REJECTED = metrics.Counter(
+    "nb_uploader_github_requests_rejected_total",
+    "Number of GitHub API requests rejected without being sent because the circuit breaker was open",
+)
+
+# Methods that can safely be sent again if a request fails. POST requests (e.g., creating a branch or a pull request)
+# are not retried on errors that happen after the request was sent, since they could be applied twice.
+# Neither are PUT requests: a contents API PUT that was applied but whose response was lost
+# would be answered with a 409 (since the file's SHA is no longer current) when sent again.
+RETRY_ALLOWED_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "DELETE"})
+# Server errors that are usually transient
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+
+class GitHubUnavailableError(Exception):
+    """Raised when GitHub cannot currently be reached, meaning the request may succeed if retried later."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    def _new_conn(self):
+        GITHUB_CONNECTIONS_OPENED.inc()
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    def _new_conn(self):
+        GITHUB_CONNECTIONS_OPENED.inc()
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An HTTP adapter that counts the connections it opens, and optionally enables TCP keep-alive probes on them."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        if utils.GITHUB_TCP_KEEPALIVE:
+            kwargs["socket_options"] = (
+                urllib3.connection.HTTPConnection.default_socket_options
+                + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            )
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def create_session() -> requests.Session:
+    session = requests.Session()
+    # Like PyGithub, set Session.auth so that requests does not fall back to credentials from a .netrc file
+    session.auth = Requester.noopAuth
+    adapter = PooledHTTPAdapter(
+        pool_connections=utils.GITHUB_POOL_SIZE,
+        pool_maxsize=utils.GITHUB_POOL_SIZE,
+        # GithubRetry also waits out rate limits, like PyGithub does by default
+        max_retries=GithubRetry(
+            total=utils.GITHUB_MAX_RETRIES,
+            backoff_factor=utils.GITHUB_BACKOFF_FACTOR,
+            backoff_max=utils.GITHUB_BACKOFF_MAX,
+            # Randomize the waits so that clients that failed together do not all retry at the same moment
+            backoff_jitter=utils.GITHUB_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=RETRY_ALLOWED_METHODS,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# A single session (and therefore a single pool of keep-alive connections) is used for all GitHub traffic
+# in the process, so that connections and TLS sessions are reused across uploads
+session = create_session()
+breaker = CircuitBreaker(
+    failure_threshold=utils.GITHUB_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=utils.GITHUB_BREAKER_RESET_TIMEOUT,
+)
+
+
+def send_request(verb: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request to GitHub through the shared session, subject to the circuit breaker.
+    Keyword arguments are passed to requests.Session.request.
+    """
+    try:
+        breaker.before_request()
+    except CircuitOpenError as e:
+        GITHUB_REQUESTS_REJECTED.inc()
+        raise GitHubUnavailableError(
+            "GitHub is currently unavailable. Please try again later.",
+            retry_after=e.retry_after,
+        ) from e
+
+    GITHUB_REQUESTS.inc()
+    try:
+        # Transient failures are retried inside the session (see create_session),
+        # so the breaker only sees the outcome after all retries
+        response = session.request(
+            verb,
+            url,
+            timeout=(utils.GITHUB_CONNECT_TIMEOUT, utils.GITHUB_READ_TIMEOUT),
+            allow_redirects=False,
+            **kwargs,
+        )
+    except requests.RequestException as e:
+        breaker.record_failure()
+        raise GitHubUnavailableError(
+            f"Could not reach GitHub: {e}. Please try again later.",
+            retry_after=math.ceil(breaker.reset_timeout),
+        ) from e
+    except GithubException as e:
+        # GithubRetry raises a 403 that is not a rate limit itself, so GitHub did respond
+        if e.status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    except BaseException:
+        # Otherwise, the half-open circuit would never let another probe through
+        breaker.release_probe()
+        raise
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+class PooledConnection:
+    """
+    Replacement for PyGithub's connection classes that sends requests through the process-wide session.
+
+    PyGithub creates a new connection object (and by default, a new requests.Session) for each Github or
+    GithubIntegration instance, meaning new connections would be set up for every upload.
+    """
+
+    protocol = "https"
+
+    def __init__(
+        self,
+        host: str,
+        port: int | None = None,
+        strict: bool = False,
+        timeout: int | None = None,
+        retry=None,
+        pool_size: int | None = None,
+        **kwargs,
+    ):
+        self.host = host
+        self.port = port if port else 443
+        self.verify = kwargs.get("verify", True)
+
+    def request(
+        self, verb: str, url: str, input, headers: dict, stream=False
+    ) -> None:
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+        self.stream = stream
+
+    def getresponse(self) -> RequestsResponse:
+        return RequestsResponse(
+            send_request(
+                self.verb,
+                f"{self.protocol}://{self.host}:{self.port}{self.url}",
+                headers=self.headers,
+                data=self.input,
+                verify=self.verify,
+                stream=self.stream,
+            )
+        )
+
+    def close(self) -> None:
+        # The shared session must stay open for other clients
+        pass
+
+
+class PooledHTTPConnection(PooledConnection):
+    protocol = "http"
+
+    def __init__(self, host: str, port: int | None = None, **kwargs):
+        super().__init__(host, port if port else 80, **kwargs)
+
+
+Requester.injectConnectionClasses(PooledHTTPConnection, PooledConnection)
+
+
+def get_installation_token(org: str) -> str:
+    """
+    Return an installation access token for the Neurobagel Bot app in the given organization.
+
+    Tokens are stored in the cache shared by all worker processes, so that the app only authenticates
+    as itself (JWT -> installation lookup -> token exchange) roughly once per token lifetime,
+    rather than once per upload per worker.
+    """
+    cache_key = f"installation_token:{org}"
+    if (cached := shared_cache.get(cache_key)) is not None:
+        return cached
+
+    # See https://pygithub.readthedocs.io/en/stable/examples/Authentication.html#app-installation-authentication
+    auth = Auth.AppAuth(utils.APP_ID, utils.APP_PRIVATE_KEY)
+    gi = GithubIntegration(auth=auth, base_url=utils.GITHUB_API_URL)
+    installation = gi.get_org_installation(org)
+    access_token = gi.get_access_token(installation.id)
+
+    ttl = (
+        access_token.expires_at - datetime.now(timezone.utc)
+    ).total_seconds() - TOKEN_EXPIRY_MARGIN
+    if ttl > 0:
+        shared_cache.set(cache_key, access_token.token, ttl=ttl)
+    return access_token.token
+
+
+def get_installation_github(org: str) -> Github:
+    """Return a GitHub client authenticated as the Neurobagel Bot app installation in the given organization."""
+    return Github(
+        auth=Auth.Token(get_installation_token(org)),
+        base_url=utils.GITHUB_API_URL,
+    )
+
+
+def get_blob_content(org: str, full_name: str, blob_sha: str) -> bytes:
+    """
+    Return the raw contents of a blob in a repository, authenticated as the app installation in the given organization.
+
+    Unlike the contents API, this works for files of up to 100 MB, and the contents are received as raw bytes
+    rather than as base64 inside a JSON document, which avoids several intermediate copies of large files.
+
+    Raises github.UnknownObjectException if the blob does not exist.
+    """
+    response = send_request(
+        "GET",
+        f"{utils.GITHUB_API_URL}/repos/{full_name}/git/blobs/{blob_sha}",
+        headers={
+            "Authorization": f"token {get_installation_token(org)}",
+            "Accept": "application/vnd.github.raw+json",
+        },
+    )
+    if response.status_code != 200:
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"message": response.reason}
+        exception_class = (
+            UnknownObjectException
+            if response.status_code == 404
+            else GithubException
+        )
+        raise exception_class(
+            response.status_code, data, dict(response.headers)
+        )
+    return response.content
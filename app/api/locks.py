@@ -0,0 +1,139 @@
+"""
+Locks keyed by an arbitrary string (e.g., a dataset ID), so that work on the same key is serialized
+while work on different keys runs in parallel.
+
+Given a directory, the locks are also shared between processes (e.g., the worker processes of the server)
+by locking a file per key in it with flock. Otherwise, they only serialize work within a single process.
+
+Also provides a fixed number of slots shared between processes, each held by locking one of the files in a directory.
+"""
+
+import fcntl
+import os
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import metrics
+
+# How long to wait between attempts to lock a file held by another process, at most
+MAX_FILE_LOCK_POLL_INTERVAL = 0.05
+
+
+class LockTimeoutError(TimeoutError):
+    """Raised when a keyed lock could not be acquired within the timeout."""
+
+
+class KeyedLock:
+    """
+    A lock per key, created when first needed and discarded once no thread holds or waits for it,
+    so that the number of locks kept does not grow with the number of keys ever used.
+    (The lock files in the directory are kept, since deleting a file another process may be about to lock is not safe.)
+    """
+
+    def __init__(
+        self,
+        wait_time: metrics.Summary | None = None,
+        directory: str | None = None,
+    ):
+        self.wait_time = wait_time
+        self.directory = Path(directory) if directory is not None else None
+        # key -> (lock, number of threads holding or waiting for it)
+        self._locks: dict[str, list] = {}
+        self._guard = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def _lock_file(self, key: str, deadline: float | None) -> int:
+        """Open and lock the file of a key (without other threads of this process holding it), returning its descriptor."""
+        # Lock files hold no data, but are only accessible to the user running the API
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(
+            self.directory / f"{urllib.parse.quote(key, safe='')}.lock",
+            os.O_RDWR | os.O_CREAT,
+            0o600,
+        )
+        interval = 0.001
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise LockTimeoutError(
+                        f"Timed out waiting for the lock for {key!r}"
+                    ) from None
+            # flock cannot wait with a timeout, so a file locked by another process is polled with increasing intervals
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_FILE_LOCK_POLL_INTERVAL)
+
+    @contextmanager
+    def hold(self, key: str, timeout: float = -1):
+        """Hold the lock for a key, waiting at most timeout seconds (forever if negative) for it."""
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            start = time.monotonic()
+            deadline = start + timeout if timeout >= 0 else None
+            if not entry[0].acquire(timeout=timeout):
+                raise LockTimeoutError(
+                    f"Timed out waiting for the lock for {key!r}"
+                )
+            try:
+                fd = (
+                    self._lock_file(key, deadline)
+                    if self.directory is not None
+                    else None
+                )
+                if self.wait_time is not None:
+                    self.wait_time.observe(time.monotonic() - start)
+                try:
+                    yield
+                finally:
+                    if fd is not None:
+                        # Closing the file releases the lock
+                        os.close(fd)
+            finally:
+                entry[0].release()
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+class SharedSlots:
+    """
+    A fixed number of slots shared between processes, each held by locking one of `count` files in a directory with flock.
+    The slots of a process that exits are released with its files.
+    """
+
+    def __init__(self, directory: str, count: int):
+        self.directory = Path(directory)
+        self.count = count
+
+    def try_acquire(self) -> int | None:
+        """Hold a free slot without waiting, returning the descriptor of its file, or None if every slot is held."""
+        # Slot files hold no data, but are only accessible to the user running the API
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        for slot in range(self.count):
+            fd = os.open(
+                self.directory / f"slot-{slot}.lock",
+                os.O_RDWR | os.O_CREAT,
+                0o600,
+            )
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def release(self, fd: int) -> None:
+        # Closing the file releases the lock
+        os.close(fd)
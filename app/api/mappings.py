@@ -15,3 +15,9 @@ NEUROBAGEL = {
     "subject_group": NB.pf + ":SubjectGroup",
     "assessment_tool": NB.pf + ":Assessment",
 }
+
+# Namespaces of the controlled vocabularies whose terms can be used in a data dictionary,
+# in addition to the Neurobagel namespace (see app/api/vocabulary.py)
+COGATLAS = Namespace("cogatlas", "https://www.cognitiveatlas.org/task/id/")
+NCIT = Namespace("ncit", "http://ncicb.nci.nih.gov/xml/owl/EVS/Thesaurus.owl#")
+SNOMED = Namespace("snomed", "http://purl.bioontology.org/ontology/SNOMEDCT/")
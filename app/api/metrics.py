@@ -0,0 +1,126 @@
+"""
+A minimal in-process metrics registry, rendered in the Prometheus text exposition format at /metrics.
+
+NOTE: Metrics are kept per worker process, so when running multiple workers each scrape reflects
+only the worker that handled the request.
+"""
+
+import threading
+from typing import Callable
+
+REGISTRY: list["Metric"] = []
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Metric:
+    """Base class for a named metric with optional labels."""
+
+    type: str
+
+    def __init__(self, name: str, description: str, labelled: bool = False):
+        self.name = name
+        self.description = description
+        # An unlabelled metric is reported (as zero) even before it is first updated
+        self._values: dict[tuple[tuple[str, str], ...], float] = (
+            {} if labelled else {(): 0}
+        )
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> dict[tuple[tuple[str, str], ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def value(self, **labels: str) -> float:
+        return self.samples().get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for labels, value in self.samples().items():
+            lines.append(f"{self.name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only increases, e.g., a number of requests."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that can go up and down, which is either set directly or read from a function when rendered."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        function: Callable[[], float] | None = None,
+        labelled: bool = False,
+    ):
+        super().__init__(name, description, labelled)
+        self.function = function
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> dict[tuple[tuple[str, str], ...], float]:
+        if self.function is not None:
+            return {(): self.function()}
+        return super().samples()
+
+
+class Summary(Metric):
+    """A total and count of observed values (e.g., durations), from which an average can be derived."""
+
+    type = "summary"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._sum += value
+            self._count += 1
+
+    def render(self) -> str:
+        with self._lock:
+            total, count = self._sum, self._count
+        return "\n".join(
+            [
+                f"# HELP {self.name} {self.description}",
+                f"# TYPE {self.name} {self.type}",
+                f"{self.name}_sum {total:g}",
+                f"{self.name}_count {count}",
+            ]
+        )
+
+
+def render_metrics() -> str:
+    """Render all registered metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,297 @@
+"""
+An on-disk mirror of the participants.json file of every dataset repository in OpenNeuroDatasets-JSONLD.
+
+The mirror directory contains:
+- index.json: for each repository, its default branch, when it was last pushed to, the SHAs of the head commit
+  and root tree of its default branch, and the blob SHA of its participants.json (null if it has none)
+- datasets/<dataset_id>.json: the raw contents of each dataset's participants.json
+
+Syncing is incremental:
+1. All repositories of the organization are listed (a few paginated requests).
+2. Repositories whose default branch and push time are unchanged since the last sync are skipped without further requests.
+3. For the remaining repositories, the head of the default branch is fetched (in parallel, with bounded concurrency).
+   The root tree is only fetched if the head commit points to a different tree than before,
+   and the participants.json blob only if its blob SHA changed.
+"""
+
+import base64
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import orjson
+from github import Github
+from github.GithubException import GithubException
+from github.Repository import Repository
+
+from . import github_client
+from . import utility as utils
+
+logger = logging.getLogger(__name__)
+
+PARTICIPANTS_FILE = "participants.json"
+
+
+@dataclass
+class SyncSummary:
+    """Counts of what was done during a mirror sync."""
+
+    listed: int = 0
+    skipped: int = 0
+    checked: int = 0
+    fetched: int = 0
+    removed: int = 0
+    failed: int = 0
+
+
+@dataclass
+class ParticipantsFile:
+    """The contents of a dataset's participants.json and the SHA of the blob they come from."""
+
+    content: bytes
+    sha: str
+    path: str = PARTICIPANTS_FILE
+
+
+class DatasetMirror:
+    """A local mirror of the participants.json files of an organization's repositories."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.index_path = self.path / "index.json"
+        self.datasets_path = self.path / "datasets"
+
+    def load_index(self) -> dict:
+        try:
+            return orjson.loads(self.index_path.read_bytes())
+        except FileNotFoundError:
+            return {}
+
+    def _write_atomically(self, path: Path, content: bytes) -> None:
+        # Write to a temporary file first so that readers never see a partially written file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _dataset_file(self, dataset_id: str) -> Path:
+        return self.datasets_path / f"{dataset_id}.json"
+
+    def read(
+        self, dataset_id: str, head_sha: str | None = None
+    ) -> ParticipantsFile | None:
+        """
+        Return the mirrored participants.json of a dataset, or None if the mirror has no such file.
+        If head_sha is given, None is also returned unless the file was mirrored from that commit.
+        """
+        entry = self.load_index().get(dataset_id)
+        if entry is None or entry["blob_sha"] is None:
+            return None
+        if head_sha is not None and entry["head_sha"] != head_sha:
+            return None
+        try:
+            content = self._dataset_file(dataset_id).read_bytes()
+        except FileNotFoundError:
+            return None
+        return ParticipantsFile(content=content, sha=entry["blob_sha"])
+
+    def _sync_repo(self, repo: Repository, entry: dict) -> str:
+        """
+        Bring the mirrored participants.json of a single repository up to date with its default branch.
+        Returns "fetched" if the file was (re)downloaded or removed, or "checked" otherwise.
+
+        The entry is only updated once everything it records was fetched (and the file written),
+        so a sync that fails partway leaves the entry as it was and the next sync retries it.
+        """
+        head = repo.get_branch(entry["default_branch"]).commit
+        if head.sha == entry["head_sha"]:
+            return "checked"
+        tree_sha = head.commit.tree.sha
+        if tree_sha == entry["tree_sha"]:
+            entry["head_sha"] = head.sha
+            return "checked"
+
+        tree = repo.get_git_tree(tree_sha)
+        blob_sha = next(
+            (
+                element.sha
+                for element in tree.tree
+                if element.path == PARTICIPANTS_FILE and element.type == "blob"
+            ),
+            None,
+        )
+        if blob_sha == entry["blob_sha"]:
+            entry.update(head_sha=head.sha, tree_sha=tree_sha)
+            return "checked"
+
+        if blob_sha is None:
+            self._dataset_file(repo.name).unlink(missing_ok=True)
+        else:
+            blob = repo.get_git_blob(blob_sha)
+            self._write_atomically(
+                self._dataset_file(repo.name), base64.b64decode(blob.content)
+            )
+        entry.update(head_sha=head.sha, tree_sha=tree_sha, blob_sha=blob_sha)
+        return "fetched"
+
+    def sync(self, g: Github, org: str, max_workers: int = 8) -> SyncSummary:
+        """Incrementally sync the mirror with the current state of the organization's repositories."""
+        summary = SyncSummary()
+        old_index = self.load_index()
+        new_index = {}
+        to_check = []
+
+        for repo in g.get_organization(org).get_repos():
+            summary.listed += 1
+            old_entry = old_index.get(repo.name)
+            pushed_at = repo.pushed_at.isoformat() if repo.pushed_at else None
+            if (
+                old_entry is not None
+                and old_entry["default_branch"] == repo.default_branch
+                and old_entry["pushed_at"] == pushed_at
+            ):
+                new_index[repo.name] = old_entry
+                summary.skipped += 1
+                continue
+            entry = {
+                "head_sha": None,
+                "tree_sha": None,
+                "blob_sha": None,
+                **(old_entry or {}),
+                "default_branch": repo.default_branch,
+                "html_url": repo.html_url,
+                # Only recorded once the repository has been synced successfully, so that a failed sync is retried
+                "pushed_at": None,
+            }
+            new_index[repo.name] = entry
+            to_check.append((repo, entry, pushed_at))
+
+        def sync_one(item):
+            repo, entry, pushed_at = item
+            try:
+                outcome = self._sync_repo(repo, entry)
+            except (
+                GithubException,
+                github_client.GitHubUnavailableError,
+            ) as e:
+                logger.warning(f"Could not sync {repo.full_name}: {e}")
+                return "failed"
+            entry["pushed_at"] = pushed_at
+            return outcome
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for outcome in pool.map(sync_one, to_check):
+                setattr(summary, outcome, getattr(summary, outcome) + 1)
+
+        for removed in old_index.keys() - new_index.keys():
+            self._dataset_file(removed).unlink(missing_ok=True)
+            summary.removed += 1
+
+        self._write_atomically(self.index_path, orjson.dumps(new_index))
+        return summary
+
+    @contextmanager
+    def _locked(self, blocking: bool):
+        """Hold the lock on the mirror, yielding whether it was acquired (it always is if blocking)."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / ".lock", "w") as lock_file:
+            try:
+                fcntl.flock(
+                    lock_file,
+                    (
+                        fcntl.LOCK_EX
+                        if blocking
+                        else fcntl.LOCK_EX | fcntl.LOCK_NB
+                    ),
+                )
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def sync_exclusively(
+        self, g: Github, org: str, max_workers: int = 8
+    ) -> SyncSummary | None:
+        """
+        Sync the mirror unless another process (e.g., another worker) is already syncing it,
+        in which case return None.
+        """
+        with self._locked(blocking=False) as acquired:
+            if not acquired:
+                return None
+            return self.sync(g, org, max_workers)
+
+    def update(
+        self,
+        g: Github,
+        org: str,
+        name: str,
+        default_branch: str,
+        html_url: str,
+    ) -> str:
+        """
+        Bring the mirrored participants.json of a single repository up to date (e.g., after a webhook reported a push to it),
+        adding the repository to the mirror if needed. Returns "fetched" or "checked" as for a sync.
+
+        The push time of the entry is left unset, so the next sync checks the repository once more.
+        NOTE: This waits for any sync in progress to finish, since the sync would otherwise overwrite the updated entry.
+        """
+        with self._locked(blocking=True):
+            index = self.load_index()
+            entry = {
+                "head_sha": None,
+                "tree_sha": None,
+                "blob_sha": None,
+                **index.get(name, {}),
+                "default_branch": default_branch,
+                "html_url": html_url,
+                "pushed_at": None,
+            }
+            outcome = self._sync_repo(
+                g.withLazy(True).get_repo(f"{org}/{name}"), entry
+            )
+            index[name] = entry
+            self._write_atomically(self.index_path, orjson.dumps(index))
+            return outcome
+
+    def advance_head(self, name: str, before_sha: str, after_sha: str) -> bool:
+        """
+        Record that the default branch of a mirrored repository moved from before_sha to after_sha
+        with commits that did not touch participants.json, so that the mirrored file stays readable at the new head.
+        Returns False (leaving the mirror unchanged) if the entry was not mirrored from before_sha.
+        """
+        with self._locked(blocking=True):
+            index = self.load_index()
+            entry = index.get(name)
+            if entry is None or entry["head_sha"] != before_sha:
+                return False
+            # The root tree changed with the commits, so the tree SHA is no longer known
+            index[name] = {**entry, "head_sha": after_sha, "tree_sha": None}
+            self._write_atomically(self.index_path, orjson.dumps(index))
+            return True
+
+    def remove(self, name: str) -> bool:
+        """Remove a repository from the mirror (e.g., after it was deleted or renamed), returning whether it was mirrored."""
+        with self._locked(blocking=True):
+            index = self.load_index()
+            if index.pop(name, None) is None:
+                return False
+            self._dataset_file(name).unlink(missing_ok=True)
+            self._write_atomically(self.index_path, orjson.dumps(index))
+            return True
+
+    def clear(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+mirror = DatasetMirror(utils.MIRROR_PATH)
@@ -62,6 +62,39 @@ class SuccessfulUploadWithWarnings(SuccessfulUpload):
     warnings: list
 
 
+# How an uploaded data dictionary changes the existing participants.json of a dataset
+ChangeType = Literal[
+    "new_file",
+    "annotations_only",
+    "includes_non_annotation_changes",
+    "formatting_only",
+]
+
+
+class UploadPreview(BaseModel, extra="forbid"):
+    """Data model for a response to a preview of an upload, describing the pull request it would open."""
+
+    message: Literal[
+        "Preview of the file that would be uploaded to OpenNeuroDatasets-JSONLD. No pull request was opened."
+    ] = "Preview of the file that would be uploaded to OpenNeuroDatasets-JSONLD. No pull request was opened."
+    change_type: ChangeType
+    content: str
+    diff: str
+    warnings: list
+
+
+class SchemaErrorDetail(BaseModel):
+    """Data model for an entry of an uploaded data dictionary that does not match the data dictionary schema."""
+
+    # The path of the uploaded file in the dataset repository, when several files were uploaded together
+    file: str | None = None
+    # None if the data dictionary as a whole is invalid (e.g., it is not a JSON object)
+    column: str | None
+    # The location of the entry as a JSONPath expression, e.g. $.age.Annotations.Format
+    path: str
+    message: str
+
+
 class FailedUpload(BaseModel):
     """Data model for a response to a failed upload of a file."""
 
@@ -69,3 +102,35 @@ class FailedUpload(BaseModel):
         "Failed to upload the file to OpenNeuroDatasets-JSONLD."
     ] = "Failed to upload the file to OpenNeuroDatasets-JSONLD."
     error: str
+    # For a data dictionary that does not match the schema, the errors of every invalid column
+    # (up to NB_UPLOADER_API_VALIDATION_MAX_ERRORS), so that they can all be fixed before uploading again
+    schema_errors: list[SchemaErrorDetail] | None = None
+
+
+class DataDictionaryFormatting(BaseModel):
+    """Data model for the formatting style of an existing data dictionary, which uploads to the dataset are formatted to match."""
+
+    # None if the file is not indented
+    indent_char: str | None
+    indent_level: int
+    # None if the file does not end its first line with a newline
+    newline_char: str | None
+    multiline: bool
+
+
+class DataDictionaryValidation(BaseModel):
+    """Data model for the result of validating an existing data dictionary against the current data dictionary validation."""
+
+    status: Literal["valid", "warnings", "invalid"]
+    errors: list[str]
+    warnings: list[str]
+
+
+class DataDictionaryDetails(BaseModel):
+    """Data model for the current participants.json of a dataset, with its formatting style and validation status if requested."""
+
+    sha: str
+    content: str
+    # None if not requested, or (for formatting) if the formatting could not be detected (e.g., mixed indentation characters)
+    formatting: DataDictionaryFormatting | None = None
+    validation: DataDictionaryValidation | None = None
@@ -0,0 +1,267 @@
+"""
+Token-bucket rate limiting of requests, per client IP address and per contributor (email address and GitHub username),
+so that a single misbehaving client cannot use up the GitHub API quota shared by every contributor.
+
+Each key has a bucket of up to `burst` tokens, which refills at a steady rate. A request takes one token from each of
+its buckets (e.g., the contributor's email address and GitHub username), and is rejected (with the time until a token
+is available) without taking any when one of them is empty.
+A bucket that has been idle long enough to refill completely is equivalent to a new bucket, so it is evicted.
+
+The buckets are selected with NB_UPLOADER_API_RATE_LIMIT_BACKEND:
+- "memory" (default): kept in the memory of each worker process, so each worker enforces the limits separately
+- "sqlite": stored in the SQLite cache file, so the limits are shared by all worker processes
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Request
+
+from . import metrics
+from . import utility as utils
+
+REQUESTS_RATE_LIMITED = metrics.Counter(
+    "nb_uploader_requests_rate_limited_total",
+    "Number of requests rejected because a rate limit was exceeded, by scope (client or contributor)",
+    labelled=True,
+)
+RATE_LIMIT_BUCKETS = metrics.Gauge(
+    "nb_uploader_rate_limit_buckets",
+    "Number of rate limit buckets kept in memory (in this worker)",
+)
+
+
+@dataclass(frozen=True)
+class Limit:
+    """A sustained number of requests per minute, with bursts of up to `burst` requests."""
+
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        """Tokens added to a bucket per second."""
+        return self.per_minute / 60
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0 and self.burst > 0
+
+
+class RateLimitedError(Exception):
+    """Raised when a request exceeds a rate limit."""
+
+    def __init__(self, scope: str, retry_after: int):
+        super().__init__(
+            f"Too many requests from this {scope}. Please try again in {retry_after} seconds."
+        )
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def take_token(
+    tokens: float, updated_at: float, limit: Limit, now: float
+) -> tuple[float, float]:
+    """
+    Refill a bucket for the time elapsed since it was last updated, and take a token from it if there is one.
+
+    Returns the number of tokens left and the time to wait for a token (0 if a token was taken).
+    """
+    tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / limit.rate
+
+
+class TokenBuckets(ABC):
+    """Interface shared by the storage backends of the token buckets."""
+
+    @abstractmethod
+    def take(self, keys: list[str], limit: Limit) -> float:
+        """
+        Take a token from the bucket of every key, returning 0 if the tokens were taken, or else (if any bucket is empty)
+        the time to wait for a token in every bucket, without taking any.
+        """
+
+
+class MemoryTokenBuckets(TokenBuckets):
+    """
+    Token buckets kept in the memory of a single process.
+
+    Buckets are kept in order of last use, so that buckets that have refilled completely can be evicted
+    from the front in constant time. At most max_entries buckets are kept, evicting the least recently used first.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        # key -> (tokens, updated_at, time at which the bucket is full again)
+        self._buckets: OrderedDict[str, tuple[float, float, float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, keys: list[str], limit: Limit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            remaining, wait = {}, 0
+            for key in keys:
+                tokens, updated_at, _ = self._buckets.get(
+                    key, (limit.burst, now, now)
+                )
+                remaining[key], key_wait = take_token(
+                    tokens, updated_at, limit, now
+                )
+                wait = max(wait, key_wait)
+            if wait > 0:
+                return wait
+            for key, tokens in remaining.items():
+                full_at = now + (limit.burst - tokens) / limit.rate
+                self._buckets[key] = (tokens, now, full_at)
+                self._buckets.move_to_end(key)
+            while self._buckets:
+                _, (_, _, oldest_full_at) = next(iter(self._buckets.items()))
+                if (
+                    oldest_full_at > now
+                    and len(self._buckets) <= self.max_entries
+                ):
+                    break
+                self._buckets.popitem(last=False)
+            RATE_LIMIT_BUCKETS.set(len(self._buckets))
+        return 0
+
+
+class SQLiteTokenBuckets(TokenBuckets):
+    """
+    Token buckets stored in a SQLite file, so that they are shared by every worker process.
+
+    Each take is a single short write transaction, which may wait for other processes' takes,
+    so (like every other SQLite access) it must not run on the event loop.
+    Buckets that have refilled completely are deleted every `eviction_interval` takes (per process).
+    """
+
+    def __init__(self, path: str, eviction_interval: int = 1000):
+        self.path = path
+        self.eviction_interval = eviction_interval
+        self._takes = 0
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, keys: list[str], limit: Limit) -> float:
+        # Wall-clock time, since the buckets are shared between processes
+        now = time.time()
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent takes from other processes are serialized
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            remaining, wait = {}, 0
+            for key in keys:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                tokens, updated_at = (
+                    row if row is not None else (limit.burst, now)
+                )
+                remaining[key], key_wait = take_token(
+                    tokens, updated_at, limit, now
+                )
+                wait = max(wait, key_wait)
+            if wait == 0:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            key,
+                            tokens,
+                            now,
+                            now + (limit.burst - tokens) / limit.rate,
+                        )
+                        for key, tokens in remaining.items()
+                    ],
+                )
+            self._takes += 1
+            if self._takes % self.eviction_interval == 0:
+                conn.execute(
+                    "DELETE FROM rate_limit_buckets WHERE full_at <= ?", (now,)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+def create_token_buckets() -> TokenBuckets:
+    """Create the token buckets using the backend configured by environment variables."""
+    if utils.RATE_LIMIT_BACKEND == "memory":
+        return MemoryTokenBuckets(max_entries=utils.RATE_LIMIT_MAX_BUCKETS)
+    if utils.RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteTokenBuckets(utils.CACHE_PATH)
+    raise ValueError(
+        f"Unsupported rate limit backend: {utils.RATE_LIMIT_BACKEND!r}. "
+        "NB_UPLOADER_API_RATE_LIMIT_BACKEND must be one of 'memory' or 'sqlite'."
+    )
+
+
+token_buckets = create_token_buckets()
+CLIENT_LIMIT = Limit(
+    per_minute=utils.CLIENT_RATE_LIMIT, burst=utils.CLIENT_RATE_LIMIT_BURST
+)
+CONTRIBUTOR_LIMIT = Limit(
+    per_minute=utils.CONTRIBUTOR_RATE_LIMIT,
+    burst=utils.CONTRIBUTOR_RATE_LIMIT_BURST,
+)
+
+
+def check(scope: str, keys: list[str], limit: Limit) -> None:
+    """Take a token for a request from the bucket of each key, raising RateLimitedError if the limit for any key was exceeded."""
+    if not limit.enabled:
+        return
+    wait = token_buckets.take([f"{scope}:{key}" for key in keys], limit)
+    if wait > 0:
+        REQUESTS_RATE_LIMITED.inc(scope=scope)
+        raise RateLimitedError(scope, retry_after=math.ceil(wait))
+
+
+def limit_client(request: Request) -> None:
+    """
+    Rate limit requests by client IP address.
+    (A sync dependency, so that FastAPI runs it in a worker thread rather than blocking the event loop on the buckets.)
+
+    NOTE: The server runs with proxy headers enabled, so behind a trusted proxy (see FORWARDED_ALLOW_IPS in the uvicorn docs)
+    the client address is the original client's, taken from the X-Forwarded-For header.
+    """
+    if request.client is not None:
+        check("client", [request.client.host], CLIENT_LIMIT)
+
+
+def limit_contributor(email: str, gh_username: str | None) -> None:
+    """
+    Rate limit uploads by contributor, identified by both their email address and (if given) their GitHub username.
+
+    NOTE: This may wait for other worker processes' access to the buckets, so should be run in a worker thread.
+    """
+    keys = [f"email:{email.strip().lower()}"]
+    if gh_username:
+        keys.append(f"gh:{gh_username.lower()}")
+    check("contributor", keys, CONTRIBUTOR_LIMIT)
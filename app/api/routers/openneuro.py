@@ -1,32 +1,95 @@
-import base64
+import asyncio
+import hashlib
 import json
-import warnings
 from typing import Annotated, Union
 
-from fastapi import APIRouter, File, Form, UploadFile
-from fastapi.responses import JSONResponse
-from github import Auth, GithubIntegration
-from github.GithubException import GithubException, UnknownObjectException
+from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 
+from .. import audit, crud, rate_limit
 from .. import utility as utils
-from ..dictionary_utils import validate_data_dict
+from ..admission import AdmissionRejectedError, upload_admission
+from ..compression import DecompressionError, decompress_file_part
+from ..coverage import coverage_statistics
+from ..dictionary_utils import DataDictionarySchemaError, check_data_dict
+from ..mirror import mirror
 from ..models import (
     Contributor,
+    DataDictionaryDetails,
     FailedUpload,
+    SchemaErrorDetail,
     SuccessfulUpload,
     SuccessfulUploadWithWarnings,
+    UploadPreview,
 )
+from ..static_responses import etag_matches
+
+router = APIRouter(
+    prefix="/openneuro",
+    tags=["openneuro"],
+    dependencies=[Depends(rate_limit.limit_client)],
+)
+
+
+def get_validation_warnings(uploaded_dict) -> list[str]:
+    """
+    Validate an uploaded data dictionary, returning the validation warnings (if any).
+    Raises LookupError or ValueError if the data dictionary is invalid.
+    """
+    # NOTE: Only the first warning is reported, as when validation warnings were caught as exceptions
+    return check_data_dict(uploaded_dict)[:1]
+
+
+def _validate_uploaded_file(
+    uploaded_dict,
+) -> tuple[list[str], LookupError | ValueError | None]:
+    """Validate one of several uploaded data dictionaries, returning its validation warnings or its validation error."""
+    try:
+        return get_validation_warnings(uploaded_dict), None
+    except (LookupError, ValueError) as e:
+        return [], e
+
+
+def get_schema_error_details(
+    error: LookupError | ValueError, file: str | None = None
+) -> list[SchemaErrorDetail] | None:
+    """Return the schema errors of an invalid data dictionary (None if it is invalid for another reason)."""
+    if not isinstance(error, DataDictionarySchemaError):
+        return None
+    return [
+        SchemaErrorDetail(
+            file=file, column=e.column, path=e.json_path, message=e.message
+        )
+        for e in error.schema_errors
+    ]
 
-DATASETS_ORG = "OpenNeuroDatasets-JSONLD"
 
-router = APIRouter(prefix="/openneuro", tags=["openneuro"])
+def invalid_data_dictionary_response(
+    error: LookupError | ValueError,
+) -> JSONResponse:
+    """Return the response to an invalid data dictionary, listing its schema errors (if any)."""
+    # NOTE: No validation is performed on a JSONResponse (https://fastapi.tiangolo.com/advanced/response-directly/#return-a-response),
+    # but that's okay since we mostly want to see the FailedUpload messages
+    return JSONResponse(
+        status_code=400,
+        content=FailedUpload(
+            error=str(error), schema_errors=get_schema_error_details(error)
+        ).model_dump(),
+    )
 
 
-# TODO: Factor out main logic into a CRUD function for easier mocking in tests
 @router.put(
     "/upload",
     response_model=Union[SuccessfulUpload, SuccessfulUploadWithWarnings],
-    responses={400: {"model": FailedUpload}},
+    responses={
+        400: {"model": FailedUpload},
+        409: {"model": FailedUpload},
+        413: {"model": FailedUpload},
+        415: {"model": FailedUpload},
+        429: {"model": FailedUpload},
+        503: {"model": FailedUpload},
+    },
 )
 async def upload(
     dataset_id: str,
@@ -37,6 +100,19 @@ async def upload(
     affiliation: Annotated[str | None, Form()] = None,
     gh_username: Annotated[str | None, Form()] = None,
 ):
+    # Reject IDs recently confirmed not to exist without doing any work
+    # (unless another worker was told that the repositories changed since)
+    crud.apply_dataset_index_changes()
+    if crud.dataset_index.is_known_missing(dataset_id):
+        return JSONResponse(
+            status_code=400,
+            content=FailedUpload(
+                error=crud.UNKNOWN_DATASET_MESSAGE
+            ).model_dump(),
+        )
+
+    await run_in_threadpool(rate_limit.limit_contributor, email, gh_username)
+
     # TODO: Consider switching to using this Pydantic model directly for the /upload route form data
     # (see https://fastapi.tiangolo.com/tutorial/request-form-models/ for reference)
     #
@@ -54,13 +130,18 @@ async def upload(
         changes_summary=utils.convert_literal_newlines(changes_summary),
     )
 
-    # TODO: Handle network errors
-    upload_warnings = []
-    file_exists = False
-
-    uploaded_file_contents = await data_dictionary.read()
     try:
-        uploaded_dict = json.loads(uploaded_file_contents)
+        # The file may be sent compressed, and is decompressed up to a size limit
+        uploaded_file_contents = decompress_file_part(
+            await data_dictionary.read()
+        )
+    except DecompressionError as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            content=FailedUpload(error=str(e)).model_dump(),
+        )
+    try:
+        uploaded_dict = utils.load_json_bytes(uploaded_file_contents)
     except json.JSONDecodeError:
         return JSONResponse(
             status_code=400,
@@ -69,163 +150,382 @@ async def upload(
             ).model_dump(),
         )
 
-    # Create a GitHub instance with the appropriate authentication
-    # (See https://pygithub.readthedocs.io/en/stable/examples/Authentication.html#app-installation-authentication)
-    auth = Auth.AppAuth(utils.APP_ID, utils.APP_PRIVATE_KEY)
-    gi = GithubIntegration(auth=auth)
-
-    # Get the installation ID for the Neurobagel Bot app (for the OpenNeuroDatasets-JSONLD organization)
-    installation = gi.get_org_installation(DATASETS_ORG)
-    installation_id = installation.id
+    dedup_key = crud.upload_dedup_key(
+        "upload",
+        dataset_id,
+        contributor,
+        hashlib.sha256(uploaded_file_contents).hexdigest(),
+    )
+    if (existing_pr_url := crud.shared_cache.get(dedup_key)) is not None:
+        return SuccessfulUploadWithWarnings(
+            pull_request_url=existing_pr_url,
+            warnings=[crud.DUPLICATE_UPLOAD_WARNING],
+        )
 
-    g = gi.get_github_for_installation(installation_id)
+    # Validate the uploaded data dictionary before doing any work against GitHub
+    try:
+        validation_warnings = get_validation_warnings(uploaded_dict)
+    except (LookupError, ValueError) as e:
+        return invalid_data_dictionary_response(e)
 
-    # Check if the dataset exists
+    # Limit how many uploads work against GitHub at once, rejecting uploads when the server is at capacity
+    # NOTE: Network errors and GitHub outages are raised as GitHubUnavailableError,
+    # which is turned into a 503 response by an exception handler registered on the app
     try:
-        repo = g.get_repo(f"{DATASETS_ORG}/{dataset_id}")
-    except UnknownObjectException as e:
-        # TODO: Should we explicitly handle 301 Moved permanently responses? These would not be caught by a 404
+        async with upload_admission.slot():
+            # The GitHub API calls are blocking, so they are run in a worker thread to keep the event loop responsive
+            return await run_in_threadpool(
+                crud.upload_data_dictionary,
+                dataset_id=dataset_id,
+                uploaded_dict=uploaded_dict,
+                contributor=contributor,
+                dedup_key=dedup_key,
+                validation_warnings=validation_warnings,
+            )
+    except AdmissionRejectedError as e:
+        return JSONResponse(
+            status_code=503,
+            content=FailedUpload(error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except crud.UploadConflictError as e:
+        return JSONResponse(
+            status_code=409, content=FailedUpload(error=str(e)).model_dump()
+        )
+    except crud.UploadError as e:
+        return JSONResponse(
+            status_code=400, content=FailedUpload(error=str(e)).model_dump()
+        )
+
+
+@router.post(
+    "/preview",
+    response_model=UploadPreview,
+    responses={
+        400: {"model": FailedUpload},
+        413: {"model": FailedUpload},
+        415: {"model": FailedUpload},
+        429: {"model": FailedUpload},
+        503: {"model": FailedUpload},
+    },
+)
+async def preview(
+    dataset_id: str,
+    data_dictionary: Annotated[UploadFile, File()],
+):
+    """
+    Preview an upload without opening a pull request: the data dictionary is validated and formatted to match
+    the existing participants.json exactly as for an upload, and the file that would be committed is returned
+    with a unified diff against the existing file and the upload warnings.
+    """
+    crud.apply_dataset_index_changes()
+    if crud.dataset_index.is_known_missing(dataset_id):
         return JSONResponse(
             status_code=400,
             content=FailedUpload(
-                error=f"{e.status}: {e.data['message']}. Please ensure you have provided a correct existing dataset ID."
+                error=crud.UNKNOWN_DATASET_MESSAGE
             ).model_dump(),
         )
 
-    # Needed because some repos in OpenNeuroDatasets-JSONLD have "main" default, others have "master"
-    default_branch = repo.default_branch
-
-    # Get participants.json contents if the file exists
     try:
-        current_file = repo.get_contents("participants.json")
-        file_exists = True
-        current_content_json = base64.b64decode(current_file.content).decode(
-            "utf-8"
+        # The file may be sent compressed, and is decompressed up to a size limit
+        uploaded_file_contents = decompress_file_part(
+            await data_dictionary.read()
         )
-        current_content_dict = json.loads(current_content_json)
-    except UnknownObjectException:
-        upload_warnings.append(
-            "No existing participants.json file found in the repository. A new file will be created."
+    except DecompressionError as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            content=FailedUpload(error=str(e)).model_dump(),
+        )
+    try:
+        uploaded_dict = utils.load_json_bytes(uploaded_file_contents)
+    except json.JSONDecodeError:
+        return JSONResponse(
+            status_code=400,
+            content=FailedUpload(
+                error="The uploaded file is not a valid JSON file."
+            ).model_dump(),
         )
-
-    # Validate the uploaded data dictionary
-    # Catch validation UserWarnings as exceptions so we can store them in the response
-    warnings.simplefilter("error", UserWarning)
     try:
-        validate_data_dict(uploaded_dict)
-    except UserWarning as w:
-        upload_warnings.append(str(w))
+        validation_warnings = get_validation_warnings(uploaded_dict)
     except (LookupError, ValueError) as e:
-        # NOTE: No validation is performed on a JSONResponse (https://fastapi.tiangolo.com/advanced/response-directly/#return-a-response),
-        # but that's okay since we mostly want to see the FailedUpload messages
+        return invalid_data_dictionary_response(e)
+
+    preview_key = f"preview:{dataset_id}:{hashlib.sha256(uploaded_file_contents).hexdigest()}"
+    # Previews read from GitHub, so they share the limit on concurrent work against GitHub with uploads
+    try:
+        async with upload_admission.slot():
+            return await run_in_threadpool(
+                crud.preview_data_dictionary,
+                dataset_id=dataset_id,
+                uploaded_dict=uploaded_dict,
+                preview_key=preview_key,
+                validation_warnings=validation_warnings,
+            )
+    except AdmissionRejectedError as e:
+        return JSONResponse(
+            status_code=503,
+            content=FailedUpload(error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except crud.UploadError as e:
         return JSONResponse(
             status_code=400, content=FailedUpload(error=str(e)).model_dump()
         )
 
-    if file_exists:
-        commit_body = "Update participants.json"
 
-        if not utils.only_annotation_changes(
-            current_content_dict, uploaded_dict
-        ):
-            upload_warnings.append(
-                "The uploaded data dictionary may contain changes that are not related to Neurobagel annotations."
-            )
-            commit_body += (
-                "\n- includes changes unrelated to Neurobagel annotations"
-            )
-        # TODO: See if we actually need this check - it seems redundant with a subsequent check which compares
-        # the actual existing and uploaded JSON contents after having matched indentation (new_content_json == current_content_json)
-        #
-        # Compare dictionaries directly to check for identical contents (ignoring formatting and item order)
-        if current_content_dict == uploaded_dict:
-            upload_warnings.append(
-                "The (unformatted) dictionary contents of the uploaded JSON file are the same as the existing JSON file."
-            )
+@router.put(
+    "/upload-files",
+    response_model=Union[SuccessfulUpload, SuccessfulUploadWithWarnings],
+    responses={
+        400: {"model": FailedUpload},
+        409: {"model": FailedUpload},
+        413: {"model": FailedUpload},
+        415: {"model": FailedUpload},
+        429: {"model": FailedUpload},
+        503: {"model": FailedUpload},
+    },
+)
+async def upload_files(
+    dataset_id: str,
+    data_dictionaries: Annotated[list[UploadFile], File()],
+    paths: Annotated[list[str], Form()],
+    changes_summary: Annotated[str, Form()],
+    name: Annotated[str, Form()],
+    email: Annotated[str, Form()],
+    affiliation: Annotated[str | None, Form()] = None,
+    gh_username: Annotated[str | None, Form()] = None,
+):
+    """
+    Upload several data dictionaries to a dataset at once (e.g., participants.json and the data dictionaries of phenotype files),
+    where the data dictionary at each position is uploaded to the path at the same position in paths.
+    All the data dictionaries are validated (reporting the errors of every file together), and all of them are committed in a single commit of a single pull request.
+    """
+    crud.apply_dataset_index_changes()
+    if crud.dataset_index.is_known_missing(dataset_id):
+        return JSONResponse(
+            status_code=400,
+            content=FailedUpload(
+                error=crud.UNKNOWN_DATASET_MESSAGE
+            ).model_dump(),
+        )
+
+    if len(paths) != len(data_dictionaries):
+        error = "Each uploaded data dictionary must have exactly one path."
+    elif len(paths) > utils.MAX_FILES_PER_UPLOAD:
+        error = f"At most {utils.MAX_FILES_PER_UPLOAD} data dictionaries can be uploaded together."
+    elif len(set(paths)) != len(paths):
+        error = "Each path can only be uploaded to once."
+    elif invalid_paths := [
+        path
+        for path in paths
+        if not utils.DATA_DICTIONARY_PATH_PATTERN.fullmatch(path)
+    ]:
+        error = (
+            f"Data dictionaries cannot be uploaded to {', '.join(invalid_paths)}. "
+            "Data dictionaries can only be uploaded to participants.json or phenotype/<name>.json."
+        )
+    else:
+        error = None
+    if error is not None:
+        return JSONResponse(
+            status_code=400, content=FailedUpload(error=error).model_dump()
+        )
+
+    await run_in_threadpool(rate_limit.limit_contributor, email, gh_username)
+
+    contributor = Contributor(
+        name=name,
+        email=email,
+        affiliation=affiliation,
+        gh_username=gh_username,
+        changes_summary=utils.convert_literal_newlines(changes_summary),
+    )
 
-        # Match indentation
+    uploaded_dicts = []
+    dedup_digest = hashlib.sha256()
+    for path, data_dictionary in zip(paths, data_dictionaries):
         try:
-            current_indent_char, current_indent_level = utils.get_indentation(
-                current_content_json
-            )
-            current_newline_char, is_multiline = utils.get_newline_info(
-                current_content_json
+            # Each file may be sent compressed, and is decompressed up to a size limit
+            uploaded_file_contents = decompress_file_part(
+                await data_dictionary.read()
             )
-            new_content_json = utils.dict_to_formatted_json(
-                data_dict=uploaded_dict,
-                indent_char=current_indent_char,
-                indent_num=current_indent_level,
-                newline_char=current_newline_char,
-                multiline=is_multiline,
-            )
-        except ValueError as e:
+        except DecompressionError as e:
             return JSONResponse(
-                status_code=400,
-                content=FailedUpload(error=str(e)).model_dump(),
+                status_code=e.status_code,
+                content=FailedUpload(error=f"{path}: {e}").model_dump(),
             )
-
-        # NOTE: Comparing base64 strings doesn't seem to be sufficient for detecting changes. Might be because of differences in encoding?
-        # So, we'll compare the JSON strings instead (we do this instead of comparing the dictionaries directly to be able to detect changes in indentation, etc.).
-        if new_content_json == current_content_json:
+        try:
+            uploaded_dicts.append(
+                utils.load_json_bytes(uploaded_file_contents)
+            )
+        except json.JSONDecodeError:
             return JSONResponse(
                 status_code=400,
                 content=FailedUpload(
-                    error="The content selected for upload is the same as in the target file."
+                    error=f"{path}: The uploaded file is not a valid JSON file."
                 ).model_dump(),
             )
-    else:
-        commit_body = "Add participants.json"
-        new_content_json = json.dumps(uploaded_dict, indent=4)
-
-    # Create a new branch to commit the data dictionary to
-    branch_name = utils.create_random_branch_name(contributor.gh_username)
-    repo.create_git_ref(
-        ref=f"refs/heads/{branch_name}",
-        sha=repo.get_branch(default_branch).commit.sha,
+        dedup_digest.update(
+            hashlib.sha256(
+                path.encode() + b"\0" + uploaded_file_contents
+            ).digest()
+        )
+
+    dedup_key = crud.upload_dedup_key(
+        "upload-files", dataset_id, contributor, dedup_digest.hexdigest()
     )
+    if (existing_pr_url := crud.shared_cache.get(dedup_key)) is not None:
+        return SuccessfulUploadWithWarnings(
+            pull_request_url=existing_pr_url,
+            warnings=[crud.DUPLICATE_UPLOAD_WARNING],
+        )
 
-    # Commit uploaded data dictionary to the new branch, and open a PR
-    commit_message = utils.create_commit_message(
-        contributor=contributor, commit_body=commit_body
+    # Validate every uploaded data dictionary (so the errors of all files are reported together) before doing any work against GitHub.
+    # The files are validated concurrently in the threadpool, so a large batch does not block the event loop.
+    outcomes = await asyncio.gather(
+        *(
+            run_in_threadpool(_validate_uploaded_file, uploaded_dict)
+            for uploaded_dict in uploaded_dicts
+        )
     )
+    results, errors, schema_errors = [], [], []
+    for path, (validation_warnings, error) in zip(paths, outcomes):
+        if error is None:
+            results.append(validation_warnings)
+            continue
+        errors.append(f"{path}: {error}")
+        schema_errors.extend(get_schema_error_details(error, file=path) or [])
+    if errors:
+        return JSONResponse(
+            status_code=400,
+            content=FailedUpload(
+                error="\n\n".join(errors),
+                schema_errors=(
+                    schema_errors[: utils.VALIDATION_MAX_ERRORS] or None
+                ),
+            ).model_dump(),
+        )
+
     try:
-        if file_exists:
-            repo.update_file(
-                current_file.path,
-                commit_message,
-                new_content_json,
-                current_file.sha,
-                branch=branch_name,
+        async with upload_admission.slot():
+            return await run_in_threadpool(
+                crud.upload_data_dictionaries,
+                dataset_id=dataset_id,
+                uploaded_files=[
+                    crud.UploadedFile(
+                        path=path,
+                        data_dict=uploaded_dict,
+                        validation_warnings=validation_warnings,
+                    )
+                    for path, uploaded_dict, validation_warnings in zip(
+                        paths, uploaded_dicts, results
+                    )
+                ],
+                contributor=contributor,
+                dedup_key=dedup_key,
             )
-        else:
-            repo.create_file(
-                "participants.json",
-                commit_message,
-                new_content_json,
-                branch=branch_name,
-            )
-
-        pr_body = utils.create_pull_request_body(
-            contributor=contributor, commit_body=commit_body
+    except AdmissionRejectedError as e:
+        return JSONResponse(
+            status_code=503,
+            content=FailedUpload(error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except crud.UploadConflictError as e:
+        return JSONResponse(
+            status_code=409, content=FailedUpload(error=str(e)).model_dump()
         )
-        pr = repo.create_pull(
-            base=default_branch,
-            head=branch_name,
-            # Get the first line of the commit body as the PR title
-            title=commit_body.splitlines()[0],
-            body=pr_body,
+    except crud.UploadError as e:
+        return JSONResponse(
+            status_code=400, content=FailedUpload(error=str(e)).model_dump()
         )
-    except GithubException as e:
-        # TODO: Delete the branch if the commit or PR creation fails?
+
+
+@router.get(
+    "/{dataset_id}/dictionary",
+    response_model=DataDictionaryDetails,
+    responses={
+        200: {
+            "description": "The raw participants.json file, or its details if formatting or validation was requested"
+        },
+        304: {"description": "The file matches the ETag in If-None-Match"},
+        400: {"model": FailedUpload},
+        404: {"model": FailedUpload},
+        429: {"model": FailedUpload},
+        503: {"model": FailedUpload},
+    },
+)
+async def get_data_dictionary(
+    request: Request,
+    dataset_id: str,
+    formatting: bool = False,
+    validation: bool = False,
+):
+    """
+    Get the participants.json file on the default branch of a dataset, as its raw bytes with a strong ETag derived from the blob SHA,
+    so that a client can revalidate its copy with If-None-Match. The file is served from a cache that is revalidated against GitHub.
+
+    If formatting or validation is true, the file is instead returned as JSON, with the formatting style that uploads to the dataset
+    are formatted to match and/or the result of validating the file against the current data dictionary validation.
+    """
+    crud.apply_dataset_index_changes()
+    if crud.dataset_index.is_known_missing(dataset_id):
         return JSONResponse(
             status_code=400,
             content=FailedUpload(
-                error=f"Something went wrong when updating or creating participants.json in {repo.html_url}. {e.status}: {e.data['message']}"
+                error=crud.UNKNOWN_DATASET_MESSAGE
             ).model_dump(),
         )
 
-    if upload_warnings:
-        return SuccessfulUploadWithWarnings(
-            pull_request_url=pr.html_url, warnings=upload_warnings
+    try:
+        current_file = await run_in_threadpool(
+            crud.get_current_data_dictionary, dataset_id
         )
-    return SuccessfulUpload(pull_request_url=pr.html_url)
+    except crud.UploadError as e:
+        return JSONResponse(
+            status_code=400, content=FailedUpload(error=str(e)).model_dump()
+        )
+    if current_file is None:
+        return JSONResponse(
+            status_code=404,
+            content=FailedUpload(
+                error=f"The dataset does not have a {crud.PARTICIPANTS_FILE} file."
+            ).model_dump(),
+        )
+
+    # Each combination of details is a different representation of the file, so needs its own strong ETag
+    # (and validation results also depend on the version of the validation)
+    etag_parts = [current_file.sha]
+    if formatting:
+        etag_parts.append("formatting")
+    if validation:
+        etag_parts.append(f"validation.{audit.VALIDATOR_FINGERPRINT}")
+    # Clients must revalidate before reusing their copy, since the file changes whenever a pull request is merged
+    headers = {
+        "ETag": f'"{"-".join(etag_parts)}"',
+        "Cache-Control": "no-cache",
+    }
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if not (formatting or validation):
+        return Response(
+            content=current_file.content,
+            media_type="application/json",
+            headers=headers,
+        )
+    # Validation is CPU-bound, so it is run in a worker thread
+    details = await run_in_threadpool(
+        crud.describe_data_dictionary, current_file, formatting, validation
+    )
+    return JSONResponse(content=details.model_dump(), headers=headers)
+
+
+@router.get("/coverage", responses={429: {"model": FailedUpload}})
+async def get_coverage():
+    """
+    Get how many datasets annotate each concept, and with which variable types and terms, according to the local mirror
+    of every dataset's participants.json (which is only kept when the mirror is synced, see NB_UPLOADER_API_MIRROR_SYNC_INTERVAL).
+    Only the files that changed since the last request are summarized again.
+    """
+    await run_in_threadpool(coverage_statistics.refresh, mirror)
+    return coverage_statistics.report()
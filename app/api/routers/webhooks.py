@@ -0,0 +1,79 @@
+from fastapi import APIRouter, BackgroundTasks, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from .. import utility as utils
+from .. import webhooks
+from ..models import FailedUpload
+
+# NOTE: Unlike the other openneuro routes, webhooks are not rate limited by client,
+# since every delivery comes from GitHub and is authenticated by its signature
+router = APIRouter(prefix="/openneuro/webhooks", tags=["webhooks"])
+
+
+@router.post(
+    "/github",
+    responses={
+        400: {"model": FailedUpload},
+        401: {"model": FailedUpload},
+        404: {"model": FailedUpload},
+    },
+)
+async def github_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    x_github_event: str = Header(),
+    x_github_delivery: str | None = Header(default=None),
+    x_hub_signature_256: str | None = Header(default=None),
+):
+    """
+    Receive a GitHub webhook delivery for the OpenNeuroDatasets-JSONLD organization and update the affected caches.
+    """
+    if not utils.WEBHOOK_SECRET:
+        return JSONResponse(
+            status_code=404,
+            content=FailedUpload(
+                error="Webhooks are not enabled on this server."
+            ).model_dump(),
+        )
+    body = await request.body()
+    if not webhooks.verify_signature(
+        utils.WEBHOOK_SECRET, body, x_hub_signature_256
+    ):
+        return JSONResponse(
+            status_code=401,
+            content=FailedUpload(
+                error="The webhook signature is missing or invalid."
+            ).model_dump(),
+        )
+    try:
+        payload = utils.load_json_bytes(body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return JSONResponse(
+            status_code=400,
+            content=FailedUpload(
+                error="The webhook payload is not a JSON object."
+            ).model_dump(),
+        )
+
+    if utils.WEBHOOK_RECORD_PATH:
+        await run_in_threadpool(
+            webhooks.record_delivery,
+            utils.WEBHOOK_RECORD_PATH,
+            x_github_event,
+            x_github_delivery,
+            body,
+        )
+    # Updating the mirror and the shared cache touches files, so is run in a worker thread
+    result = await run_in_threadpool(
+        webhooks.handle_event, x_github_event, payload
+    )
+    for task in result.background:
+        background_tasks.add_task(task)
+    return {
+        "event": x_github_event,
+        "delivery": x_github_delivery,
+        "actions": result.actions,
+    }
@@ -0,0 +1,106 @@
+"""
+Responses for routes whose content only depends on the path prefix the app is served under (root_path),
+e.g., the welcome page and the interactive docs.
+
+Each body is rendered once per root_path and then served from memory with a strong ETag and Cache-Control header,
+so that conditional requests are answered with a 304 Not Modified, and large bodies are served pre-compressed
+to clients that accept gzip.
+"""
+
+import gzip
+import hashlib
+from dataclasses import dataclass
+from typing import Callable
+
+from fastapi import Request, Response
+
+# Bodies smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = 1024
+
+
+@dataclass
+class RenderedBody:
+    body: bytes
+    etag: str
+    gzip_body: bytes | None = None
+    gzip_etag: str | None = None
+
+
+def accepts_gzip(request: Request) -> bool:
+    """Return whether the client accepts gzip-encoded responses, according to its Accept-Encoding header."""
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.strip().removeprefix("q=")
+            try:
+                return not params or float(quality) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Return whether an If-None-Match header matches an ETag (using weak comparison, as required for If-None-Match)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    )
+
+
+class StaticResponse:
+    """
+    A response body that is rendered once per root_path by the given function,
+    and served with validators and caching headers.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[str], str | bytes],
+        media_type: str,
+        max_age: int,
+    ):
+        self.render = render
+        self.media_type = media_type
+        self.cache_control = f"public, max-age={max_age}"
+        self._rendered: dict[str, RenderedBody] = {}
+
+    def _render(self, root_path: str) -> RenderedBody:
+        body = self.render(root_path)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        rendered = RenderedBody(body=body, etag=f'"{digest}"')
+        if len(body) >= COMPRESSION_MIN_SIZE:
+            # mtime=0 keeps the compressed body (and so its ETag) the same across restarts
+            rendered.gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+            # Each encoding of the body is a different representation, so needs its own strong ETag
+            rendered.gzip_etag = f'"{digest}-gzip"'
+        return rendered
+
+    def clear(self) -> None:
+        self._rendered.clear()
+
+    def __call__(self, request: Request) -> Response:
+        root_path = request.scope.get("root_path", "")
+        if (rendered := self._rendered.get(root_path)) is None:
+            rendered = self._rendered[root_path] = self._render(root_path)
+
+        body, etag = rendered.body, rendered.etag
+        headers = {"Cache-Control": self.cache_control}
+        if rendered.gzip_body is not None:
+            headers["Vary"] = "Accept-Encoding"
+            if accepts_gzip(request):
+                body, etag = rendered.gzip_body, rendered.gzip_etag
+                headers["Content-Encoding"] = "gzip"
+        headers["ETag"] = etag
+
+        if etag_matches(request, etag):
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+        return Response(
+            content=body, media_type=self.media_type, headers=headers
+        )
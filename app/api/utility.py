@@ -1,15 +1,226 @@
+import hashlib
 import json
 import os
 import random
+import re
 import string
+import tempfile
 from typing import Union
 
+import orjson
+
 from .models import Contributor
 
 ROOT_PATH = os.environ.get("NB_UPLOADER_API_ROOT_PATH", "")
 # TODO: Error out when these variables are not set?
 APP_ID = os.environ.get("NB_BOT_ID")
 APP_PRIVATE_KEY_PATH = os.environ.get("NB_BOT_KEY_PATH")
+# Base URL of the GitHub REST API, which can be overridden to point to a local stand-in (e.g., for benchmarking)
+GITHUB_API_URL = os.environ.get("NB_GITHUB_API_URL", "https://api.github.com")
+# Settings for the pool of keep-alive connections shared by all GitHub API requests in a worker (see app/api/github_client.py)
+GITHUB_POOL_SIZE = int(os.environ.get("NB_GITHUB_POOL_SIZE", 10))
+GITHUB_TCP_KEEPALIVE = (
+    os.environ.get("NB_GITHUB_TCP_KEEPALIVE", "true").lower() == "true"
+)
+GITHUB_CONNECT_TIMEOUT = float(os.environ.get("NB_GITHUB_CONNECT_TIMEOUT", 5))
+GITHUB_READ_TIMEOUT = float(os.environ.get("NB_GITHUB_READ_TIMEOUT", 15))
+# Retries of failed GitHub API requests, with exponential backoff between attempts
+# (backoff_factor * 2^(attempt - 1) seconds, plus up to backoff_factor seconds of random jitter, capped at backoff_max)
+GITHUB_MAX_RETRIES = int(os.environ.get("NB_GITHUB_MAX_RETRIES", 3))
+GITHUB_BACKOFF_FACTOR = float(os.environ.get("NB_GITHUB_BACKOFF_FACTOR", 0.5))
+GITHUB_BACKOFF_MAX = float(os.environ.get("NB_GITHUB_BACKOFF_MAX", 8))
+# After this many consecutive failed GitHub API requests, requests are rejected immediately
+# until a single probe request succeeds, which is attempted after the reset timeout (in seconds)
+GITHUB_BREAKER_FAILURE_THRESHOLD = int(
+    os.environ.get("NB_GITHUB_BREAKER_FAILURE_THRESHOLD", 5)
+)
+GITHUB_BREAKER_RESET_TIMEOUT = float(
+    os.environ.get("NB_GITHUB_BREAKER_RESET_TIMEOUT", 30)
+)
+# Maximum number of uploads working against GitHub at once (across all worker processes), and how many further uploads
+# may wait for a slot in each worker (and for how many seconds) before being rejected with a 503
+MAX_CONCURRENT_UPLOADS = int(
+    os.environ.get("NB_UPLOADER_API_MAX_CONCURRENT_UPLOADS", 8)
+)
+UPLOAD_QUEUE_SIZE = int(
+    os.environ.get("NB_UPLOADER_API_UPLOAD_QUEUE_SIZE", 32)
+)
+UPLOAD_QUEUE_TIMEOUT = float(
+    os.environ.get("NB_UPLOADER_API_UPLOAD_QUEUE_TIMEOUT", 30)
+)
+# Directory of the lock files that hold the upload slots shared by all worker processes
+UPLOAD_SLOT_PATH = os.environ.get(
+    "NB_UPLOADER_API_UPLOAD_SLOT_PATH",
+    os.path.join(tempfile.gettempdir(), "nb_uploader_api_upload_slots"),
+)
+# How long (in seconds) an upload waits for another upload to the same dataset to finish before being rejected
+DATASET_LOCK_TIMEOUT = float(
+    os.environ.get("NB_UPLOADER_API_DATASET_LOCK_TIMEOUT", 30)
+)
+# Directory of the lock files that serialize uploads to the same dataset across all worker processes
+DATASET_LOCK_PATH = os.environ.get(
+    "NB_UPLOADER_API_DATASET_LOCK_PATH",
+    os.path.join(tempfile.gettempdir(), "nb_uploader_api_locks"),
+)
+# Number of server worker processes, and whether to warm up state shared by the workers before they start
+WORKERS = int(os.environ.get("NB_UPLOADER_API_WORKERS", 1))
+PRELOAD = os.environ.get("NB_UPLOADER_API_PRELOAD", "false").lower() == "true"
+# Settings of the HTTP server run by the production entry point (see app/server.py):
+# - the profile: "tuned" (default) applies the settings below, "uvicorn" runs with uvicorn's defaults (for comparison)
+# - the event loop ("uvloop" or "asyncio") and HTTP parser ("httptools" or "h11"), by default the faster one that is installed
+# - how many pending connections the socket queues, and how many connections and requests are handled at once
+#   before new ones are answered with a 503 (0, the default, for no limit). Idle keep-alive connections count towards
+#   the limit, so it must exceed the connections a proxy keeps open to each worker (see app/server.py)
+# - how long (in seconds) idle keep-alive connections are kept open, which should exceed the idle timeout of any proxy
+#   in front of the API so that the proxy never reuses a connection the server is closing
+# - how long (in seconds) a shutdown waits for requests in progress (e.g., uploads waiting on GitHub) to finish
+SERVER_PROFILE = os.environ.get("NB_UPLOADER_API_SERVER_PROFILE", "tuned")
+SERVER_LOOP = os.environ.get("NB_UPLOADER_API_SERVER_LOOP")
+SERVER_HTTP = os.environ.get("NB_UPLOADER_API_SERVER_HTTP")
+SERVER_BACKLOG = int(os.environ.get("NB_UPLOADER_API_SERVER_BACKLOG", 2048))
+SERVER_LIMIT_CONCURRENCY = int(
+    os.environ.get("NB_UPLOADER_API_SERVER_LIMIT_CONCURRENCY", 0)
+)
+SERVER_KEEP_ALIVE_TIMEOUT = int(
+    os.environ.get("NB_UPLOADER_API_SERVER_KEEP_ALIVE_TIMEOUT", 75)
+)
+SERVER_GRACEFUL_SHUTDOWN_TIMEOUT = int(
+    os.environ.get("NB_UPLOADER_API_SERVER_GRACEFUL_SHUTDOWN_TIMEOUT", 90)
+)
+# Cache for data derived from GitHub (see app/api/cache.py): "sqlite" (shared between worker processes) or "memory"
+CACHE_BACKEND = os.environ.get("NB_UPLOADER_API_CACHE_BACKEND", "sqlite")
+# Path to the SQLite file used by the "sqlite" cache backend
+CACHE_PATH = os.environ.get(
+    "NB_UPLOADER_API_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "nb_uploader_api_cache.sqlite3"),
+)
+# Bounds on the number of cache entries and their total size, beyond which least-recently-used entries are evicted
+CACHE_MAX_ENTRIES = int(
+    os.environ.get("NB_UPLOADER_API_CACHE_MAX_ENTRIES", 10_000)
+)
+CACHE_MAX_BYTES = int(
+    os.environ.get("NB_UPLOADER_API_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+)
+# How often (in seconds) the in-memory index of dataset repositories is refreshed from GitHub,
+# the minimum time between refreshes triggered by lookups of unknown dataset IDs,
+# and how long an ID confirmed not to exist is rejected without checking GitHub again
+DATASET_INDEX_REFRESH_INTERVAL = float(
+    os.environ.get("NB_UPLOADER_API_DATASET_INDEX_REFRESH_INTERVAL", 300)
+)
+DATASET_INDEX_MIN_REFRESH_INTERVAL = float(
+    os.environ.get("NB_UPLOADER_API_DATASET_INDEX_MIN_REFRESH_INTERVAL", 30)
+)
+DATASET_INDEX_MISSING_TTL = float(
+    os.environ.get("NB_UPLOADER_API_DATASET_INDEX_MISSING_TTL", 300)
+)
+# How long (in seconds) clients may cache the welcome page, interactive docs and OpenAPI schema before revalidating them
+STATIC_MAX_AGE = int(os.environ.get("NB_UPLOADER_API_STATIC_MAX_AGE", 300))
+# Directory of the on-disk mirror of every dataset's participants.json (see app/api/mirror.py)
+MIRROR_PATH = os.environ.get(
+    "NB_UPLOADER_API_MIRROR_PATH",
+    os.path.join(tempfile.gettempdir(), "nb_uploader_api_mirror"),
+)
+# How often (in seconds) the server syncs the mirror in the background (0 disables background syncing),
+# and how many repositories are checked against GitHub at once during a sync
+MIRROR_SYNC_INTERVAL = float(
+    os.environ.get("NB_UPLOADER_API_MIRROR_SYNC_INTERVAL", 0)
+)
+MIRROR_SYNC_CONCURRENCY = int(
+    os.environ.get("NB_UPLOADER_API_MIRROR_SYNC_CONCURRENCY", 8)
+)
+# Whether uploads read the existing participants.json from the mirror (when it is up to date) instead of from GitHub
+READ_FROM_MIRROR = (
+    os.environ.get("NB_UPLOADER_API_READ_FROM_MIRROR", "false").lower()
+    == "true"
+)
+
+# How often (in seconds) the server sweeps the dataset repositories for orphaned bot branches (0 disables sweeping),
+# how many branches are deleted per batch and how long to wait between batches,
+# and whether sweeps only report the branches they would delete
+BRANCH_SWEEP_INTERVAL = float(
+    os.environ.get("NB_UPLOADER_API_BRANCH_SWEEP_INTERVAL", 0)
+)
+BRANCH_SWEEP_BATCH_SIZE = int(
+    os.environ.get("NB_UPLOADER_API_BRANCH_SWEEP_BATCH_SIZE", 20)
+)
+BRANCH_SWEEP_BATCH_INTERVAL = float(
+    os.environ.get("NB_UPLOADER_API_BRANCH_SWEEP_BATCH_INTERVAL", 10)
+)
+BRANCH_SWEEP_DRY_RUN = (
+    os.environ.get("NB_UPLOADER_API_BRANCH_SWEEP_DRY_RUN", "false").lower()
+    == "true"
+)
+# Rate limits on the openneuro routes, as sustained requests per minute and maximum bursts of requests,
+# per client IP address and per contributor (email address and GitHub username) (a rate of 0 disables a limit),
+# and where the rate limit state is kept: "memory" (per worker process) or "sqlite" (shared by the workers, in CACHE_PATH)
+CLIENT_RATE_LIMIT = float(
+    os.environ.get("NB_UPLOADER_API_CLIENT_RATE_LIMIT", 60)
+)
+CLIENT_RATE_LIMIT_BURST = int(
+    os.environ.get("NB_UPLOADER_API_CLIENT_RATE_LIMIT_BURST", 60)
+)
+CONTRIBUTOR_RATE_LIMIT = float(
+    os.environ.get("NB_UPLOADER_API_CONTRIBUTOR_RATE_LIMIT", 10)
+)
+CONTRIBUTOR_RATE_LIMIT_BURST = int(
+    os.environ.get("NB_UPLOADER_API_CONTRIBUTOR_RATE_LIMIT_BURST", 20)
+)
+RATE_LIMIT_BACKEND = os.environ.get(
+    "NB_UPLOADER_API_RATE_LIMIT_BACKEND", "memory"
+)
+RATE_LIMIT_MAX_BUCKETS = int(
+    os.environ.get("NB_UPLOADER_API_RATE_LIMIT_MAX_BUCKETS", 100_000)
+)
+# How long (in seconds) upload previews are kept for repeat previews of the same file (while the default branch has not moved)
+PREVIEW_CACHE_TTL = float(
+    os.environ.get("NB_UPLOADER_API_PREVIEW_CACHE_TTL", 600)
+)
+# How long (in seconds) the open pull request of a contributor (identified by their GitHub username) is remembered,
+# so that their follow-up uploads to the same dataset are committed onto its branch instead of opening a new pull request
+# (0 disables follow-up uploads)
+CONTRIBUTOR_PULL_REQUEST_TTL = float(
+    os.environ.get(
+        "NB_UPLOADER_API_CONTRIBUTOR_PULL_REQUEST_TTL", 7 * 24 * 60 * 60
+    )
+)
+# How long (in seconds) the current participants.json of a dataset served by /openneuro/{dataset_id}/dictionary is reused
+# before it is revalidated with a conditional request to GitHub
+DICTIONARY_CACHE_TTL = float(
+    os.environ.get("NB_UPLOADER_API_DICTIONARY_CACHE_TTL", 60)
+)
+# Largest size (in bytes) a compressed upload may decompress to, to protect against decompression bombs
+MAX_DECOMPRESSED_SIZE = int(
+    os.environ.get("NB_UPLOADER_API_MAX_DECOMPRESSED_SIZE", 50 * 1024 * 1024)
+)
+# Smallest response body (in bytes) that is gzip-compressed for clients that accept it, and the compression level used
+RESPONSE_COMPRESSION_MIN_SIZE = int(
+    os.environ.get("NB_UPLOADER_API_RESPONSE_COMPRESSION_MIN_SIZE", 1024)
+)
+RESPONSE_COMPRESSION_LEVEL = int(
+    os.environ.get("NB_UPLOADER_API_RESPONSE_COMPRESSION_LEVEL", 6)
+)
+# Secret used to verify the signatures of GitHub webhook deliveries (webhooks are disabled if unset),
+# and a directory to record received deliveries in for later replay (see app/api/webhooks.py)
+WEBHOOK_SECRET = os.environ.get("NB_UPLOADER_API_WEBHOOK_SECRET")
+WEBHOOK_RECORD_PATH = os.environ.get("NB_UPLOADER_API_WEBHOOK_RECORD_PATH")
+# Number of columns whose validation results are kept in memory (per worker), so that re-uploads of a
+# mostly unchanged data dictionary only revalidate the changed columns (0 disables the cache)
+VALIDATION_CACHE_SIZE = int(
+    os.environ.get("NB_UPLOADER_API_VALIDATION_CACHE_SIZE", 50_000)
+)
+# How data dictionaries are checked against the data dictionary schema: "jsonschema" (default),
+# or "pydantic" (a precompiled pydantic validator of the same models, which is faster for large data dictionaries)
+VALIDATION_ENGINE = os.environ.get(
+    "NB_UPLOADER_API_VALIDATION_ENGINE", "jsonschema"
+)
+# Largest number of schema errors listed in the response to an invalid data dictionary (one per invalid column)
+VALIDATION_MAX_ERRORS = int(
+    os.environ.get("NB_UPLOADER_API_VALIDATION_MAX_ERRORS", 100)
+)
+# Largest number of data dictionary files that can be uploaded together (to open a single pull request)
+MAX_FILES_PER_UPLOAD = int(
+    os.environ.get("NB_UPLOADER_API_MAX_FILES_PER_UPLOAD", 20)
+)
 
 APP_PRIVATE_KEY = None
 
@@ -22,6 +233,15 @@ def set_gh_credentials():
         APP_PRIVATE_KEY = f.read()
 
 
+# Paths in a dataset repository that data dictionaries can be uploaded to:
+# participants.json, and the data dictionaries of BIDS phenotype files
+DATA_DICTIONARY_PATH_PATTERN = re.compile(
+    r"participants\.json|phenotype/[A-Za-z0-9_-]+\.json"
+)
+# Names of the branches created by create_random_branch_name
+BOT_BRANCH_NAME_PATTERN = re.compile(r"(?:[A-Za-z0-9-]+/)?update-[a-z0-9]{6}")
+
+
 def create_random_branch_name(gh_username: str | None = None) -> str:
     """
     Generate a random branch name for a pull request in the format 'update-xxxxxx', or optionally,
@@ -39,6 +259,11 @@ def create_random_branch_name(gh_username: str | None = None) -> str:
     return branch_name
 
 
+def git_blob_sha(content: bytes) -> str:
+    """Return the SHA Git gives a blob with the given contents (e.g., to know the SHA of a committed file without fetching it)."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
 def create_commit_message(contributor: Contributor, commit_body: str) -> str:
     """Generate a commit message based on the auto-generated main commit body and available contributor info."""
     return (
@@ -82,6 +307,21 @@ def create_pull_request_body(
     )
 
 
+def create_follow_up_comment(
+    contributor: Contributor, commit_body: str
+) -> str:
+    """
+    Generate a pull request comment for a follow-up upload committed onto the contributor's open pull request,
+    based on the auto-generated commit message and the contributor's summary of the new changes.
+    """
+    return (
+        "### Follow-up changes (bot-generated):\n"
+        + f"{commit_body}\n\n"
+        + "### More details:\n"
+        + f"{contributor.changes_summary}"
+    )
+
+
 def extract_non_annotations(data_dict: dict) -> dict:
     """
     Return a data dictionary without Neurobagel annotations.
@@ -193,6 +433,42 @@ def get_newline_info(json_str: str) -> tuple[Union[str, None], bool]:
     return newline_char, multiline
 
 
+def get_formatting_sample(content: bytes, max_line_bytes: int = 1024) -> str:
+    """
+    Return a short excerpt of the raw contents of a JSON file that has the same indentation and newline characters
+    as the whole file, according to get_indentation and get_newline_info:
+    the start of the first line, its line ending, and the start of the second line.
+
+    This avoids decoding and splitting the whole file into lines just to detect its formatting.
+    """
+    first_newline = content.find(b"\n")
+    if first_newline == -1:
+        return content[:max_line_bytes].decode("utf-8", errors="ignore")
+    line_end = first_newline
+    if first_newline > 0 and content[first_newline - 1] == ord("\r"):
+        line_end -= 1
+    first_line_sample_end = min(line_end, max_line_bytes)
+    second_line_sample_end = first_newline + 1 + max_line_bytes
+    sample = (
+        content[:first_line_sample_end]
+        + content[line_end:second_line_sample_end]
+    )
+    return sample.decode("utf-8", errors="ignore")
+
+
+def load_json_bytes(content: bytes):
+    """
+    Parse JSON directly from bytes using orjson, without first decoding the bytes to a string.
+    Falls back to the standard library parser for valid inputs that orjson rejects (e.g., NaN or integers over 64 bits).
+
+    Raises json.JSONDecodeError if the content is not valid JSON.
+    """
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return json.loads(content)
+
+
 def replace_newline_characters(
     json_str: str, newline_char: Union[str, None]
 ) -> str:
@@ -0,0 +1,169 @@
+"""
+Controlled vocabularies that the TermURLs of a Neurobagel data dictionary are checked against.
+
+The vocabularies are bundled as JSON files in app/api/vocab/ and loaded once, at import time,
+into sets of known terms, so that checking a term is a single hash lookup.
+Each namespace of a vocabulary is either complete (every valid term is listed, e.g., the levels of a column about sex,
+or the curated SNOMED CT terms imported with `python -m app.cli import-vocabulary`) or open (only the namespace is known),
+in which case a term is checked against the format of the namespace's term IDs.
+Suggestions for an unrecognized term are only computed when a term is not found.
+"""
+
+import difflib
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import mappings
+
+VOCAB_DIR = Path(__file__).parent / "vocab"
+
+NAMESPACES = {
+    namespace.pf: namespace.url
+    for namespace in (
+        mappings.NB,
+        mappings.COGATLAS,
+        mappings.NCIT,
+        mappings.SNOMED,
+    )
+}
+
+# Expected format of the term IDs in namespaces whose terms are not all bundled
+TERM_ID_PATTERNS = {
+    mappings.SNOMED.pf: re.compile(r"\d+"),
+    mappings.NCIT.pf: re.compile(r"C\d+"),
+    mappings.COGATLAS.pf: re.compile(r"(tsk|trm)_\w+"),
+}
+
+
+@dataclass(frozen=True)
+class Vocabulary:
+    name: str
+    terms: frozenset
+    namespaces: frozenset
+    # Namespaces whose valid terms are all listed in terms
+    complete_namespaces: frozenset
+
+    def __contains__(self, term: str) -> bool:
+        if term in self.terms:
+            return True
+        prefix, _, term_id = term.partition(":")
+        if prefix not in self.namespaces or prefix in self.complete_namespaces:
+            return False
+        return (
+            prefix not in TERM_ID_PATTERNS
+            or TERM_ID_PATTERNS[prefix].fullmatch(term_id) is not None
+        )
+
+    def suggest(self, term: str) -> str | None:
+        """Return the closest known term (or namespace) to an unrecognized term, if any is close enough."""
+        if matches := difflib.get_close_matches(term, self.terms, n=1):
+            return matches[0]
+        prefix, separator, term_id = term.partition(":")
+        if separator and prefix not in self.namespaces:
+            if matches := difflib.get_close_matches(
+                prefix, self.namespaces, n=1
+            ):
+                return f"{matches[0]}:{term_id}"
+        return None
+
+
+def load_vocabulary(name: str) -> Vocabulary:
+    """Load a vocabulary from its bundled JSON file."""
+    vocab = json.loads((VOCAB_DIR / f"{name}.json").read_text())
+    return Vocabulary(
+        name=name,
+        terms=frozenset(vocab["terms"]),
+        namespaces=frozenset(vocab["namespaces"]),
+        complete_namespaces=frozenset(vocab["complete_namespaces"]),
+    )
+
+
+def import_terms(name: str, term_vocabulary: list[dict]) -> int:
+    """
+    Add the terms of a curated Neurobagel term vocabulary (a list of namespaces, each with a namespace_prefix
+    and its terms as id and name) to a bundled vocabulary file, marking each of its namespaces as complete.
+    Returns the number of terms imported. The bundled vocabularies are loaded at import time, so the API must be restarted.
+    """
+    vocab_file = VOCAB_DIR / f"{name}.json"
+    vocab = json.loads(vocab_file.read_text())
+    imported = 0
+    for namespace in term_vocabulary:
+        prefix = namespace["namespace_prefix"]
+        if prefix not in NAMESPACES:
+            raise ValueError(f"Unknown namespace prefix: {prefix!r}")
+        for term in namespace["terms"]:
+            vocab["terms"][f"{prefix}:{term['id']}"] = term["name"]
+            imported += 1
+        for key in ("namespaces", "complete_namespaces"):
+            vocab[key] = sorted({*vocab[key], prefix})
+    vocab["terms"] = dict(sorted(vocab["terms"].items()))
+    vocab_file.write_text(json.dumps(vocab, indent=4) + "\n")
+    return imported
+
+
+# The concepts a column can be about are the ones Neurobagel knows how to process (see mappings.py)
+CONCEPTS = Vocabulary(
+    name="concepts",
+    terms=frozenset(mappings.NEUROBAGEL.values()),
+    namespaces=frozenset([mappings.NB.pf]),
+    complete_namespaces=frozenset([mappings.NB.pf]),
+)
+FORMATS = load_vocabulary("formats")
+ASSESSMENTS = load_vocabulary("assessment")
+# The vocabularies of the levels of the categorical columns about each concept
+LEVELS = {
+    mappings.NEUROBAGEL["sex"]: load_vocabulary("sex"),
+    mappings.NEUROBAGEL["diagnosis"]: load_vocabulary("diagnosis"),
+    mappings.NEUROBAGEL["subject_group"]: load_vocabulary("subject_group"),
+}
+
+
+def to_curie(term: str) -> str:
+    """Shorten a full IRI in one of the known namespaces to its prefixed form (e.g., nb:Age)."""
+    if "://" in term:
+        for prefix, url in NAMESPACES.items():
+            if term.startswith(url):
+                return f"{prefix}:{term.removeprefix(url)}"
+    return term
+
+
+def get_unrecognized_terms(data_dict: dict) -> list[str]:
+    """
+    Return a description of every TermURL in the annotations of a data dictionary
+    that is not in the controlled vocabulary expected for it,
+    with a suggestion for the intended term where a close match exists.
+
+    The data dictionary is expected to already have been validated against the data dictionary schema.
+    """
+    unrecognized = []
+
+    def check(column: str, key: str, term_url: str, vocabulary: Vocabulary):
+        if to_curie(term_url) in vocabulary:
+            return
+        description = f"'{column}' {key}: '{term_url}'"
+        if suggestion := vocabulary.suggest(to_curie(term_url)):
+            description += f" (did you mean '{suggestion}'?)"
+        unrecognized.append(description)
+
+    for column, content in data_dict.items():
+        annotations = content.get("Annotations")
+        if annotations is None:
+            continue
+        about = to_curie(annotations["IsAbout"]["TermURL"])
+        check(column, "IsAbout", annotations["IsAbout"]["TermURL"], CONCEPTS)
+        if (term := annotations.get("Format")) is not None:
+            check(column, "Format", term["TermURL"], FORMATS)
+        if (term := annotations.get("IsPartOf")) is not None:
+            check(column, "IsPartOf", term["TermURL"], ASSESSMENTS)
+        if (levels := annotations.get("Levels")) and about in LEVELS:
+            for value, term in levels.items():
+                check(
+                    column,
+                    f"Levels['{value}']",
+                    term["TermURL"],
+                    LEVELS[about],
+                )
+
+    return unrecognized
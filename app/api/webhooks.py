@@ -0,0 +1,264 @@
+"""
+Handling of GitHub webhook events from the OpenNeuroDatasets-JSONLD organization, which keep the caches of the API
+up to date as repositories change, instead of waiting for them to expire (so they can be given long lifetimes):
+- push: updates the push time of the repository in the dataset index (so the next branch sweep checks it),
+  and for pushes to the default branch, forgets the dataset state read by the last upload (and the cached participants.json,
+  if it was touched) and updates the mirror (without any requests to GitHub if participants.json was not touched,
+  which is only known when the payload lists all the pushed commits)
+- pull_request (closed): forgets the upload that opened the pull request (so an identical resubmission opens a new one)
+  and has the next branch sweep check the repository for the pull request's now orphaned branch
+- repository (created, deleted, renamed, transferred, or edited to change its default branch):
+  updates the dataset index of this worker, tells the other workers to refresh theirs, and updates the mirror
+
+Deliveries are verified with the webhook secret (see verify_signature). Deliveries can be recorded to files,
+and recorded deliveries (or those downloaded from the webhook's "Recent Deliveries" on GitHub)
+can be replayed with `python -m app.cli replay-webhooks`.
+"""
+
+import datetime
+import hashlib
+import hmac
+import logging
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import orjson
+from github.GithubException import GithubException
+
+from . import branch_reaper, crud, github_client, metrics
+from .mirror import PARTICIPANTS_FILE, mirror
+
+WEBHOOK_EVENTS = metrics.Counter(
+    "nb_uploader_webhook_events_total",
+    "Number of GitHub webhook deliveries handled, by event",
+    labelled=True,
+)
+
+# GitHub lists at most this many of the pushed commits in a push event,
+# so the file changes of a push with more commits cannot be read from the payload
+PUSH_PAYLOAD_MAX_COMMITS = 20
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EventResult:
+    """
+    The cache updates made for a webhook event, and the updates that need requests to GitHub
+    (to be run in the background, after responding to the delivery).
+    """
+
+    actions: list[str] = field(default_factory=list)
+    background: list[Callable[[], None]] = field(
+        default_factory=list, repr=False
+    )
+
+
+def sign(secret: str, body: bytes) -> str:
+    """Return the X-Hub-Signature-256 header GitHub sends with a delivery of the given body."""
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Return whether the X-Hub-Signature-256 header of a delivery matches its body."""
+    if not signature:
+        return False
+    return hmac.compare_digest(sign(secret, body), signature)
+
+
+def _pushed_at(repository: dict) -> str | None:
+    """
+    Return the push time of a repository in the format of the REST API (as in the dataset index).
+    Push events give the time as a Unix timestamp, while other events give it as an ISO 8601 string.
+    """
+    pushed_at = repository.get("pushed_at")
+    if isinstance(pushed_at, (int, float)):
+        return datetime.datetime.fromtimestamp(
+            pushed_at, tz=datetime.timezone.utc
+        ).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return pushed_at
+
+
+def _index_metadata(repository: dict) -> dict:
+    return {
+        "name": repository["name"],
+        "default_branch": repository["default_branch"],
+        "html_url": repository["html_url"],
+        "pushed_at": _pushed_at(repository),
+    }
+
+
+def _update_mirror(repository: dict) -> None:
+    try:
+        mirror.update(
+            github_client.get_installation_github(crud.DATASETS_ORG),
+            crud.DATASETS_ORG,
+            repository["name"],
+            default_branch=repository["default_branch"],
+            html_url=repository["html_url"],
+        )
+    except (GithubException, github_client.GitHubUnavailableError) as e:
+        # The repository is synced again by the next full sync
+        logger.warning(
+            f"Could not update the mirror of {repository['full_name']}: {e}"
+        )
+
+
+def _schedule_mirror_update(result: EventResult, repository: dict) -> None:
+    # Only an existing mirror is kept up to date, since an empty mirror is only filled by a full sync
+    if mirror.index_path.exists():
+        result.background.append(lambda: _update_mirror(repository))
+        result.actions.append(f"mirror update of {repository['name']}")
+
+
+def _touches_participants_file(payload: dict) -> bool:
+    """
+    Return whether a push may have changed participants.json,
+    which is assumed when the payload may not list all the pushed commits.
+    """
+    commits = payload.get("commits", [])
+    if len(commits) >= PUSH_PAYLOAD_MAX_COMMITS:
+        return True
+    return any(
+        PARTICIPANTS_FILE in commit.get(change, [])
+        for commit in commits
+        for change in ("added", "modified", "removed")
+    )
+
+
+def handle_push(payload: dict, result: EventResult) -> None:
+    repository = payload["repository"]
+    name = repository["name"]
+    crud.dataset_index.upsert(_index_metadata(repository))
+    result.actions.append(f"index update of {name}")
+
+    if payload["ref"] != f"refs/heads/{repository['default_branch']}":
+        return
+    if crud.forget_dataset_state(name):
+        result.actions.append(f"dataset state of {name} forgotten")
+    changes_participants_file = (
+        payload.get("forced")
+        or payload.get("deleted")
+        or _touches_participants_file(payload)
+    )
+    if changes_participants_file:
+        crud.forget_current_data_dictionary(name)
+        result.actions.append(f"current data dictionary of {name} forgotten")
+    if not mirror.index_path.exists():
+        return
+    if changes_participants_file or not mirror.advance_head(
+        name, payload["before"], payload["after"]
+    ):
+        _schedule_mirror_update(result, repository)
+    else:
+        result.actions.append(f"mirror head of {name} advanced")
+
+
+def handle_pull_request(payload: dict, result: EventResult) -> None:
+    if payload["action"] != "closed":
+        return
+    pull_request_url = payload["pull_request"]["html_url"]
+    if crud.forget_pull_request(pull_request_url):
+        result.actions.append(f"upload of {pull_request_url} forgotten")
+    branch_reaper.forget_clean_repo(payload["repository"]["full_name"])
+    result.actions.append(
+        f"branch sweep of {payload['repository']['name']} scheduled"
+    )
+
+
+def handle_repository(payload: dict, result: EventResult) -> None:
+    action = payload["action"]
+    repository = payload["repository"]
+    name = repository["name"]
+    changes = payload.get("changes", {})
+
+    removed = []
+    if action in ("deleted", "transferred"):
+        removed.append(name)
+    elif action == "renamed":
+        removed.append(changes["repository"]["name"]["from"])
+    elif not (
+        action == "created"
+        or (action == "edited" and "default_branch" in changes)
+    ):
+        return
+
+    for old_name in removed:
+        crud.dataset_index.remove(old_name)
+        crud.forget_dataset_state(old_name)
+        result.actions.append(f"{old_name} removed from index")
+        if mirror.index_path.exists() and mirror.remove(old_name):
+            result.actions.append(f"{old_name} removed from mirror")
+    if action in ("created", "renamed", "edited"):
+        crud.dataset_index.upsert(_index_metadata(repository))
+        crud.forget_dataset_state(name)
+        result.actions.append(f"index update of {name}")
+        _schedule_mirror_update(result, repository)
+    crud.publish_dataset_index_change()
+
+
+HANDLERS = {
+    "push": handle_push,
+    "pull_request": handle_pull_request,
+    "repository": handle_repository,
+}
+
+
+def handle_event(event: str, payload: dict) -> EventResult:
+    """
+    Apply the cache updates for a webhook event, returning the updates made and those still to be run in the background.
+    Events of other types or from repositories outside of the organization are ignored.
+    """
+    result = EventResult()
+    handler = HANDLERS.get(event)
+    repository = payload.get("repository") or {}
+    if (
+        handler is None
+        or repository.get("owner", {}).get("login") != crud.DATASETS_ORG
+    ):
+        WEBHOOK_EVENTS.inc(event="ignored")
+        return result
+    WEBHOOK_EVENTS.inc(event=event)
+    handler(payload, result)
+    return result
+
+
+def record_delivery(
+    path: str, event: str, delivery: str | None, body: bytes
+) -> Path:
+    """
+    Save a received delivery to a file in a directory, for later replay.
+    The file is named after the delivery's GUID, or if the X-GitHub-Delivery header is missing or not a GUID
+    (it is not covered by the signature), after the hash of the body.
+    """
+    directory = Path(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    try:
+        name = str(uuid.UUID(delivery))
+    except (TypeError, ValueError):
+        name = hashlib.sha256(body).hexdigest()
+    recording = directory / f"{name}.json"
+    recording.write_bytes(
+        orjson.dumps(
+            {
+                "event": event,
+                "delivery": delivery,
+                "payload": orjson.loads(body),
+            }
+        )
+    )
+    return recording
+
+
+def load_recording(path: str | Path) -> tuple[str, dict]:
+    """
+    Return the event name and payload of a recorded delivery, either one saved by record_delivery
+    or one downloaded from the GitHub API (whose payload is under "request").
+    """
+    recording = orjson.loads(Path(path).read_bytes())
+    if "request" in recording:
+        return recording["event"], recording["request"]["payload"]
+    return recording["event"], recording["payload"]
@@ -0,0 +1,304 @@
+"""
+Command-line maintenance tasks for the OpenNeuroDatasets-JSONLD repositories.
+
+Usage: python -m app.cli <command> [options]
+"""
+
+import argparse
+import logging
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+import httpx
+import orjson
+
+from app.api import crud
+from app.api import utility as utils
+from app.api import vocabulary, webhooks
+from app.api.audit import audit_mirror
+from app.api.coverage import coverage_statistics
+from app.api.mirror import mirror
+
+
+def sync_mirror(args: argparse.Namespace) -> int:
+    if args.full:
+        mirror.clear()
+    start = time.perf_counter()
+    summary = crud.sync_mirror()
+    if summary is None:
+        print("The mirror is already being synced by another process.")
+        return 1
+    elapsed = time.perf_counter() - start
+    counts = ", ".join(
+        f"{key}={value}" for key, value in asdict(summary).items()
+    )
+    print(f"Synced {mirror.path} in {elapsed:.1f}s ({counts})")
+    return 1 if summary.failed else 0
+
+
+def _write_report(report: dict, output: str) -> None:
+    report_json = orjson.dumps(report, option=orjson.OPT_INDENT_2)
+    if output == "-":
+        sys.stdout.buffer.write(report_json + b"\n")
+    else:
+        with open(output, "wb") as f:
+            f.write(report_json)
+
+
+def audit(args: argparse.Namespace) -> int:
+    if not args.no_sync and crud.sync_mirror() is None:
+        print(
+            "The mirror is already being synced by another process, auditing it as is.",
+            file=sys.stderr,
+        )
+    report = audit_mirror(mirror, max_workers=args.workers)
+    _write_report(report, args.output)
+    counts = ", ".join(
+        f"{key}={value}" for key, value in report["summary"].items()
+    )
+    print(
+        f"Audited {report['summary']['total']} datasets ({counts})",
+        file=sys.stderr,
+    )
+    return 1 if report["summary"]["invalid"] else 0
+
+
+def coverage(args: argparse.Namespace) -> int:
+    if not args.no_sync and crud.sync_mirror() is None:
+        print(
+            "The mirror is already being synced by another process, counting it as is.",
+            file=sys.stderr,
+        )
+    start = time.perf_counter()
+    summarized = coverage_statistics.refresh(mirror)
+    elapsed = time.perf_counter() - start
+    report = coverage_statistics.report(include_datasets=args.per_dataset)
+    _write_report(report, args.output)
+    print(
+        f"Counted the annotations of {report['summary']['total']} datasets "
+        f"({summarized} summarized) in {elapsed * 1000:.1f}ms",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def sweep_branches(args: argparse.Namespace) -> int:
+    summary = crud.sweep_branches(
+        dry_run=args.dry_run,
+        batch_size=args.batch_size,
+        batch_interval=args.batch_interval,
+    )
+    if summary is None:
+        print("The branches are already being swept by another process.")
+        return 1
+    for branch in summary.orphaned_branches:
+        print(branch)
+    counts = ", ".join(
+        f"{key}={value}"
+        for key, value in asdict(summary).items()
+        if key != "orphaned_branches"
+    )
+    print(f"Swept orphaned bot branches ({counts})", file=sys.stderr)
+    return 1 if summary.failed else 0
+
+
+def _recordings(paths: list[str]) -> list[Path]:
+    recordings = []
+    for path in map(Path, paths):
+        recordings.extend(
+            sorted(path.glob("*.json")) if path.is_dir() else [path]
+        )
+    return recordings
+
+
+def replay_webhooks(args: argparse.Namespace) -> int:
+    if args.url is not None and not args.secret:
+        print(
+            "A secret is needed to sign the deliveries (set NB_UPLOADER_API_WEBHOOK_SECRET or pass --secret).",
+            file=sys.stderr,
+        )
+        return 1
+    failed = 0
+    for recording in _recordings(args.paths):
+        event, payload = webhooks.load_recording(recording)
+        if args.url is None:
+            # Offline, the cache updates are applied to the caches of this process (and the shared cache and mirror)
+            result = webhooks.handle_event(event, payload)
+            if args.run_background:
+                for task in result.background:
+                    task()
+            actions = result.actions
+        else:
+            body = orjson.dumps(payload)
+            response = httpx.post(
+                args.url,
+                content=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-GitHub-Event": event,
+                    "X-GitHub-Delivery": recording.stem,
+                    "X-Hub-Signature-256": webhooks.sign(args.secret, body),
+                },
+            )
+            if response.status_code != 200:
+                print(
+                    f"{recording}: {event} failed ({response.status_code}): {response.text}"
+                )
+                failed += 1
+                continue
+            actions = response.json()["actions"]
+        print(f"{recording}: {event} -> {', '.join(actions) or 'no changes'}")
+    return 1 if failed else 0
+
+
+def import_vocabulary(args: argparse.Namespace) -> int:
+    try:
+        imported = vocabulary.import_terms(
+            args.vocabulary, orjson.loads(Path(args.path).read_bytes())
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"{args.path} is not a valid term vocabulary: {e}")
+        return 1
+    print(
+        f"Imported {imported} terms into {vocabulary.VOCAB_DIR / args.vocabulary}.json"
+    )
+    return 0
+
+
+def _talks_to_github(args: argparse.Namespace) -> bool:
+    """Return whether a command makes requests to GitHub, and so needs the credentials of the GitHub App."""
+    if args.func in (audit, coverage):
+        return not args.no_sync
+    if args.func is replay_webhooks:
+        return args.run_background
+    return args.func is not import_vocabulary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser(
+        "sync-mirror",
+        help="Incrementally sync the local mirror of every dataset's participants.json with GitHub.",
+    )
+    sync_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Discard the existing mirror and sync every dataset from scratch.",
+    )
+    sync_parser.set_defaults(func=sync_mirror)
+
+    audit_parser = subparsers.add_parser(
+        "audit",
+        help="Validate the participants.json of every dataset and write a JSON report of errors and warnings per dataset.",
+    )
+    audit_parser.add_argument(
+        "-o",
+        "--output",
+        default="audit_report.json",
+        help="Path of the report to write, or - for stdout (default: audit_report.json).",
+    )
+    audit_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of validation processes (default: number of CPUs).",
+    )
+    audit_parser.add_argument(
+        "--no-sync",
+        action="store_true",
+        help="Audit the local mirror as is, without syncing it with GitHub first.",
+    )
+    audit_parser.set_defaults(func=audit)
+
+    coverage_parser = subparsers.add_parser(
+        "coverage",
+        help="Count how many datasets annotate each concept, and with which variable types and terms, and write a JSON report.",
+    )
+    coverage_parser.add_argument(
+        "-o",
+        "--output",
+        default="coverage_report.json",
+        help="Path of the report to write, or - for stdout (default: coverage_report.json).",
+    )
+    coverage_parser.add_argument(
+        "--per-dataset",
+        action="store_true",
+        help="Also include the summary of each dataset in the report.",
+    )
+    coverage_parser.add_argument(
+        "--no-sync",
+        action="store_true",
+        help="Count the local mirror as is, without syncing it with GitHub first.",
+    )
+    coverage_parser.set_defaults(func=coverage)
+
+    sweep_parser = subparsers.add_parser(
+        "sweep-branches",
+        help="Delete bot branches without an open pull request from every dataset repository, printing each one.",
+    )
+    sweep_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the orphaned branches, without deleting them.",
+    )
+    sweep_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Number of branches to delete before pausing (default: NB_UPLOADER_API_BRANCH_SWEEP_BATCH_SIZE).",
+    )
+    sweep_parser.add_argument(
+        "--batch-interval",
+        type=float,
+        default=None,
+        help="Seconds to pause between batches (default: NB_UPLOADER_API_BRANCH_SWEEP_BATCH_INTERVAL).",
+    )
+    sweep_parser.set_defaults(func=sweep_branches)
+
+    replay_parser = subparsers.add_parser(
+        "replay-webhooks",
+        help="Replay recorded GitHub webhook deliveries (files, or directories of .json files), printing the cache updates made for each.",
+    )
+    replay_parser.add_argument("paths", nargs="+")
+    replay_parser.add_argument(
+        "--url",
+        default=None,
+        help="Send the deliveries to the webhook route of a running server (e.g., http://localhost:8000/openneuro/webhooks/github) "
+        "instead of handling them in this process.",
+    )
+    replay_parser.add_argument(
+        "--secret",
+        default=utils.WEBHOOK_SECRET,
+        help="Secret to sign the deliveries with when sending them to a server (default: NB_UPLOADER_API_WEBHOOK_SECRET).",
+    )
+    replay_parser.add_argument(
+        "--run-background",
+        action="store_true",
+        help="When handling deliveries in this process, also run the updates that make requests to GitHub (e.g., of the mirror).",
+    )
+    replay_parser.set_defaults(func=replay_webhooks)
+
+    vocabulary_parser = subparsers.add_parser(
+        "import-vocabulary",
+        help="Import a curated Neurobagel term vocabulary file (e.g., of SNOMED CT assessment scales or disorders) into a bundled vocabulary, "
+        "after which terms of its namespaces that it does not list are rejected.",
+    )
+    vocabulary_parser.add_argument(
+        "vocabulary", choices=["assessment", "diagnosis", "subject_group"]
+    )
+    vocabulary_parser.add_argument("path")
+    vocabulary_parser.set_defaults(func=import_vocabulary)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if _talks_to_github(args):
+        utils.set_gh_credentials()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,34 +1,108 @@
+import asyncio
+import logging
 from contextlib import asynccontextmanager
+from functools import partial
+from typing import Callable
 
+import orjson
 import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
-from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    ORJSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+)
 
-from app.api.utility import ROOT_PATH, set_gh_credentials
+from app.api import crud
+from app.api.compression import DecompressRequestMiddleware
+from app.api.github_client import GitHubUnavailableError
+from app.api.metrics import render_metrics
+from app.api.models import FailedUpload
+from app.api.rate_limit import RateLimitedError
+from app.api.static_responses import StaticResponse
+from app.api.utility import (
+    BRANCH_SWEEP_DRY_RUN,
+    BRANCH_SWEEP_INTERVAL,
+    MIRROR_SYNC_INTERVAL,
+    RESPONSE_COMPRESSION_LEVEL,
+    RESPONSE_COMPRESSION_MIN_SIZE,
+    ROOT_PATH,
+    STATIC_MAX_AGE,
+    set_gh_credentials,
+)
 
-from .api.routers import openneuro
+from .api.routers import openneuro, webhooks
 
 FAVICON_URL = "https://raw.githubusercontent.com/neurobagel/documentation/main/docs/imgs/logo/neurobagel_favicon.png"
 
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(task: Callable, interval: float, description: str):
+    """Run a blocking maintenance task (e.g., syncing the dataset mirror) in a worker thread every interval seconds."""
+    while True:
+        try:
+            summary = await run_in_threadpool(task)
+            if summary is not None:
+                logger.info(f"Finished {description}: {summary}")
+        except Exception as e:
+            logger.warning(f"Could not complete {description}: {e}")
+        await asyncio.sleep(interval)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Ensure info needed for GitHub authentication is read in before the FastAPI app starts up."""
+    """
+    Ensure info needed for GitHub authentication is read in before the FastAPI app starts up,
+    and start the enabled maintenance tasks (syncing the dataset mirror, sweeping orphaned bot branches) in the background.
+    """
     set_gh_credentials()
+    tasks = []
+    if MIRROR_SYNC_INTERVAL > 0:
+        tasks.append(
+            run_periodically(
+                crud.sync_mirror, MIRROR_SYNC_INTERVAL, "dataset mirror sync"
+            )
+        )
+    if BRANCH_SWEEP_INTERVAL > 0:
+        tasks.append(
+            run_periodically(
+                partial(crud.sweep_branches, dry_run=BRANCH_SWEEP_DRY_RUN),
+                BRANCH_SWEEP_INTERVAL,
+                "orphaned bot branch sweep",
+            )
+        )
+    running_tasks = [asyncio.create_task(task) for task in tasks]
     yield
+    for task in running_tasks:
+        task.cancel()
 
 
 app = FastAPI(
     root_path=ROOT_PATH,
     default_response_class=ORJSONResponse,
     lifespan=lifespan,
-    # We will override the default docs with our own endpoints with a custom favicon
+    # We will override the default docs and OpenAPI schema endpoints with our own,
+    # which use a custom favicon and serve cacheable responses
     docs_url=None,
     redoc_url=None,
+    openapi_url=None,
 )
 
+# Large responses (e.g., upload previews) are compressed for clients that accept gzip
+# NOTE: Responses that are already compressed (e.g., the pre-compressed static routes) are left as they are
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=RESPONSE_COMPRESSION_MIN_SIZE,
+    compresslevel=RESPONSE_COMPRESSION_LEVEL,
+)
+app.add_middleware(DecompressRequestMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -38,22 +112,95 @@ app.add_middleware(
 )
 
 
-# TODO: Should we exclude the root endpoint from the schema for a cleaner docs?
-@app.get("/", response_class=HTMLResponse)
-def root(request: Request):
+@app.exception_handler(GitHubUnavailableError)
+async def github_unavailable_handler(
+    request: Request, exc: GitHubUnavailableError
+):
     """
-    Display a welcome message and a link to the API documentation.
+    Respond with a 503 when GitHub cannot currently be reached, telling the client when to retry.
     """
+    return JSONResponse(
+        status_code=503,
+        content=FailedUpload(error=str(exc)).model_dump(),
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(RateLimitedError)
+async def rate_limited_handler(request: Request, exc: RateLimitedError):
+    """Respond with a 429 when a client or contributor exceeds their rate limit, telling them when to retry."""
+    return JSONResponse(
+        status_code=429,
+        content=FailedUpload(error=str(exc)).model_dump(),
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def render_root(root_path: str) -> str:
     return f"""
     <html>
         <body>
             <h1>Welcome to the API for <a href="https://github.com/OpenNeuroDatasets-JSONLD" target="_blank">Neurobagel-annotated OpenNeuro Datasets!</a></h1>
-            <p>Please visit the <a href="{request.scope.get("root_path", "")}/docs">API documentation</a> to view available API endpoints.</p>
+            <p>Please visit the <a href="{root_path}/docs">API documentation</a> to view available API endpoints.</p>
         </body>
     </html>
     """
 
 
+def render_swagger(root_path: str) -> bytes:
+    return get_swagger_ui_html(
+        openapi_url=f"{root_path}/openapi.json",
+        title="Neurobagel OpenNeuro Datasets API",
+        swagger_favicon_url=FAVICON_URL,
+    ).body
+
+
+def render_redoc(root_path: str) -> bytes:
+    return get_redoc_html(
+        openapi_url=f"{root_path}/openapi.json",
+        title="Neurobagel OpenNeuro Datasets API",
+        redoc_favicon_url=FAVICON_URL,
+    ).body
+
+
+def render_openapi(root_path: str) -> bytes:
+    """
+    Render the OpenAPI schema, listing the path prefix the app is served under (if any) as a server
+    (as FastAPI's default /openapi.json route does), so that requests from the docs include the prefix.
+    """
+    schema = app.openapi()
+    if root_path := root_path.rstrip("/"):
+        schema = {
+            **schema,
+            "servers": [{"url": root_path}, *schema.get("servers", [])],
+        }
+    return orjson.dumps(schema)
+
+
+# The bodies of these routes only depend on the root_path, so are rendered once per root_path and served from memory
+root_response = StaticResponse(
+    render_root, media_type="text/html", max_age=STATIC_MAX_AGE
+)
+swagger_response = StaticResponse(
+    render_swagger, media_type="text/html", max_age=STATIC_MAX_AGE
+)
+redoc_response = StaticResponse(
+    render_redoc, media_type="text/html", max_age=STATIC_MAX_AGE
+)
+openapi_response = StaticResponse(
+    render_openapi, media_type="application/json", max_age=STATIC_MAX_AGE
+)
+
+
+# TODO: Should we exclude the root endpoint from the schema for a cleaner docs?
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request):
+    """
+    Display a welcome message and a link to the API documentation.
+    """
+    return root_response(request)
+
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     """
@@ -63,30 +210,42 @@ async def favicon():
 
 
 @app.get("/docs", include_in_schema=False)
-def overridden_swagger(request: Request):
+async def overridden_swagger(request: Request):
     """
     Overrides the Swagger UI HTML for the "/docs" endpoint.
     """
-    return get_swagger_ui_html(
-        openapi_url=f"{request.scope.get('root_path', '')}/openapi.json",
-        title="Neurobagel OpenNeuro Datasets API",
-        swagger_favicon_url=FAVICON_URL,
-    )
+    return swagger_response(request)
 
 
 @app.get("/redoc", include_in_schema=False)
-def overridden_redoc(request: Request):
+async def overridden_redoc(request: Request):
     """
     Overrides the Redoc HTML for the "/redoc" endpoint.
     """
-    return get_redoc_html(
-        openapi_url=f"{request.scope.get('root_path', '')}/openapi.json",
-        title="Neurobagel OpenNeuro Datasets API",
-        redoc_favicon_url=FAVICON_URL,
+    return redoc_response(request)
+
+
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi(request: Request):
+    """
+    Overrides the default "/openapi.json" endpoint to serve the schema with caching headers.
+    """
+    return openapi_response(request)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Expose metrics of this worker process in the Prometheus text format.
+    """
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4"
     )
 
 
 app.include_router(openneuro.router)
+app.include_router(webhooks.router)
 
+# For development only, with auto-reload on code changes. In production, use the entry point in app/server.py
 if __name__ == "__main__":
     uvicorn.run("app.main:app", port=8000, reload=True)
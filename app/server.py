@@ -0,0 +1,92 @@
+"""
+Production entry point for the API, which supports running multiple worker processes.
+
+Usage: python -m app.server
+
+The workers share GitHub installation tokens, repository metadata and upload deduplication state
+through a SQLite file (NB_UPLOADER_API_CACHE_PATH), so adding workers does not multiply GitHub authentication traffic.
+
+By default, the server runs with a tuned profile (NB_UPLOADER_API_SERVER_PROFILE=tuned):
+- the uvloop event loop and httptools HTTP parser when they are installed (as with fastapi[standard]),
+  falling back to asyncio and h11 otherwise
+- keep-alive connections kept open for longer than the idle timeout of common reverse proxies and load balancers
+- optionally (NB_UPLOADER_API_SERVER_LIMIT_CONCURRENCY, unset by default like in uvicorn), a limit on concurrent
+  connections, beyond which the server answers with a 503 instead of queueing without bound.
+  Idle keep-alive connections count towards it, and with the longer keep-alive a proxy's pool of idle connections
+  stays open, so a limit must exceed the connections every client and proxy may keep open to a worker,
+  not just the requests in progress
+- a graceful shutdown that gives uploads in progress time to finish their GitHub requests, but not forever
+- no WebSocket support, which the API does not use
+These values are starting points rather than measured optima: size them (and any concurrency limit) for the deployment
+with benchmarks/bench_server_profiles.py on a machine with more cores than clients (and --idle-connections set
+to the proxy's pool size). Use NB_UPLOADER_API_SERVER_PROFILE=uvicorn to run with uvicorn's defaults instead.
+"""
+
+import importlib.util
+import logging
+import os
+
+import uvicorn
+
+from app.api import github_client
+from app.api import utility as utils
+from app.api.crud import DATASETS_ORG
+
+logger = logging.getLogger(__name__)
+
+
+def preload_shared_state():
+    """
+    Warm up the state shared by the workers before they are started,
+    so that the first requests handled by each worker do not all authenticate with GitHub at once.
+    """
+    utils.set_gh_credentials()
+    try:
+        github_client.get_installation_token(DATASETS_ORG)
+    except Exception as e:
+        # The workers will authenticate on demand instead, so this should not prevent the server from starting
+        logger.warning(f"Could not preload a GitHub installation token: {e}")
+
+
+def is_installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def get_server_options() -> dict:
+    """Return the options to run the uvicorn server with, for the configured server profile."""
+    options = {
+        "host": "0.0.0.0",
+        "port": int(os.environ.get("NB_API_PORT", 8000)),
+        "workers": utils.WORKERS,
+        "proxy_headers": True,
+    }
+    if utils.SERVER_PROFILE == "uvicorn":
+        return options
+    if utils.SERVER_PROFILE != "tuned":
+        raise ValueError(
+            f"Unsupported server profile: {utils.SERVER_PROFILE!r}. "
+            "NB_UPLOADER_API_SERVER_PROFILE must be one of 'tuned' or 'uvicorn'."
+        )
+    return {
+        **options,
+        "loop": utils.SERVER_LOOP
+        or ("uvloop" if is_installed("uvloop") else "asyncio"),
+        "http": utils.SERVER_HTTP
+        or ("httptools" if is_installed("httptools") else "h11"),
+        "ws": "none",
+        "backlog": utils.SERVER_BACKLOG,
+        "limit_concurrency": utils.SERVER_LIMIT_CONCURRENCY or None,
+        "timeout_keep_alive": utils.SERVER_KEEP_ALIVE_TIMEOUT,
+        "timeout_graceful_shutdown": utils.SERVER_GRACEFUL_SHUTDOWN_TIMEOUT,
+    }
+
+
+def main():
+    if utils.PRELOAD:
+        preload_shared_state()
+
+    uvicorn.run("app.main:app", **get_server_options())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark the wire size and latency of previews of data dictionaries of increasing size,
+sent uncompressed or gzip-compressed, with the response uncompressed or gzip-compressed.
+
+The API runs with the production entry point against a local stand-in for the GitHub API.
+Each size is previewed once before measuring, so that the per-column validation cache is warm.
+On localhost, transfer time is negligible, so the time the request and response bytes would take
+over a link of the given bandwidth (--mbps) is added to the measured latency as an estimate for a slow connection.
+
+Usage: python -m benchmarks.bench_compression --columns 100 1000 10000 --mbps 10
+"""
+
+import argparse
+import gzip
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+import requests
+
+from .github_stub import start_stub, stub_url
+from .utils import (
+    dumps,
+    free_port,
+    make_data_dictionary,
+    print_table,
+    run_api,
+)
+
+
+def preview(
+    api_url: str, dataset_id: str, file: bytes, accept_encoding: str
+) -> tuple[float, int]:
+    """Request a preview, returning the latency in seconds and the size of the response body on the wire."""
+    start = time.perf_counter()
+    response = requests.post(
+        f"{api_url}/openneuro/preview",
+        params={"dataset_id": dataset_id},
+        files={"data_dictionary": ("participants.json", file)},
+        headers={"Accept-Encoding": accept_encoding},
+        stream=True,
+    )
+    wire_body = response.raw.read(decode_content=False)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return elapsed, len(wire_body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--columns", type=int, nargs="+", default=[100, 1000, 10000]
+    )
+    parser.add_argument("--mbps", type=float, default=10)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    server, state = start_stub(n_datasets=0, participants_json=b"")
+    for n_columns in args.columns:
+        state.add_repo(
+            f"ds-{n_columns}", dumps(make_data_dictionary(n_columns))
+        )
+    bytes_per_second = args.mbps * 1_000_000 / 8
+
+    rows = []
+    with (
+        tempfile.TemporaryDirectory() as tmp_dir,
+        run_api(
+            Path(tmp_dir),
+            free_port(),
+            stub_url(server),
+            NB_UPLOADER_API_CLIENT_RATE_LIMIT=0,
+        ) as api_url,
+    ):
+        for n_columns in args.columns:
+            # Warm up the per-column validation cache, so that every combination is measured in the same (steady) state
+            preview(
+                api_url,
+                f"ds-{n_columns}",
+                dumps(make_data_dictionary(n_columns, seed=" (warm-up)")),
+                "identity",
+            )
+            for request_encoding in ("identity", "gzip"):
+                for response_encoding in ("identity", "gzip"):
+                    latencies, request_sizes, response_sizes = [], [], []
+                    for i in range(args.repeats):
+                        # A different file each time, so that previews are not answered from the cache
+                        file = orjson.dumps(
+                            make_data_dictionary(
+                                n_columns,
+                                seed=f" ({request_encoding}, {response_encoding}, {i})",
+                            ),
+                            option=orjson.OPT_INDENT_2,
+                        )
+                        if request_encoding == "gzip":
+                            file = gzip.compress(file, compresslevel=6)
+                        latency, response_size = preview(
+                            api_url,
+                            f"ds-{n_columns}",
+                            file,
+                            response_encoding,
+                        )
+                        latencies.append(latency)
+                        request_sizes.append(len(file))
+                        response_sizes.append(response_size)
+                    request_size = statistics.mean(request_sizes)
+                    response_size = statistics.mean(response_sizes)
+                    latency = statistics.median(latencies)
+                    rows.append(
+                        {
+                            "columns": n_columns,
+                            "request": request_encoding,
+                            "response": response_encoding,
+                            "request_kb": round(request_size / 1024, 1),
+                            "response_kb": round(response_size / 1024, 1),
+                            "latency_ms": round(latency * 1000, 1),
+                            f"at_{args.mbps:g}mbps_ms": round(
+                                (
+                                    latency
+                                    + (request_size + response_size)
+                                    / bytes_per_second
+                                )
+                                * 1000
+                            ),
+                        }
+                    )
+    server.shutdown()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
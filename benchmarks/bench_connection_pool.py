@@ -0,0 +1,114 @@
+"""
+Benchmark per-upload latency with and without the shared pool of GitHub connections.
+
+Uploads are sent in-process against a local HTTPS GitHub stand-in that delays every new connection
+(--connect-latency-ms) to mimic the TCP and TLS handshakes with api.github.com.
+With PyGithub's default connection handling, each upload creates new clients with their own sessions and pays
+the connection setup again; with the shared pool, connections are reused across uploads.
+
+PyGithub's client-side throttling (a pause between consecutive requests) is disabled here,
+since it would otherwise dominate the latency being measured.
+
+Usage: python -m benchmarks.bench_connection_pool --uploads 20 --connect-latency-ms 100
+"""
+
+import argparse
+import functools
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from .github_stub import create_tls_context, start_stub, stub_url
+from .utils import dumps, make_data_dictionary, print_table, write_private_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument("--connect-latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    tmp_dir = Path(tempfile.mkdtemp())
+    tls_context, cert_path = create_tls_context(tmp_dir)
+    server, state = start_stub(
+        n_datasets=2 * args.uploads,
+        participants_json=dumps(make_data_dictionary(20)),
+        latency_ms=args.latency_ms,
+        connect_latency_ms=args.connect_latency_ms,
+        tls_context=tls_context,
+    )
+    write_private_key(tmp_dir / "private_key.pem")
+    os.environ.update(
+        REQUESTS_CA_BUNDLE=str(cert_path),
+        NB_GITHUB_API_URL=stub_url(server),
+        NB_BOT_ID="1",
+        NB_BOT_KEY_PATH=str(tmp_dir / "private_key.pem"),
+        NB_UPLOADER_API_CACHE_BACKEND="memory",
+    )
+
+    # Imported after configuring the environment, which is read at import time
+    from github import Github
+    from github.Requester import Requester
+    from starlette.testclient import TestClient
+
+    from app.api import github_client
+    from app.main import app
+
+    github_client.Github = functools.partial(
+        Github, seconds_between_requests=None, seconds_between_writes=None
+    )
+    new_contents = dumps(make_data_dictionary(20, seed=" (updated)"))
+
+    rows = []
+    with TestClient(app) as client:
+        for i, (mode, use_pool) in enumerate(
+            [("per-client sessions", False), ("shared pool", True)]
+        ):
+            if use_pool:
+                Requester.injectConnectionClasses(
+                    github_client.PooledHTTPConnection,
+                    github_client.PooledConnection,
+                )
+            else:
+                Requester.resetConnectionClasses()
+            connections_before = server.connections_accepted
+            requests_before = sum(state.request_counts.values())
+
+            latencies = []
+            for j in range(args.uploads):
+                start = time.perf_counter()
+                response = client.put(
+                    "/openneuro/upload",
+                    params={"dataset_id": f"ds{i * args.uploads + j:06d}"},
+                    files={"data_dictionary": new_contents},
+                    data={
+                        "changes_summary": "Benchmark upload",
+                        "name": "Benchmark User",
+                        "email": "benchmark@example.com",
+                    },
+                )
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+            rows.append(
+                {
+                    "mode": mode,
+                    "uploads": args.uploads,
+                    "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+                    "median_ms": round(statistics.median(latencies) * 1000, 1),
+                    "github_requests": sum(state.request_counts.values())
+                    - requests_before,
+                    "connections_opened": server.connections_accepted
+                    - connections_before,
+                }
+            )
+
+    server.shutdown()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark refreshing the annotation coverage statistics of a mirror of many datasets:
+a first refresh (every file summarized), a refresh by a new process whose summaries are all cached,
+a refresh with no changes, and a refresh after one dataset's participants.json changed (e.g., a merged pull request).
+
+Usage: python -m benchmarks.bench_coverage --datasets 1000 --columns 50
+"""
+
+import argparse
+import tempfile
+import time
+
+import orjson
+
+from app.api import coverage
+from app.api.cache import MemoryCache
+from app.api.mirror import DatasetMirror
+
+from .github_stub import git_blob_sha
+from .utils import dumps, make_data_dictionary, print_table
+
+
+def write_file(
+    mirror: DatasetMirror, index: dict, dataset_id: str, content: bytes
+):
+    (mirror.datasets_path / f"{dataset_id}.json").write_bytes(content)
+    index[dataset_id] = {"blob_sha": git_blob_sha(content), "head_sha": None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--datasets", type=int, default=1000)
+    parser.add_argument("--columns", type=int, default=50)
+    args = parser.parse_args()
+
+    coverage.shared_cache = MemoryCache()
+    mirror = DatasetMirror(tempfile.mkdtemp())
+    mirror.datasets_path.mkdir(parents=True)
+    index = {}
+    for i in range(args.datasets):
+        # A different file for each dataset, so that every summary is computed
+        write_file(
+            mirror,
+            index,
+            f"ds{i:06d}",
+            dumps(make_data_dictionary(args.columns, seed=f" ({i})")),
+        )
+    mirror.index_path.write_bytes(orjson.dumps(index))
+
+    def change_one_dataset():
+        write_file(
+            mirror,
+            index,
+            "ds000000",
+            dumps(make_data_dictionary(args.columns, seed=" (updated)")),
+        )
+        mirror.index_path.write_bytes(orjson.dumps(index))
+
+    statistics = coverage.CoverageStatistics()
+    new_process = coverage.CoverageStatistics()
+    rows = []
+    for label, refresh in [
+        ("first refresh", lambda: statistics.refresh(mirror)),
+        ("new process", lambda: new_process.refresh(mirror)),
+        ("no changes", lambda: statistics.refresh(mirror)),
+        (
+            "1 changed",
+            lambda: change_one_dataset() or statistics.refresh(mirror),
+        ),
+    ]:
+        start = time.perf_counter()
+        changed = refresh()
+        refresh_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        statistics.report()
+        report_ms = (time.perf_counter() - start) * 1000
+        rows.append(
+            {
+                "refresh": label,
+                "datasets_replaced": changed,
+                "refresh_ms": round(refresh_ms, 1),
+                "report_ms": round(report_ms, 1),
+            }
+        )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark the peak memory used to fetch and parse a large existing participants.json (20 MB by default).
+
+Compares:
+- base64 JSON: the file is received base64-encoded inside a JSON document (as from the contents API for small files),
+  then decoded to bytes, decoded to a string and parsed with json.loads
+- raw blob: the file is received as raw bytes from the blobs API and parsed directly with orjson,
+  decoding only a small sample of it to detect its formatting
+
+Peak memory is measured with tracemalloc, and includes the parsed dictionary itself.
+The GitHub stand-in runs in a separate process so that its own allocations are not counted.
+
+Usage: python -m benchmarks.bench_large_dictionary --size-mb 20
+"""
+
+import argparse
+import base64
+import gc
+import json
+import multiprocessing
+import os
+import socket
+import time
+import tracemalloc
+
+from .github_stub import ORG, git_blob_sha, start_stub
+from .utils import dumps, make_data_dictionary, print_table
+
+
+def make_large_dictionary(size_mb: float) -> bytes:
+    """Create a valid data dictionary of roughly the given size."""
+    column_size = len(dumps(make_data_dictionary(4))) - len(
+        dumps(make_data_dictionary(3))
+    )
+    n_columns = int(size_mb * 1024 * 1024 / column_size)
+    return dumps(make_data_dictionary(n_columns))
+
+
+def serve_stub(port: int, content: bytes):
+    server, _ = start_stub(port=port, n_datasets=1, participants_json=content)
+    # The stand-in serves requests from a background thread until this process is terminated
+    while True:
+        time.sleep(1)
+
+
+def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    raise TimeoutError(f"The GitHub stand-in did not start on port {port}")
+
+
+def measure(fetch_and_parse) -> tuple[float, float]:
+    """Return the peak traced memory (in MB) and the time (in seconds) taken by a function."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fetch_and_parse()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak / 1024 / 1024, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=20)
+    args = parser.parse_args()
+
+    content = make_large_dictionary(args.size_mb)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    stub_process = multiprocessing.Process(
+        target=serve_stub, args=(port, content), daemon=True
+    )
+    stub_process.start()
+    base_url = f"http://127.0.0.1:{port}"
+    wait_for_port(port)
+    os.environ["NB_GITHUB_API_URL"] = base_url
+
+    # Imported after configuring the environment, which is read at import time
+    from github import Github
+
+    from app.api import github_client
+    from app.api import utility as utils
+
+    github_client.get_installation_token = lambda org: "token"
+    g = Github(base_url=base_url, seconds_between_requests=None)
+    repo = g.withLazy(True).get_repo(f"{ORG}/ds000000")
+    blob_sha = git_blob_sha(content)
+
+    def base64_json():
+        blob = repo.get_git_blob(blob_sha)
+        content_json = base64.b64decode(blob.content).decode("utf-8")
+        return json.loads(content_json), utils.get_indentation(content_json)
+
+    def raw_blob():
+        raw = github_client.get_blob_content(ORG, f"{ORG}/ds000000", blob_sha)
+        return utils.load_json_bytes(raw), utils.get_indentation(
+            utils.get_formatting_sample(raw)
+        )
+
+    rows = []
+    for label, fetch_and_parse in [
+        ("base64 JSON", base64_json),
+        ("raw blob", raw_blob),
+    ]:
+        peak_mb, elapsed = measure(fetch_and_parse)
+        rows.append(
+            {
+                "path": label,
+                "file_mb": round(len(content) / 1024 / 1024, 1),
+                "peak_memory_mb": round(peak_mb, 1),
+                "seconds": round(elapsed, 2),
+            }
+        )
+
+    stub_process.terminate()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
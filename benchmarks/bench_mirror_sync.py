@@ -0,0 +1,77 @@
+"""
+Benchmark syncing the local dataset mirror: a first full sync, a repeat sync with no changes,
+and a sync after a few datasets were updated.
+
+The sync runs in-process against a local GitHub stand-in with a per-request latency (--latency-ms)
+to mimic the round trip to api.github.com. PyGithub's client-side throttling is disabled,
+since it would otherwise dominate the time being measured.
+
+Usage: python -m benchmarks.bench_mirror_sync --datasets 500 --changed 10
+"""
+
+import argparse
+import tempfile
+import time
+
+from github import Github
+
+from app.api.mirror import DatasetMirror
+
+from .github_stub import ORG, start_stub, stub_url
+from .utils import dumps, make_data_dictionary, print_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--datasets", type=int, default=500)
+    parser.add_argument("--changed", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server, state = start_stub(
+        n_datasets=args.datasets,
+        participants_json=dumps(make_data_dictionary(20)),
+        latency_ms=args.latency_ms,
+    )
+    g = Github(
+        base_url=stub_url(server),
+        seconds_between_requests=None,
+        seconds_between_writes=None,
+    )
+    mirror = DatasetMirror(tempfile.mkdtemp())
+    updated = dumps(make_data_dictionary(20, seed=" (updated)"))
+
+    def change_datasets():
+        for i in range(args.changed):
+            repo = state.repos[f"ds{i:06d}"]
+            repo["files"]["participants.json"] = updated
+            repo["branches"]["main"] = f"{i:040d}"
+            repo["pushed_at"] = "2025-02-01T00:00:00Z"
+
+    rows = []
+    for label, prepare in [
+        ("first sync", lambda: None),
+        ("no changes", lambda: None),
+        (f"{args.changed} changed", change_datasets),
+    ]:
+        prepare()
+        state.request_counts.clear()
+        start = time.perf_counter()
+        summary = mirror.sync(g, ORG, max_workers=args.concurrency)
+        rows.append(
+            {
+                "sync": label,
+                "seconds": round(time.perf_counter() - start, 2),
+                "github_requests": sum(state.request_counts.values()),
+                "blobs_fetched": summary.fetched,
+                "skipped": summary.skipped,
+            }
+        )
+
+    server.shutdown()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark the throughput and latency of the production entry point with its tuned server profile against uvicorn's defaults.
+
+The API is run with each server configuration, and several client processes (each with a keep-alive connection)
+send requests back to back for a fixed time to:
+- a static route (/openapi.json, precomputed and gzip-compressed)
+- the validation part of the preview route (an invalid data dictionary, which is rejected before any GitHub request)
+
+The configurations compared are uvicorn's defaults (NB_UPLOADER_API_SERVER_PROFILE=uvicorn),
+the tuned profile, and the tuned profile with the pure-Python asyncio event loop and h11 HTTP parser
+(what the tuned profile falls back to when uvloop and httptools are not installed).
+Results vary between machines, so compare configurations within a run. Each route is warmed up before measuring.
+
+With --limit-concurrency, the tuned profiles run with that concurrency limit (NB_UPLOADER_API_SERVER_LIMIT_CONCURRENCY).
+With --idle-connections, that many connections are opened and left idle while measuring, as a reverse proxy does
+with its pool of keep-alive connections. A concurrency limit counts them too, so the requests
+rejected with a 503 are also reported.
+
+Usage: python -m benchmarks.bench_server_profiles --clients 8 --seconds 5 [--limit-concurrency 1000 --idle-connections 1000]
+"""
+
+import argparse
+import json
+import socket
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+
+from .github_stub import start_stub, stub_url
+from .utils import free_port, make_data_dictionary, print_table, run_api
+
+CONFIGURATIONS = {
+    "uvicorn defaults": {"NB_UPLOADER_API_SERVER_PROFILE": "uvicorn"},
+    "tuned": {"NB_UPLOADER_API_SERVER_PROFILE": "tuned"},
+    "tuned (asyncio, h11)": {
+        "NB_UPLOADER_API_SERVER_PROFILE": "tuned",
+        "NB_UPLOADER_API_SERVER_LOOP": "asyncio",
+        "NB_UPLOADER_API_SERVER_HTTP": "h11",
+    },
+}
+
+
+def make_requests(api_url: str) -> dict[str, httpx.Request]:
+    """The request to send to each benchmarked route."""
+    invalid_dict = make_data_dictionary(100)
+    invalid_dict["age"]["Annotations"]["VariableType"] = "Cont"
+    return {
+        "static": httpx.Request(
+            "GET",
+            f"{api_url}/openapi.json",
+            headers={"Accept-Encoding": "gzip"},
+        ),
+        "validation": httpx.Request(
+            "POST",
+            f"{api_url}/openneuro/preview",
+            params={"dataset_id": "ds000000"},
+            files={
+                "data_dictionary": (
+                    "participants.json",
+                    json.dumps(invalid_dict).encode(),
+                )
+            },
+        ),
+    }
+
+
+def send_for(
+    method: str, url: str, headers: dict, body: bytes, seconds: float
+) -> tuple[list[float], int]:
+    """
+    Send the same request back to back over one keep-alive connection,
+    returning the latency of each response and the number of requests rejected with a 503.
+    """
+    latencies, rejected = [], 0
+    with requests.Session() as session:
+        deadline = time.perf_counter() + seconds
+        while (start := time.perf_counter()) < deadline:
+            response = session.request(method, url, headers=headers, data=body)
+            response.content
+            latencies.append(time.perf_counter() - start)
+            rejected += response.status_code == 503
+    return latencies, rejected
+
+
+def open_idle_connections(
+    stack: ExitStack, api_url: str, n_connections: int
+) -> None:
+    """Open connections to the API that send nothing, and close them when the stack is exited."""
+    url = urlsplit(api_url)
+    for _ in range(n_connections):
+        stack.enter_context(socket.create_connection((url.hostname, url.port)))
+    # Let the server accept them before measuring
+    time.sleep(1)
+
+
+def measure(
+    request: httpx.Request, n_clients: int, seconds: float
+) -> tuple[float, float, float, int]:
+    """
+    Return the requests per second, the median and 99th percentile latency in milliseconds,
+    and the number of requests rejected with a 503.
+    """
+    args = (
+        request.method,
+        str(request.url),
+        dict(request.headers),
+        request.read(),
+    )
+    # Warm up (e.g., the validation cache) so that every configuration is measured in the same state
+    send_for(*args, seconds=0.5)
+    with ProcessPoolExecutor(n_clients) as pool:
+        results = list(
+            pool.map(
+                send_for, *zip(*[args] * n_clients), [seconds] * n_clients
+            )
+        )
+    latencies = [
+        latency
+        for client_latencies, _ in results
+        for latency in client_latencies
+    ]
+    return (
+        len(latencies) / seconds,
+        statistics.median(latencies) * 1000,
+        statistics.quantiles(latencies, n=100)[98] * 1000,
+        sum(rejected for _, rejected in results),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--limit-concurrency", type=int, default=0)
+    parser.add_argument("--idle-connections", type=int, default=0)
+    args = parser.parse_args()
+
+    server, _ = start_stub(n_datasets=1, participants_json=b"{}")
+    rows = []
+    for name, env in CONFIGURATIONS.items():
+        with (
+            ExitStack() as idle_connections,
+            tempfile.TemporaryDirectory() as tmp_dir,
+            run_api(
+                Path(tmp_dir),
+                free_port(),
+                stub_url(server),
+                NB_UPLOADER_API_CLIENT_RATE_LIMIT=0,
+                NB_UPLOADER_API_WORKERS=args.workers,
+                # Ignored by uvicorn's defaults
+                NB_UPLOADER_API_SERVER_LIMIT_CONCURRENCY=args.limit_concurrency,
+                **env,
+            ) as api_url,
+        ):
+            open_idle_connections(
+                idle_connections, api_url, args.idle_connections
+            )
+            for route, request in make_requests(api_url).items():
+                rps, p50, p99, rejected = measure(
+                    request, args.clients, args.seconds
+                )
+                rows.append(
+                    {
+                        "server": name,
+                        "route": route,
+                        "requests_per_s": round(rps),
+                        "p50_ms": round(p50, 2),
+                        "p99_ms": round(p99, 2),
+                        "rejected_503": rejected,
+                    }
+                )
+    server.shutdown()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
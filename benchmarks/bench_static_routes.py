@@ -0,0 +1,148 @@
+"""
+Benchmark requests per second on the static routes (/, /docs, /redoc, /openapi.json).
+
+Requests are sent directly to the ASGI app in-process (without a network or HTTP server),
+so the numbers reflect the cost of handling each request in the app itself. The app is compared with
+a baseline app that builds the responses on every request, as the API did before they were precomputed.
+Conditional requests (with If-None-Match set to the ETag of a previous response) are measured separately.
+
+Usage: python -m benchmarks.bench_static_routes --requests 2000
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.responses import HTMLResponse
+
+from app.main import FAVICON_URL
+from app.main import app as current_app
+
+from .utils import print_table
+
+ROUTES = ["/", "/docs", "/redoc", "/openapi.json"]
+
+
+def create_baseline_app() -> FastAPI:
+    """An app whose static routes build their responses on every request."""
+    baseline_app = FastAPI(docs_url=None, redoc_url=None)
+
+    @baseline_app.get("/", response_class=HTMLResponse)
+    def root(request: Request):
+        return f"""
+        <html>
+            <body>
+                <h1>Welcome to the API for <a href="https://github.com/OpenNeuroDatasets-JSONLD" target="_blank">Neurobagel-annotated OpenNeuro Datasets!</a></h1>
+                <p>Please visit the <a href="{request.scope.get("root_path", "")}/docs">API documentation</a> to view available API endpoints.</p>
+            </body>
+        </html>
+        """
+
+    @baseline_app.get("/docs", include_in_schema=False)
+    def overridden_swagger(request: Request):
+        return get_swagger_ui_html(
+            openapi_url=f"{request.scope.get('root_path', '')}/openapi.json",
+            title="Neurobagel OpenNeuro Datasets API",
+            swagger_favicon_url=FAVICON_URL,
+        )
+
+    @baseline_app.get("/redoc", include_in_schema=False)
+    def overridden_redoc(request: Request):
+        return get_redoc_html(
+            openapi_url=f"{request.scope.get('root_path', '')}/openapi.json",
+            title="Neurobagel OpenNeuro Datasets API",
+            redoc_favicon_url=FAVICON_URL,
+        )
+
+    # Serve the same schema as the current app
+    baseline_app.openapi = current_app.openapi
+    return baseline_app
+
+
+async def send_request(
+    app, path: str, headers: list[tuple[bytes, bytes]]
+) -> tuple[int, dict]:
+    """Send a GET request to an ASGI app and return the response status and headers."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost"), *headers],
+        "client": ("127.0.0.1", 12345),
+        "server": ("localhost", 80),
+        "app": app,
+    }
+    response = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                key.decode().lower(): value.decode()
+                for key, value in message["headers"]
+            }
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"]
+
+
+async def measure(app, path: str, n_requests: int, conditional: bool):
+    headers = [(b"accept-encoding", b"gzip")]
+    if conditional:
+        _, first_headers = await send_request(app, path, headers)
+        if "etag" not in first_headers:
+            return None
+        headers.append((b"if-none-match", first_headers["etag"].encode()))
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        status, _ = await send_request(app, path, headers)
+    elapsed = time.perf_counter() - start
+    return status, n_requests / elapsed
+
+
+async def run(n_requests: int):
+    baseline_app = create_baseline_app()
+    rows = []
+    for path in ROUTES:
+        _, baseline_rps = await measure(
+            baseline_app, path, n_requests, conditional=False
+        )
+        _, current_rps = await measure(
+            current_app, path, n_requests, conditional=False
+        )
+        conditional_status, conditional_rps = await measure(
+            current_app, path, n_requests, conditional=True
+        )
+        rows.append(
+            {
+                "route": path,
+                "baseline_rps": round(baseline_rps),
+                "precomputed_rps": round(current_rps),
+                "conditional_rps": round(conditional_rps),
+                "conditional_status": conditional_status,
+                "speedup": f"{current_rps / baseline_rps:.1f}x",
+            }
+        )
+    print_table(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark the latency of validating a re-uploaded data dictionary with and without the per-column validation cache.
+
+A data dictionary is validated once (as the first upload), then a few of its columns are changed
+and it is validated again (as a re-upload after fixing those columns).
+The re-upload is timed with the cache disabled (every column is checked again) and enabled
+(only the changed columns are checked again), and the cache hits and misses of the re-upload are reported.
+
+Usage: python -m benchmarks.bench_validation_cache --columns 1000 --changed 5
+"""
+
+import argparse
+import time
+import warnings
+
+from app.api import dictionary_utils
+
+from .utils import make_data_dictionary, print_table
+
+
+def validate(data_dict: dict) -> float:
+    """Validate a data dictionary and return the time taken in milliseconds."""
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        dictionary_utils.validate_data_dict(data_dict)
+    return (time.perf_counter() - start) * 1000
+
+
+def lookups(result: str) -> int:
+    return int(dictionary_utils.VALIDATION_CACHE_LOOKUPS.value(result=result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--columns", type=int, default=1000)
+    parser.add_argument("--changed", type=int, default=5)
+    args = parser.parse_args()
+
+    first_upload = make_data_dictionary(args.columns)
+    reupload = make_data_dictionary(args.columns)
+    for i in range(args.changed):
+        reupload[f"item_{i}"]["Description"] = f"Fixed description {i}"
+
+    rows = []
+    for label, max_entries in [("disabled", 0), ("enabled", 50_000)]:
+        dictionary_utils.validation_cache = dictionary_utils.ColumnFactsCache(
+            max_entries
+        )
+        first_ms = validate(first_upload)
+        hits, misses = lookups("hit"), lookups("miss")
+        reupload_ms = validate(reupload)
+        rows.append(
+            {
+                "cache": label,
+                "first_upload_ms": round(first_ms, 1),
+                "reupload_ms": round(reupload_ms, 1),
+                "reupload_hits": lookups("hit") - hits,
+                "reupload_misses": lookups("miss") - misses,
+            }
+        )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
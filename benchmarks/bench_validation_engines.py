@@ -0,0 +1,78 @@
+"""
+Benchmark the latency of validating data dictionaries of increasing size with each validation engine.
+
+Each data dictionary is validated with the per-column validation cache disabled (as for a first upload),
+both when it is valid and when one of its columns is invalid, and the median of several runs is reported.
+The time spent in the schema check alone (the part the engines differ in) is reported separately.
+
+Usage: python -m benchmarks.bench_validation_engines --columns 10 100 1000 10000
+"""
+
+import argparse
+import statistics
+import time
+import warnings
+
+from app.api import dictionary_utils
+
+from .utils import make_data_dictionary, print_table
+
+
+def time_ms(function, *args) -> float:
+    """Call a function and return the time taken in milliseconds, ignoring any ValueError it raises."""
+    start = time.perf_counter()
+    try:
+        function(*args)
+    except ValueError:
+        pass
+    return (time.perf_counter() - start) * 1000
+
+
+def median_ms(repeats: int, function, *args) -> float:
+    return round(
+        statistics.median(time_ms(function, *args) for _ in range(repeats)), 2
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--columns", type=int, nargs="+", default=[10, 100, 1000, 10000]
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    dictionary_utils.validation_cache = dictionary_utils.ColumnFactsCache(0)
+    warnings.simplefilter("ignore", UserWarning)
+    rows = []
+    for n_columns in args.columns:
+        valid_dict = make_data_dictionary(n_columns)
+        invalid_dict = make_data_dictionary(n_columns)
+        invalid_dict["age"]["Annotations"]["VariableType"] = "Cont"
+        for engine_class in dictionary_utils.VALIDATION_ENGINES.values():
+            engine = engine_class()
+            dictionary_utils.validation_engine = engine
+            rows.append(
+                {
+                    "columns": n_columns,
+                    "engine": engine.name,
+                    "valid_ms": median_ms(
+                        args.repeats,
+                        dictionary_utils.validate_data_dict,
+                        valid_dict,
+                    ),
+                    "invalid_ms": median_ms(
+                        args.repeats,
+                        dictionary_utils.validate_data_dict,
+                        invalid_dict,
+                    ),
+                    "schema_check_ms": median_ms(
+                        args.repeats, engine.find_errors, valid_dict
+                    ),
+                }
+            )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark the time taken to check the TermURLs of a data dictionary against the bundled controlled vocabularies.
+
+The check is timed on its own and as a share of the full data dictionary validation, for dictionaries of increasing size.
+
+Usage: python -m benchmarks.bench_vocabulary --repeat 20
+"""
+
+import argparse
+import time
+
+from app.api import dictionary_utils, vocabulary
+
+from .utils import make_data_dictionary, print_table
+
+
+def best_time(func, data_dict: dict, repeat: int) -> float:
+    """Return the fastest of several runs of a function, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data_dict)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = []
+    for n_columns in (10, 100, 1000, 10000):
+        data_dict = make_data_dictionary(n_columns)
+        vocabulary_ms = best_time(
+            vocabulary.get_unrecognized_terms, data_dict, args.repeat
+        )
+        validation_ms = best_time(
+            dictionary_utils.validate_data_dict, data_dict, args.repeat
+        )
+        rows.append(
+            {
+                "columns": n_columns,
+                "vocabulary_check_ms": round(vocabulary_ms, 3),
+                "full_validation_ms": round(validation_ms, 1),
+                "share": f"{vocabulary_ms / validation_ms:.1%}",
+            }
+        )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark upload throughput against the number of API worker processes.
+
+The API is run with the production entry point (app/server.py) against a local GitHub stand-in,
+and a fixed number of uploads (each to a different dataset) are sent with a fixed client concurrency.
+The stand-in's authentication request counts show that workers share installation tokens
+instead of each authenticating with GitHub.
+
+Usage: python -m benchmarks.bench_workers --workers 1 2 4 --uploads 32 --concurrency 8
+"""
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from .github_stub import start_stub, stub_url
+from .utils import dumps, make_data_dictionary, print_table, run_api
+
+
+def upload(api_url: str, dataset_id: str, contents: bytes) -> int:
+    response = requests.put(
+        f"{api_url}/openneuro/upload",
+        params={"dataset_id": dataset_id},
+        files={"data_dictionary": contents},
+        data={
+            "changes_summary": "Benchmark upload",
+            "name": "Benchmark User",
+            "email": "benchmark@example.com",
+        },
+        timeout=300,
+    )
+    return response.status_code
+
+
+def run(n_workers: int, n_uploads: int, concurrency: int, latency_ms: float):
+    existing = dumps(make_data_dictionary(20))
+    server, state = start_stub(
+        n_datasets=n_uploads, participants_json=existing, latency_ms=latency_ms
+    )
+    github_url = stub_url(server)
+    new_contents = dumps(make_data_dictionary(20, seed=" (updated)"))
+
+    with (
+        tempfile.TemporaryDirectory() as tmp_dir,
+        run_api(
+            Path(tmp_dir),
+            8765,
+            github_url,
+            NB_UPLOADER_API_WORKERS=n_workers,
+            NB_UPLOADER_API_PRELOAD="true",
+        ) as api_url,
+    ):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            statuses = list(
+                pool.map(
+                    lambda i: upload(api_url, f"ds{i:06d}", new_contents),
+                    range(n_uploads),
+                )
+            )
+        elapsed = time.perf_counter() - start
+
+    server.shutdown()
+    return {
+        "workers": n_workers,
+        "uploads": n_uploads,
+        "ok": sum(status == 200 for status in statuses),
+        "seconds": round(elapsed, 2),
+        "uploads/s": round(n_uploads / elapsed, 2),
+        "token_requests": state.request_counts["create_access_token"],
+        "installation_lookups": state.request_counts["get_org_installation"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--uploads", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=50,
+        help="Artificial latency of each GitHub stand-in response",
+    )
+    args = parser.parse_args()
+
+    print_table(
+        [
+            run(n, args.uploads, args.concurrency, args.latency_ms)
+            for n in args.workers
+        ]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,747 @@
+"""
+A minimal local stand-in for the parts of the GitHub REST API used by the uploader API.
+
+It keeps an in-memory organization of dataset repositories, each with a participants.json file,
+and counts the requests it receives per endpoint so benchmarks can report GitHub traffic.
+An artificial per-request latency can be added to mimic the round trip to api.github.com.
+
+It can also serve HTTPS with a self-signed certificate and add a delay to every new connection,
+to mimic the cost of setting up connections to api.github.com.
+
+Usage: python -m benchmarks.github_stub --port 9000 --datasets 100 --latency-ms 50
+"""
+
+import argparse
+import base64
+import hashlib
+import ipaddress
+import json
+import re
+import ssl
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+ORG = "OpenNeuroDatasets-JSONLD"
+TOKEN_LIFETIME = 60 * 60
+# Like GitHub, commits made through the API with an installation token are authored by the app's bot user
+BOT_AUTHOR = {
+    "name": "neurobagel-bot[bot]",
+    "email": "1+neurobagel-bot[bot]@users.noreply.github.com",
+}
+
+
+def bot_signature(at: datetime | None = None) -> dict:
+    """Return the author (and committer) of a commit made by the bot at the given time (by default, now)."""
+    at = at or datetime.now(timezone.utc)
+    return {**BOT_AUTHOR, "date": at.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+
+def git_blob_sha(content: bytes) -> str:
+    """Compute the SHA GitHub uses to identify a blob with the given content."""
+    return hashlib.sha1(
+        b"blob " + str(len(content)).encode() + b"\0" + content
+    ).hexdigest()
+
+
+class StubState:
+    """In-memory contents of the stand-in organization."""
+
+    def __init__(self, n_datasets: int, participants_json: bytes):
+        self.lock = threading.Lock()
+        self.request_counts = Counter()
+        self.repos = {}
+        for i in range(n_datasets):
+            self.add_repo(f"ds{i:06d}", participants_json)
+        self.pull_number = 0
+
+    def add_repo(self, name: str, participants_json: bytes | None):
+        files = {}
+        if participants_json is not None:
+            files["participants.json"] = participants_json
+        head_sha = hashlib.sha1(f"{name}-0".encode()).hexdigest()
+        self.repos[name] = {
+            "default_branch": "main",
+            "branches": {"main": head_sha},
+            "files": files,
+            "pushed_at": "2025-01-01T00:00:00Z",
+            "pulls": [],
+            # Comment bodies by pull request number
+            "comments": {},
+            # Trees and commits created with the Git database API, by SHA
+            "trees": {},
+            "commits": {},
+        }
+
+    def touch(self, name: str):
+        """Record a push to a repository (any change to its branches), as GitHub does in pushed_at."""
+        self.repos[name]["pushed_at"] = time.strftime(
+            "%Y-%m-%dT%H:%M:%SZ", time.gmtime()
+        )
+
+
+def repo_json(base_url: str, name: str, repo: dict) -> dict:
+    return {
+        "id": abs(hash(name)) % 10**8,
+        "name": name,
+        "full_name": f"{ORG}/{name}",
+        "default_branch": repo["default_branch"],
+        "html_url": f"https://github.com/{ORG}/{name}",
+        "url": f"{base_url}/repos/{ORG}/{name}",
+        "pushed_at": repo["pushed_at"],
+        "owner": {"login": ORG},
+    }
+
+
+def tree_entries(files: dict) -> list[dict]:
+    return [
+        {
+            "path": path,
+            "mode": "100644",
+            "type": "blob",
+            "sha": git_blob_sha(content),
+        }
+        for path, content in sorted(files.items())
+    ]
+
+
+def files_tree_sha(files: dict) -> str:
+    """Identify a tree of files by a hash of its entries."""
+    return hashlib.sha1(json.dumps(tree_entries(files)).encode()).hexdigest()
+
+
+def tree_json(repo: dict) -> dict:
+    """The root tree of a repository's default branch."""
+    return {
+        "sha": files_tree_sha(repo["files"]),
+        "tree": tree_entries(repo["files"]),
+        "truncated": False,
+    }
+
+
+def branch_files(repo: dict, branch: str) -> dict:
+    """
+    Return the files on a branch: those of the commit at its head if it was created through the stub,
+    or otherwise those of the default branch (e.g., for a new branch created at the head of the default branch).
+    """
+    commit = repo["commits"].get(repo["branches"].get(branch))
+    if commit is None or commit["tree"] not in repo["trees"]:
+        return dict(repo["files"])
+    return dict(repo["trees"][commit["tree"]])
+
+
+def content_json(base_url: str, name: str, path: str, content: bytes):
+    is_large = len(content) > 1024 * 1024
+    return {
+        "type": "file",
+        "encoding": "none" if is_large else "base64",
+        "name": path.rsplit("/", 1)[-1],
+        "path": path,
+        "size": len(content),
+        "sha": git_blob_sha(content),
+        "url": f"{base_url}/repos/{ORG}/{name}/contents/{path}",
+        # Like GitHub, omit inline content for files over 1 MB
+        "content": "" if is_large else base64.encodebytes(content).decode(),
+    }
+
+
+def make_handler(state: StubState, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        @property
+        def base_url(self) -> str:
+            return stub_url(self.server)
+
+        def _send(
+            self, status: int, body=None, raw: bytes | None = None, headers=()
+        ):
+            if raw is None:
+                raw = b"" if body is None else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _not_found(self):
+            self._send(404, {"message": "Not Found"})
+
+        def _read_body(self) -> dict:
+            return json.loads(self.body or b"{}")
+
+        def _handle(self, verb: str):
+            # Always consume the body, so that the next request on a keep-alive connection can be read
+            length = int(self.headers.get("Content-Length") or 0)
+            self.body = self.rfile.read(length)
+            path = urlsplit(self.path).path
+            for route_verb, pattern, name in ROUTES:
+                if route_verb == verb and (match := pattern.fullmatch(path)):
+                    with state.lock:
+                        state.request_counts[name] += 1
+                    if latency:
+                        time.sleep(latency)
+                    return getattr(self, name)(*match.groups())
+            self._not_found()
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+        def do_PATCH(self):
+            self._handle("PATCH")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        # Endpoint implementations
+        def get_org_installation(self, org):
+            self._send(200, {"id": 1, "app_id": 1, "account": {"login": org}})
+
+        def create_access_token(self, installation_id):
+            expires_at = time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + TOKEN_LIFETIME)
+            )
+            self._send(
+                201, {"token": "ghs_stubtoken", "expires_at": expires_at}
+            )
+
+        def get_org(self, org):
+            self._send(
+                200,
+                {"login": org, "url": f"{self.base_url}/orgs/{org}"},
+            )
+
+        def list_org_repos(self, org):
+            # Paginated like GitHub, with an ETag per page so that clients can make conditional requests
+            query = parse_qs(urlsplit(self.path).query)
+            per_page = int(query.get("per_page", ["30"])[0])
+            page = int(query.get("page", ["1"])[0])
+            with state.lock:
+                start = (page - 1) * per_page
+                names = sorted(state.repos)[start:][:per_page]
+                repos = [
+                    repo_json(self.base_url, name, state.repos[name])
+                    for name in names
+                ]
+                has_next = len(state.repos) > page * per_page
+            raw = json.dumps(repos).encode()
+            etag = f'"{hashlib.sha1(raw).hexdigest()}"'
+            headers = [("ETag", etag)]
+            if has_next:
+                next_url = f"{self.base_url}/orgs/{org}/repos?per_page={per_page}&page={page + 1}"
+                headers.append(("Link", f'<{next_url}>; rel="next"'))
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, raw=b"", headers=headers)
+            self._send(200, raw=raw, headers=headers)
+
+        def get_repo(self, name):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            self._send(200, repo_json(self.base_url, name, repo))
+
+        def get_contents(self, name, path):
+            repo = state.repos.get(name)
+            if repo is None or path not in repo["files"]:
+                return self._not_found()
+            raw = json.dumps(
+                content_json(self.base_url, name, path, repo["files"][path])
+            ).encode()
+            # Like GitHub, with an ETag so that clients can make conditional requests
+            etag = f'"{hashlib.sha1(raw).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, raw=b"", headers=[("ETag", etag)])
+            self._send(200, raw=raw, headers=[("ETag", etag)])
+
+        def put_contents(self, name, path):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            body = self._read_body()
+            content = base64.b64decode(body["content"])
+            branch = body.get("branch", repo["default_branch"])
+            with state.lock:
+                # The files of other branches are tracked as commits (see branch_files)
+                parent_sha = repo["branches"].get(branch)
+                files = branch_files(repo, branch)
+                # Like GitHub, an existing file can only be updated given its current blob SHA
+                if path in files and body.get("sha") != git_blob_sha(
+                    files[path]
+                ):
+                    return self._send(
+                        409, {"message": f"{path} does not match"}
+                    )
+                new_sha = hashlib.sha1(content + branch.encode()).hexdigest()
+                if branch == repo["default_branch"]:
+                    repo["files"][path] = content
+                    state.touch(name)
+                else:
+                    files[path] = content
+                    tree_sha = files_tree_sha(files)
+                    repo["trees"][tree_sha] = files
+                    repo["commits"][new_sha] = {
+                        "message": body["message"],
+                        "tree": tree_sha,
+                        "parents": [parent_sha],
+                        "author": bot_signature(),
+                    }
+                repo["branches"][branch] = new_sha
+            self._send(
+                200,
+                {
+                    "content": content_json(
+                        self.base_url, name, path, content
+                    ),
+                    "commit": {"sha": new_sha},
+                },
+            )
+
+        def get_branch(self, name, branch):
+            repo = state.repos.get(name)
+            if repo is None or branch not in repo["branches"]:
+                return self._not_found()
+            self._send(
+                200,
+                {
+                    "name": branch,
+                    "commit": {
+                        "sha": repo["branches"][branch],
+                        "commit": {"tree": {"sha": tree_json(repo)["sha"]}},
+                    },
+                },
+            )
+
+        def get_tree(self, name, tree_sha):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            with state.lock:
+                tree = tree_json(repo)
+            if tree_sha not in (tree["sha"], repo["default_branch"]):
+                return self._not_found()
+            self._send(200, tree)
+
+        def get_blob(self, name, blob_sha):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            for content in list(repo["files"].values()):
+                if git_blob_sha(content) != blob_sha:
+                    continue
+                if "raw" in self.headers.get("Accept", ""):
+                    return self._send(200, raw=content)
+                return self._send(
+                    200,
+                    {
+                        "sha": blob_sha,
+                        "size": len(content),
+                        "encoding": "base64",
+                        "content": base64.encodebytes(content).decode(),
+                    },
+                )
+            self._not_found()
+
+        def get_git_commit(self, name, commit_sha):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            with state.lock:
+                if commit_sha in repo["commits"]:
+                    commit = repo["commits"][commit_sha]
+                elif commit_sha == repo["branches"][repo["default_branch"]]:
+                    commit = {
+                        "message": "Initial commit",
+                        "tree": tree_json(repo)["sha"],
+                        "parents": [],
+                        "author": {
+                            "name": "OpenNeuro",
+                            "email": "git@openneuro.org",
+                            "date": "2024-01-01T00:00:00Z",
+                        },
+                    }
+                else:
+                    return self._not_found()
+            self._send(
+                200,
+                {
+                    "sha": commit_sha,
+                    "url": f"{self.base_url}/repos/{ORG}/{name}/git/commits/{commit_sha}",
+                    "message": commit["message"],
+                    "author": commit["author"],
+                    "committer": commit["author"],
+                    "tree": {"sha": commit["tree"]},
+                    "parents": [{"sha": sha} for sha in commit["parents"]],
+                },
+            )
+
+        def create_tree(self, name):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            body = self._read_body()
+            with state.lock:
+                base_tree = body.get("base_tree")
+                if base_tree is None:
+                    files = {}
+                elif base_tree == tree_json(repo)["sha"]:
+                    files = dict(repo["files"])
+                elif base_tree in repo["trees"]:
+                    files = dict(repo["trees"][base_tree])
+                else:
+                    return self._send(422, {"message": "Invalid tree info"})
+                for entry in body["tree"]:
+                    files[entry["path"]] = entry["content"].encode()
+                tree_sha = files_tree_sha(files)
+                repo["trees"][tree_sha] = files
+            self._send(
+                201,
+                {
+                    "sha": tree_sha,
+                    "url": f"{self.base_url}/repos/{ORG}/{name}/git/trees/{tree_sha}",
+                    "tree": [
+                        {"path": path, "type": "blob"}
+                        for path in sorted(files)
+                    ],
+                    "truncated": False,
+                },
+            )
+
+        def create_commit(self, name):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            body = self._read_body()
+            if body["tree"] not in repo["trees"]:
+                return self._send(422, {"message": "Tree SHA does not exist"})
+            commit_sha = hashlib.sha1(
+                json.dumps(body, sort_keys=True).encode()
+            ).hexdigest()
+            with state.lock:
+                repo["commits"][commit_sha] = {
+                    "message": body["message"],
+                    "tree": body["tree"],
+                    "parents": body["parents"],
+                    "author": bot_signature(),
+                }
+            self._send(
+                201,
+                {
+                    "sha": commit_sha,
+                    "url": f"{self.base_url}/repos/{ORG}/{name}/git/commits/{commit_sha}",
+                    "message": body["message"],
+                    "tree": {"sha": body["tree"]},
+                    "parents": [{"sha": sha} for sha in body["parents"]],
+                },
+            )
+
+        def create_ref(self, name):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            body = self._read_body()
+            branch = body["ref"].removeprefix("refs/heads/")
+            with state.lock:
+                if branch in repo["branches"]:
+                    return self._send(
+                        422, {"message": "Reference already exists"}
+                    )
+                repo["branches"][branch] = body["sha"]
+                state.touch(name)
+            self._send(
+                201,
+                {
+                    "ref": body["ref"],
+                    "url": f"{self.base_url}/repos/{ORG}/{name}/git/{body['ref']}",
+                    "object": {"sha": body["sha"], "type": "commit"},
+                },
+            )
+
+        def update_ref(self, name, ref):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            body = self._read_body()
+            branch = unquote(ref).removeprefix("heads/")
+            with state.lock:
+                if branch not in repo["branches"]:
+                    return self._send(
+                        422, {"message": "Reference does not exist"}
+                    )
+                # Like GitHub, only fast-forwards are allowed unless forced
+                parents = (
+                    repo["commits"].get(body["sha"], {}).get("parents", [])
+                )
+                if (
+                    not body.get("force")
+                    and repo["branches"][branch] not in parents
+                ):
+                    return self._send(
+                        422, {"message": "Update is not a fast forward"}
+                    )
+                repo["branches"][branch] = body["sha"]
+                state.touch(name)
+            self._send(
+                200,
+                {
+                    "ref": f"refs/heads/{branch}",
+                    "url": f"{self.base_url}/repos/{ORG}/{name}/git/refs/heads/{branch}",
+                    "object": {"sha": body["sha"], "type": "commit"},
+                },
+            )
+
+        def list_matching_refs(self, name, ref):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            prefix = unquote(ref)
+            with state.lock:
+                branches = list(repo["branches"].items())
+            refs = [
+                {
+                    "ref": f"refs/heads/{branch}",
+                    "url": f"{self.base_url}/repos/{ORG}/{name}/git/refs/heads/{branch}",
+                    "object": {"sha": sha, "type": "commit"},
+                }
+                for branch, sha in branches
+                if f"heads/{branch}".startswith(prefix)
+            ]
+            self._send(200, refs)
+
+        def delete_ref(self, name, ref):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            branch = unquote(ref).removeprefix("heads/")
+            with state.lock:
+                if repo["branches"].pop(branch, None) is None:
+                    return self._send(
+                        422, {"message": "Reference does not exist"}
+                    )
+                state.touch(name)
+            self._send(204)
+
+        def list_pulls(self, name):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            query = parse_qs(urlsplit(self.path).query)
+            pull_state = query.get("state", ["open"])[0]
+            self._send(
+                200,
+                [
+                    pull
+                    for pull in repo["pulls"]
+                    if pull_state == "all" or pull["state"] == pull_state
+                ],
+            )
+
+        def get_pull(self, name, number):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            for pull in repo["pulls"]:
+                if pull["number"] == int(number):
+                    return self._send(200, pull)
+            self._not_found()
+
+        def create_issue_comment(self, name, number):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            body = self._read_body()
+            if not any(
+                pull["number"] == int(number) for pull in repo["pulls"]
+            ):
+                return self._not_found()
+            with state.lock:
+                comments = repo["comments"].setdefault(int(number), [])
+                comments.append(body["body"])
+            self._send(201, {"id": len(comments), "body": body["body"]})
+
+        def create_pull(self, name):
+            if (repo := state.repos.get(name)) is None:
+                return self._not_found()
+            body = self._read_body()
+            with state.lock:
+                state.pull_number += 1
+                number = state.pull_number
+                pull = {
+                    "number": number,
+                    "state": "open",
+                    "title": body["title"],
+                    "body": body.get("body"),
+                    "head": {"ref": body["head"]},
+                    "base": {"ref": body["base"]},
+                    "html_url": f"https://github.com/{ORG}/{name}/pull/{number}",
+                    "url": f"{self.base_url}/repos/{ORG}/{name}/pulls/{number}",
+                }
+                repo["pulls"].append(pull)
+            self._send(201, pull)
+
+    return Handler
+
+
+# (verb, path pattern, name of the Handler method implementing the endpoint)
+ROUTES = [
+    (verb, re.compile(pattern), name)
+    for verb, pattern, name in [
+        ("GET", r"/orgs/([^/]+)/installation", "get_org_installation"),
+        (
+            "POST",
+            r"/app/installations/(\d+)/access_tokens",
+            "create_access_token",
+        ),
+        ("GET", r"/orgs/([^/]+)", "get_org"),
+        ("GET", r"/orgs/([^/]+)/repos", "list_org_repos"),
+        ("GET", rf"/repos/{ORG}/([^/]+)", "get_repo"),
+        ("GET", rf"/repos/{ORG}/([^/]+)/contents/(.+)", "get_contents"),
+        ("PUT", rf"/repos/{ORG}/([^/]+)/contents/(.+)", "put_contents"),
+        ("GET", rf"/repos/{ORG}/([^/]+)/branches/(.+)", "get_branch"),
+        ("POST", rf"/repos/{ORG}/([^/]+)/git/refs", "create_ref"),
+        ("GET", rf"/repos/{ORG}/([^/]+)/git/commits/(\w+)", "get_git_commit"),
+        ("POST", rf"/repos/{ORG}/([^/]+)/git/trees", "create_tree"),
+        ("POST", rf"/repos/{ORG}/([^/]+)/git/commits", "create_commit"),
+        ("GET", rf"/repos/{ORG}/([^/]+)/git/trees/(.+)", "get_tree"),
+        ("GET", rf"/repos/{ORG}/([^/]+)/git/blobs/(\w+)", "get_blob"),
+        ("POST", rf"/repos/{ORG}/([^/]+)/pulls", "create_pull"),
+        ("GET", rf"/repos/{ORG}/([^/]+)/pulls", "list_pulls"),
+        ("GET", rf"/repos/{ORG}/([^/]+)/pulls/(\d+)", "get_pull"),
+        (
+            "POST",
+            rf"/repos/{ORG}/([^/]+)/issues/(\d+)/comments",
+            "create_issue_comment",
+        ),
+        (
+            "GET",
+            rf"/repos/{ORG}/([^/]+)/git/matching-refs/(.+)",
+            "list_matching_refs",
+        ),
+        ("PATCH", rf"/repos/{ORG}/([^/]+)/git/refs/(.+)", "update_ref"),
+        ("DELETE", rf"/repos/{ORG}/([^/]+)/git/refs/(.+)", "delete_ref"),
+    ]
+]
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP(S) server that counts the connections it accepts.
+
+    connect_latency mimics the network round trips needed to set up a new connection
+    (TCP and TLS handshakes), which is paid once per connection rather than once per request.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, handler, tls_context=None, connect_latency=0):
+        super().__init__(address, handler)
+        self.tls_context = tls_context
+        self.connect_latency = connect_latency
+        self.connections_accepted = 0
+
+    def get_request(self):
+        sock, address = super().get_request()
+        self.connections_accepted += 1
+        if self.tls_context is not None:
+            # The handshake is done in the handler thread (see finish_request) so accepting stays fast
+            sock = self.tls_context.wrap_socket(
+                sock, server_side=True, do_handshake_on_connect=False
+            )
+        return sock, address
+
+    def finish_request(self, request, client_address):
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        if self.tls_context is not None:
+            request.do_handshake()
+        super().finish_request(request, client_address)
+
+
+def create_tls_context(tmp_dir: Path) -> tuple[ssl.SSLContext, Path]:
+    """Create a server TLS context with a self-signed certificate for 127.0.0.1, and return it with the certificate path."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName(
+                [x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]
+            ),
+            critical=False,
+        )
+        .add_extension(
+            x509.BasicConstraints(ca=True, path_length=None), critical=True
+        )
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = tmp_dir / "stub_cert.pem"
+    key_path = tmp_dir / "stub_key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context, cert_path
+
+
+def start_stub(
+    port: int = 0,
+    n_datasets: int = 10,
+    participants_json: bytes = b"{}",
+    latency_ms: float = 0,
+    connect_latency_ms: float = 0,
+    tls_context: ssl.SSLContext | None = None,
+) -> tuple[StubServer, StubState]:
+    """Start the stand-in in a background thread and return the server and its state."""
+    state = StubState(n_datasets, participants_json)
+    server = StubServer(
+        ("127.0.0.1", port),
+        make_handler(state, latency_ms / 1000),
+        tls_context=tls_context,
+        connect_latency=connect_latency_ms / 1000,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def stub_url(server: StubServer) -> str:
+    scheme = "https" if server.tls_context is not None else "http"
+    return f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--datasets", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    server, state = start_stub(
+        args.port, args.datasets, latency_ms=args.latency_ms
+    )
+    print(f"GitHub stand-in listening on {stub_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(dict(state.request_counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Helpers shared by the benchmark scripts."""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+REPO_ROOT = Path(__file__).absolute().parent.parent
+
+
+def make_data_dictionary(n_columns: int, seed: str = "") -> dict:
+    """
+    Create a valid Neurobagel data dictionary with a participant ID column, an age column,
+    a sex column and n_columns - 3 assessment tool item columns.
+    """
+    data_dict = {
+        "participant_id": {
+            "Description": "A participant ID",
+            "Annotations": {
+                "IsAbout": {
+                    "TermURL": "nb:ParticipantID",
+                    "Label": "Unique participant identifier",
+                },
+                "VariableType": "Identifier",
+            },
+        },
+        "age": {
+            "Description": f"Age of the participant{seed}",
+            "Annotations": {
+                "IsAbout": {"TermURL": "nb:Age", "Label": "Age"},
+                "Format": {
+                    "TermURL": "nb:FromFloat",
+                    "Label": "float value",
+                },
+                "MissingValues": ["n/a"],
+                "VariableType": "Continuous",
+            },
+            "Units": "years",
+        },
+        "sex": {
+            "Description": "Sex of the participant",
+            "Levels": {"M": "Male", "F": "Female"},
+            "Annotations": {
+                "IsAbout": {"TermURL": "nb:Sex", "Label": "Sex"},
+                "Levels": {
+                    "M": {"TermURL": "snomed:248153007", "Label": "Male"},
+                    "F": {"TermURL": "snomed:248152002", "Label": "Female"},
+                },
+                "MissingValues": [],
+                "VariableType": "Categorical",
+            },
+        },
+    }
+    for i in range(max(n_columns - 3, 0)):
+        data_dict[f"item_{i}"] = {
+            "Description": f"Item {i} of an assessment",
+            "Annotations": {
+                "IsAbout": {
+                    "TermURL": "nb:Assessment",
+                    "Label": "Assessment tool",
+                },
+                "IsPartOf": {
+                    "TermURL": "snomed:273712001",
+                    "Label": "Previous assessment",
+                },
+                "MissingValues": [],
+                "VariableType": "Collection",
+            },
+        }
+    return data_dict
+
+
+def write_private_key(path: Path) -> None:
+    """Write a throwaway RSA private key, which the API needs to sign its GitHub App JWTs."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+    )
+
+
+@contextmanager
+def run_api(tmp_dir: Path, port: int, github_url: str, **env_overrides):
+    """Run the API with the production entry point in a subprocess, configured to talk to a GitHub stand-in."""
+    key_path = tmp_dir / "private_key.pem"
+    if not key_path.exists():
+        write_private_key(key_path)
+    env = {
+        **os.environ,
+        "NB_BOT_ID": "1",
+        "NB_BOT_KEY_PATH": str(key_path),
+        "NB_GITHUB_API_URL": github_url,
+        "NB_API_PORT": str(port),
+        "NB_UPLOADER_API_CACHE_PATH": str(tmp_dir / "cache.sqlite3"),
+        **{key: str(value) for key, value in env_overrides.items()},
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.server"],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}/")
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def free_port() -> int:
+    """Return a local port that is free to run a server on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+def print_table(rows: list[dict]) -> None:
+    """Print a list of result rows as an aligned plain-text table."""
+    columns = list(rows[0])
+    widths = {
+        col: max(len(col), *(len(str(row[col])) for row in rows))
+        for col in columns
+    }
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    for row in rows:
+        print("  ".join(str(row[col]).ljust(widths[col]) for col in columns))
+
+
+def dumps(data_dict: dict) -> bytes:
+    return json.dumps(data_dict, indent=4).encode()
@@ -1,9 +1,97 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
 from pathlib import Path
 
 import pytest
 from starlette.testclient import TestClient
 
-from app.main import app
+# Keep the state of the app under test out of the default files in the system's temporary directory,
+# which persist across test runs and are shared with any local server (this must happen before the app is imported)
+_state_dir = tempfile.mkdtemp(prefix="nb_uploader_api_tests_")
+atexit.register(shutil.rmtree, _state_dir, ignore_errors=True)
+os.environ["NB_UPLOADER_API_CACHE_BACKEND"] = "memory"
+os.environ["NB_UPLOADER_API_CACHE_PATH"] = os.path.join(
+    _state_dir, "cache.sqlite3"
+)
+os.environ["NB_UPLOADER_API_DATASET_LOCK_PATH"] = os.path.join(
+    _state_dir, "locks"
+)
+os.environ["NB_UPLOADER_API_UPLOAD_SLOT_PATH"] = os.path.join(
+    _state_dir, "upload_slots"
+)
+os.environ["NB_UPLOADER_API_MIRROR_PATH"] = os.path.join(_state_dir, "mirror")
+
+from app.main import app  # noqa: E402
+
+
+def make_data_dictionary(n_columns: int, seed: str = "") -> dict:
+    """
+    Create a valid Neurobagel data dictionary with a participant ID column, an age column,
+    a sex column and n_columns - 3 assessment tool item columns.
+    """
+    data_dict = {
+        "participant_id": {
+            "Description": "A participant ID",
+            "Annotations": {
+                "IsAbout": {
+                    "TermURL": "nb:ParticipantID",
+                    "Label": "Unique participant identifier",
+                },
+                "VariableType": "Identifier",
+            },
+        },
+        "age": {
+            "Description": f"Age of the participant{seed}",
+            "Annotations": {
+                "IsAbout": {"TermURL": "nb:Age", "Label": "Age"},
+                "Format": {
+                    "TermURL": "nb:FromFloat",
+                    "Label": "float value",
+                },
+                "MissingValues": ["n/a"],
+                "VariableType": "Continuous",
+            },
+            "Units": "years",
+        },
+        "sex": {
+            "Description": "Sex of the participant",
+            "Levels": {"M": "Male", "F": "Female"},
+            "Annotations": {
+                "IsAbout": {"TermURL": "nb:Sex", "Label": "Sex"},
+                "Levels": {
+                    "M": {"TermURL": "snomed:248153007", "Label": "Male"},
+                    "F": {"TermURL": "snomed:248152002", "Label": "Female"},
+                },
+                "MissingValues": [],
+                "VariableType": "Categorical",
+            },
+        },
+    }
+    for i in range(max(n_columns - 3, 0)):
+        data_dict[f"item_{i}"] = {
+            "Description": f"Item {i} of an assessment",
+            "Annotations": {
+                "IsAbout": {
+                    "TermURL": "nb:Assessment",
+                    "Label": "Assessment tool",
+                },
+                "IsPartOf": {
+                    "TermURL": "snomed:273712001",
+                    "Label": "Previous assessment",
+                },
+                "MissingValues": [],
+                "VariableType": "Collection",
+            },
+        }
+    return data_dict
+
+
+def dumps(data_dict: dict) -> bytes:
+    """Serialize a data dictionary the way files are written by default (indented with 4 spaces)."""
+    return json.dumps(data_dict, indent=4).encode()
 
 
 @pytest.fixture(scope="module")
@@ -59,3 +147,20 @@ def example_new_dict():
             },
         },
     }
+
+
+@pytest.fixture()
+def valid_data_dict():
+    """A minimal data dictionary that passes validation."""
+    return {
+        "participant_id": {
+            "Description": "Participant ID",
+            "Annotations": {
+                "IsAbout": {
+                    "TermURL": "nb:ParticipantID",
+                    "Label": "Unique subject identifier",
+                },
+                "VariableType": "Identifier",
+            },
+        },
+    }
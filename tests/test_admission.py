@@ -0,0 +1,197 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api import admission
+from app.api.admission import AdmissionController, AdmissionRejectedError
+from app.api.locks import SharedSlots
+
+
+def test_requests_over_the_limit_wait_for_a_slot():
+    """A queued request is admitted as soon as a slot is released."""
+
+    async def scenario():
+        controller = AdmissionController(limit=1, max_queue=1, max_wait=5)
+        order = []
+
+        async def request(name, hold):
+            async with controller.slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.create_task(request("first", 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(request("second", 0))
+        await asyncio.sleep(0)
+        assert controller.queue_depth == 1
+
+        await asyncio.gather(first, second)
+        return order, controller.in_flight
+
+    order, in_flight = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert in_flight == 0
+
+
+def test_requests_are_rejected_when_the_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(limit=1, max_queue=1, max_wait=5)
+        release = asyncio.Event()
+
+        async def hold_slot():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejectedError) as e:
+            async with controller.slot():
+                pass
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return e.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after == 5
+
+
+def test_requests_are_rejected_after_waiting_too_long():
+    async def scenario():
+        controller = AdmissionController(limit=1, max_queue=1, max_wait=0.01)
+        release = asyncio.Event()
+
+        async def hold_slot():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejectedError):
+            async with controller.slot():
+                pass
+
+        release.set()
+        await holder
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert (controller.in_flight, controller.queue_depth) == (0, 0)
+
+
+def test_slot_handed_to_a_request_that_timed_out_is_passed_on(monkeypatch):
+    """A request whose wait times out just after it was handed a slot does not keep the slot."""
+
+    async def scenario():
+        controller = AdmissionController(limit=1, max_queue=1, max_wait=5)
+        fd = await controller._acquire()
+
+        async def wait_for(waiter, timeout):
+            # The slot is released (and handed to the waiter) in the same iteration of the event loop as the timeout
+            controller._release(fd)
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission.asyncio, "wait_for", wait_for)
+        with pytest.raises(AdmissionRejectedError):
+            await controller._acquire()
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert (controller.in_flight, controller.queue_depth) == (0, 0)
+
+
+def test_limit_applies_across_workers_sharing_slots(tmp_path):
+    """A request queued in one worker is admitted when a slot is released in another worker."""
+
+    async def scenario():
+        worker_1, worker_2 = (
+            AdmissionController(
+                limit=1,
+                max_queue=1,
+                max_wait=5,
+                shared_slots=SharedSlots(str(tmp_path / "slots"), 1),
+            )
+            for _ in range(2)
+        )
+        release = asyncio.Event()
+        order = []
+
+        async def request(controller, name):
+            async with controller.slot():
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.create_task(request(worker_1, "first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(request(worker_2, "second"))
+        await asyncio.sleep(0.2)
+        assert order == ["first"]
+        assert (worker_2.in_flight, worker_2.queue_depth) == (0, 1)
+
+        release.set()
+        await asyncio.gather(first, second)
+        return order, worker_1, worker_2
+
+    order, worker_1, worker_2 = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert (worker_1.in_flight, worker_2.in_flight) == (0, 0)
+    assert worker_2.queue_depth == 0
+
+
+def test_requests_are_rejected_while_another_worker_holds_every_slot(
+    tmp_path,
+):
+    slots = SharedSlots(str(tmp_path / "slots"), 2)
+    held = [slots.try_acquire(), slots.try_acquire()]
+    assert None not in held
+    assert slots.try_acquire() is None
+
+    async def scenario():
+        controller = AdmissionController(
+            limit=2,
+            max_queue=1,
+            max_wait=0.2,
+            shared_slots=SharedSlots(str(tmp_path / "slots"), 2),
+        )
+        with pytest.raises(AdmissionRejectedError):
+            async with controller.slot():
+                pass
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert (controller.in_flight, controller.queue_depth) == (0, 0)
+
+    slots.release(held.pop())
+    fd = slots.try_acquire()
+    assert fd is not None
+    for fd in [fd, *held]:
+        slots.release(fd)
+
+
+def test_upload_rejected_when_at_capacity(
+    test_app, valid_data_dict, monkeypatch
+):
+    """When no upload slot can be obtained, the upload is rejected immediately with a 503 and a Retry-After header."""
+    monkeypatch.setattr(
+        "app.api.routers.openneuro.upload_admission",
+        AdmissionController(limit=0, max_queue=0, max_wait=10),
+    )
+
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds12345"},
+        files={"data_dictionary": json.dumps(valid_data_dict).encode()},
+        data={
+            "changes_summary": "Test summary",
+            "name": "Neurobagel User",
+            "email": "neurobageluser@email.com",
+        },
+    )
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "10"
+    assert "too many uploads" in response.json()["error"]
@@ -0,0 +1,135 @@
+import json
+
+import orjson
+import pytest
+
+from app import cli
+from app.api import audit
+from app.api.cache import MemoryCache
+from app.api.mirror import DatasetMirror
+
+
+@pytest.fixture()
+def populated_mirror(tmp_path, valid_data_dict):
+    """A mirror with a valid, a duplicate valid, an invalid and a missing participants.json."""
+    dataset_mirror = DatasetMirror(str(tmp_path / "mirror"))
+    files = {
+        "ds000001": json.dumps(valid_data_dict).encode(),
+        "ds000002": json.dumps(valid_data_dict).encode(),
+        "ds000003": b'{"participant_id": {"Description": "ID"}}',
+        "ds000004": None,
+    }
+    index = {}
+    for dataset_id, content in files.items():
+        blob_sha = None
+        if content is not None:
+            blob_sha = f"sha-{hash(content)}"
+            dataset_mirror.datasets_path.mkdir(parents=True, exist_ok=True)
+            (dataset_mirror.datasets_path / f"{dataset_id}.json").write_bytes(
+                content
+            )
+        index[dataset_id] = {
+            "blob_sha": blob_sha,
+            "head_sha": None,
+            "html_url": f"https://github.com/org/{dataset_id}",
+        }
+    dataset_mirror.index_path.write_bytes(orjson.dumps(index))
+    return dataset_mirror
+
+
+@pytest.fixture(autouse=True)
+def audit_cache(monkeypatch):
+    cache = MemoryCache()
+    monkeypatch.setattr(audit, "shared_cache", cache)
+    return cache
+
+
+def test_validate_dictionary_file_collects_all_warnings(valid_data_dict):
+    """All validation warnings are reported, not only the first one."""
+    for column in ("age", "age2", "sex", "sex2"):
+        valid_data_dict[column] = {
+            "Description": column,
+            "Annotations": {
+                "IsAbout": {
+                    "TermURL": (
+                        "nb:Age" if column.startswith("age") else "nb:Sex"
+                    ),
+                    "Label": column,
+                },
+                "VariableType": "Continuous",
+                "Format": {"TermURL": "nb:FromFloat", "Label": "float"},
+            },
+        }
+
+    result = audit.validate_dictionary_file(
+        json.dumps(valid_data_dict).encode()
+    )
+
+    assert result["status"] == "warnings"
+    assert len(result["warnings"]) == 2
+
+
+def test_validate_dictionary_file_reports_invalid_json():
+    result = audit.validate_dictionary_file(b"{")
+
+    assert result["status"] == "invalid"
+    assert result["errors"] == ["The file is not a valid JSON file."]
+
+
+def test_audit_reports_each_dataset(populated_mirror):
+    report = audit.audit_mirror(populated_mirror, max_workers=2)
+
+    assert report["summary"] == {
+        "valid": 2,
+        "warnings": 0,
+        "invalid": 1,
+        "missing": 1,
+        "total": 4,
+        "revalidated": 3,
+    }
+    invalid = report["datasets"]["ds000003"]
+    assert invalid["status"] == "invalid"
+    assert (
+        "at least one column with Neurobagel annotations"
+        in invalid["errors"][0]
+    )
+    assert invalid["html_url"] == "https://github.com/org/ds000003"
+
+
+def test_audit_rerun_only_revalidates_changed_files(
+    populated_mirror, audit_cache
+):
+    audit.audit_mirror(populated_mirror, max_workers=2)
+    (populated_mirror.datasets_path / "ds000003.json").write_bytes(b"{")
+    index = populated_mirror.load_index()
+    index["ds000003"]["blob_sha"] = "sha-changed"
+    populated_mirror.index_path.write_bytes(orjson.dumps(index))
+
+    report = audit.audit_mirror(populated_mirror, max_workers=2)
+
+    assert report["summary"]["revalidated"] == 1
+    assert report["datasets"]["ds000001"]["cached"] is True
+    assert report["datasets"]["ds000003"]["cached"] is False
+    assert report["datasets"]["ds000003"]["errors"] == [
+        "The file is not a valid JSON file."
+    ]
+
+
+def test_audit_command_writes_report(populated_mirror, tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "mirror", populated_mirror)
+    # Without syncing, the command does not need the GitHub App's private key
+    monkeypatch.setattr(
+        cli.utils, "APP_PRIVATE_KEY_PATH", str(tmp_path / "missing.pem")
+    )
+    report_path = tmp_path / "report.json"
+
+    exit_code = cli.main(["audit", "--no-sync", "-o", str(report_path)])
+
+    assert exit_code == 1
+    report = json.loads(report_path.read_text())
+    assert set(report["datasets"]) == {
+        "ds000001",
+        "ds000002",
+        "ds000003",
+        "ds000004",
+    }
@@ -0,0 +1,189 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from github import Github
+from github.GithubException import GithubException
+from github.Repository import Repository
+
+from app.api import branch_reaper, crud
+from app.api.cache import MemoryCache
+from app.api.dataset_index import DatasetIndex
+from app.api.models import Contributor
+from benchmarks.github_stub import (
+    ORG,
+    bot_signature,
+    start_stub,
+    stub_url,
+    tree_json,
+)
+from tests.conftest import dumps, make_data_dictionary
+
+
+@pytest.fixture()
+def github_stub(monkeypatch):
+    server, state = start_stub(
+        n_datasets=3, participants_json=dumps(make_data_dictionary(5))
+    )
+    g = Github(
+        base_url=stub_url(server),
+        seconds_between_requests=None,
+        seconds_between_writes=None,
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_github", lambda org: g
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    monkeypatch.setattr(branch_reaper, "shared_cache", crud.shared_cache)
+    yield g, state
+    server.shutdown()
+
+
+@pytest.fixture()
+def index():
+    return DatasetIndex(
+        ORG, refresh_interval=300, min_refresh_interval=0, missing_ttl=0
+    )
+
+
+def add_branches(state, name: str, *branches: str, author: dict | None = None):
+    """Add branches whose head commit was made by the bot two hours ago (or by the given author)."""
+    repo = state.repos[name]
+    author = author or bot_signature(
+        datetime.now(timezone.utc) - timedelta(hours=2)
+    )
+    for branch in branches:
+        commit_sha = hashlib.sha1(f"{name}:{branch}".encode()).hexdigest()
+        repo["commits"][commit_sha] = {
+            "message": "[bot] Update participants.json",
+            "tree": tree_json(repo)["sha"],
+            "parents": [repo["branches"]["main"]],
+            "author": author,
+        }
+        repo["branches"][branch] = commit_sha
+
+
+def test_sweep_deletes_only_orphaned_bot_branches(github_stub, index):
+    g, state = github_stub
+    add_branches(
+        state,
+        "ds000000",
+        "update-abc123",
+        "someuser/update-def456",
+        "update-open00",
+        "feature",
+    )
+    state.repos["ds000000"]["pulls"].append(
+        {"number": 1, "state": "open", "head": {"ref": "update-open00"}}
+    )
+
+    summary = branch_reaper.sweep(g, index)
+
+    assert summary.deleted == 2
+    assert sorted(state.repos["ds000000"]["branches"]) == [
+        "feature",
+        "main",
+        "update-open00",
+    ]
+
+
+def test_dry_run_only_lists_orphaned_branches(github_stub, index):
+    g, state = github_stub
+    add_branches(state, "ds000001", "update-abc123")
+
+    summary = branch_reaper.sweep(g, index, dry_run=True)
+
+    assert summary.orphaned_branches == [f"{ORG}/ds000001:update-abc123"]
+    assert summary.deleted == 0
+    assert "update-abc123" in state.repos["ds000001"]["branches"]
+
+
+def test_new_branches_are_not_swept(github_stub, index):
+    g, state = github_stub
+    add_branches(state, "ds000000", "update-abc123")
+    branch_reaper.register_new_branch(f"{ORG}/ds000000", "update-abc123")
+
+    assert branch_reaper.sweep(g, index).deleted == 0
+
+
+def test_branches_whose_head_commit_is_not_an_old_bot_commit_are_kept(
+    github_stub, index
+):
+    g, state = github_stub
+    # Human branches whose names happen to look like bot branches
+    add_branches(
+        state,
+        "ds000000",
+        "update-readme",
+        "alice/update-docs01",
+        author={
+            "name": "Alice",
+            "email": "alice@example.com",
+            "date": "2024-01-01T00:00:00Z",
+        },
+    )
+    # A bot branch created moments ago by another process, whose grace period this process does not know about
+    add_branches(state, "ds000001", "update-abc123", author=bot_signature())
+
+    summary = branch_reaper.sweep(g, index)
+
+    assert summary.deleted == 0
+    assert "update-readme" in state.repos["ds000000"]["branches"]
+    assert "update-abc123" in state.repos["ds000001"]["branches"]
+    # Only the repository with a bot branch still in its grace period is checked again
+    assert branch_reaper.sweep(g, index).checked == 1
+
+
+def test_deletions_are_rate_limited(github_stub, index, monkeypatch):
+    g, state = github_stub
+    add_branches(
+        state, "ds000000", "update-aaaaaa", "update-bbbbbb", "update-cccccc"
+    )
+    sleeps = []
+    monkeypatch.setattr(branch_reaper.time, "sleep", sleeps.append)
+
+    branch_reaper.sweep(g, index, batch_size=2, batch_interval=5)
+
+    assert sleeps == [5]
+
+
+def test_clean_unchanged_repositories_are_skipped(github_stub, index):
+    g, state = github_stub
+    branch_reaper.sweep(g, index)
+    state.request_counts.clear()
+
+    summary = branch_reaper.sweep(g, index)
+
+    assert summary.skipped == 3
+    assert state.request_counts["list_matching_refs"] == 0
+
+
+def test_failed_upload_deletes_its_branch(github_stub, index, monkeypatch):
+    g, state = github_stub
+    monkeypatch.setattr(crud, "dataset_index", index)
+
+    def fail(*args, **kwargs):
+        raise GithubException(422, {"message": "Validation Failed"})
+
+    monkeypatch.setattr(Repository, "create_pull", fail)
+
+    with pytest.raises(crud.UploadError, match="Validation Failed"):
+        crud.upload_data_dictionary(
+            dataset_id="ds000000",
+            uploaded_dict=make_data_dictionary(5, seed=" updated"),
+            contributor=Contributor(
+                name="Neurobagel User",
+                email="neurobageluser@email.com",
+                changes_summary="Test summary",
+            ),
+            dedup_key="upload:ds000000:test",
+            validation_warnings=[],
+        )
+    # Wait for the background deletion
+    branch_reaper._deletions.submit(lambda: None).result()
+
+    assert list(state.repos["ds000000"]["branches"]) == ["main"]
+    assert state.request_counts["delete_ref"] == 1
@@ -0,0 +1,164 @@
+import os
+import stat
+import time
+
+import pytest
+
+from app.api import cache as cache_module
+from app.api.cache import MemoryCache, SQLiteCache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    """Create caches of each backend with the given bounds."""
+
+    def _make_cache(**bounds):
+        if request.param == "memory":
+            return MemoryCache(**bounds)
+        # Recording every use, so that the least-recently-used order is exact
+        return SQLiteCache(
+            str(tmp_path / "cache.sqlite3"), touch_interval=0, **bounds
+        )
+
+    return _make_cache
+
+
+def test_cache_roundtrip(make_cache):
+    """Values are stored as JSON and returned unchanged."""
+    cache = make_cache()
+    cache.set("repo:ds000001", {"default_branch": "main"})
+
+    assert cache.get("repo:ds000001") == {"default_branch": "main"}
+    assert cache.get("repo:ds000002") is None
+
+
+def test_cache_entries_expire(make_cache, monkeypatch):
+    """Once an entry's TTL has passed, it is treated as missing."""
+    cache = make_cache()
+    cache.set("installation_token:org", "token", ttl=60)
+    assert cache.get("installation_token:org") == "token"
+
+    current_time = time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: current_time + 61)
+    assert cache.get("installation_token:org") is None
+    assert cache.get_entry("installation_token:org") is None
+
+
+def test_expired_entry_with_etag_can_be_revalidated(make_cache, monkeypatch):
+    """
+    An expired entry with an ETag is kept for a conditional request,
+    and becomes fresh again once the upstream data is confirmed unchanged.
+    """
+    cache = make_cache()
+    cache.set("contents:ds000001", {"a": 1}, ttl=60, etag='"abc"')
+
+    current_time = time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: current_time + 61)
+    assert cache.get("contents:ds000001") is None
+    entry = cache.get_entry("contents:ds000001")
+    assert entry.etag == '"abc"'
+    assert not entry.is_fresh
+
+    cache.revalidated("contents:ds000001", ttl=60)
+    assert cache.get("contents:ds000001") == {"a": 1}
+
+
+def test_least_recently_used_entries_are_evicted(make_cache):
+    """When the entry limit is exceeded, the least recently used entry is evicted first."""
+    cache = make_cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats().evictions == 1
+
+
+def test_cache_is_bounded_by_size(make_cache):
+    """Entries are evicted to keep the total serialized size within the limit."""
+    cache = make_cache(max_bytes=20)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+
+    stats = cache.stats()
+    assert stats.entries == 1
+    assert stats.size_bytes <= 20
+    assert cache.get("b") == "y" * 10
+
+    # A value that can never fit is not stored
+    cache.set("c", "z" * 100)
+    assert cache.get("c") is None
+    assert cache.get("b") == "y" * 10
+
+
+def test_cache_stats(make_cache):
+    cache = make_cache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (2, 1, 1)
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    """
+    Two cache instances using the same file (as in two worker processes) see each other's entries.
+    """
+    writer = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    reader = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+
+    writer.set("key", [1, 2, 3])
+    assert reader.get("key") == [1, 2, 3]
+
+    writer.delete("key")
+    assert reader.get("key") is None
+
+
+def test_sqlite_cache_hits_on_recently_used_entries_are_reads_only(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("a", 1)
+    conn = cache._connect()
+    changes = conn.total_changes
+
+    for _ in range(10):
+        assert cache.get("a") == 1
+
+    assert conn.total_changes == changes
+
+
+def test_sqlite_cache_usage_totals_match_the_table(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    for key in "abcde":
+        cache.set(key, key * 10)
+    cache.set("e", "x")
+    cache.delete("d")
+
+    stats = cache.stats()
+    assert (stats.entries, stats.size_bytes) == cache._connect().execute(
+        "SELECT COUNT(*), SUM(size) FROM cache"
+    ).fetchone()
+    assert stats.entries == 2
+
+
+def test_sqlite_cache_file_is_private(tmp_path):
+    """Only the owner can read the cache file (and its write-ahead log), even if it existed with looser permissions."""
+    path = tmp_path / "cache.sqlite3"
+    path.touch(mode=0o644)
+    os.chmod(path, 0o644)
+
+    SQLiteCache(str(path)).set("token:org", "secret")
+
+    for file in (path, tmp_path / "cache.sqlite3-wal"):
+        assert stat.S_IMODE(file.stat().st_mode) == 0o600
+
+
+def test_invalid_cache_backend_raises_error(monkeypatch):
+    monkeypatch.setattr(cache_module.utils, "CACHE_BACKEND", "redis")
+
+    with pytest.raises(ValueError, match="Unsupported cache backend"):
+        cache_module.create_cache()
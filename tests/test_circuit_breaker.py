@@ -0,0 +1,70 @@
+import pytest
+
+from app.api import circuit_breaker
+from app.api.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    """A controllable replacement for time.monotonic."""
+
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state is CircuitState.CLOSED
+
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.before_request()
+    assert e.value.retry_after == 20
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state is CircuitState.CLOSED
+
+
+@pytest.mark.parametrize(
+    "probe_succeeds,expected_state",
+    [(True, CircuitState.CLOSED), (False, CircuitState.OPEN)],
+)
+def test_half_open_circuit_lets_one_probe_through(
+    clock, probe_succeeds, expected_state
+):
+    """After the reset timeout, a single probe is allowed, and its outcome decides whether the circuit closes."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 31
+
+    breaker.before_request()
+    assert breaker.state is CircuitState.HALF_OPEN
+    # Other requests are still rejected while the probe is in flight
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    if probe_succeeds:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    assert breaker.state is expected_state
@@ -0,0 +1,153 @@
+import gzip
+import json
+import os
+
+import httpx
+import pytest
+
+from app.api import compression
+
+UPLOAD_FORM = {
+    "changes_summary": "Test summary",
+    "name": "Neurobagel User",
+    "email": "neurobageluser@email.com",
+}
+
+
+def multipart_body(data_dictionary: bytes) -> tuple[bytes, str]:
+    """Return an upload form as an encoded multipart body and its Content-Type header."""
+    request = httpx.Request(
+        "PUT",
+        "http://testserver/openneuro/upload",
+        files={"data_dictionary": ("participants.json", data_dictionary)},
+        data=UPLOAD_FORM,
+    )
+    return request.read(), request.headers["content-type"]
+
+
+def test_decompress_gzip():
+    content = b'{"participant_id": {}}' * 100
+
+    assert (
+        compression.decompress(gzip.compress(content), "gzip", 10_000)
+        == content
+    )
+    assert (
+        compression.decompress_file_part(gzip.compress(content), 10_000)
+        == content
+    )
+    # Uncompressed files are returned as they are
+    assert compression.decompress_file_part(content, 10_000) == content
+
+
+@pytest.mark.parametrize(
+    "data, encoding, status_code",
+    [
+        # A decompression bomb is stopped at the size limit
+        (gzip.compress(b" " * 1_000_000), "gzip", 413),
+        (gzip.compress(b"{}")[:-10], "gzip", 400),
+        (b"not gzip", "gzip", 400),
+        (b"{}", "br", 415),
+    ],
+)
+def test_decompress_errors(data, encoding, status_code):
+    with pytest.raises(compression.DecompressionError) as e:
+        compression.decompress(data, encoding, max_size=10_000)
+
+    assert e.value.status_code == status_code
+
+
+def test_decompress_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    content = b'{"participant_id": {}}' * 100
+
+    assert (
+        compression.decompress_file_part(
+            zstandard.ZstdCompressor().compress(content), 10_000
+        )
+        == content
+    )
+
+
+def test_upload_of_compressed_file_part(test_app):
+    """A gzip-compressed file part is decompressed before it is parsed and validated."""
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds000001"},
+        files={
+            "data_dictionary": (
+                "participants.json.gz",
+                gzip.compress(json.dumps({"participant_id": {}}).encode()),
+            )
+        },
+        data=UPLOAD_FORM,
+    )
+
+    assert response.status_code == 400
+    assert "failed validation" in response.json()["error"]
+
+
+def test_upload_of_compressed_request_body(test_app):
+    body, content_type = multipart_body(b"not json")
+
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds000001"},
+        content=gzip.compress(body),
+        headers={"Content-Type": content_type, "Content-Encoding": "gzip"},
+    )
+
+    assert response.status_code == 400
+    assert (
+        response.json()["error"]
+        == "The uploaded file is not a valid JSON file."
+    )
+
+
+def test_compressed_request_body_over_limit_is_rejected(test_app, monkeypatch):
+    body, content_type = multipart_body(b" " * 100_000)
+    monkeypatch.setattr(compression.utils, "MAX_DECOMPRESSED_SIZE", 10_000)
+
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds000001"},
+        content=gzip.compress(body),
+        headers={"Content-Type": content_type, "Content-Encoding": "gzip"},
+    )
+
+    assert response.status_code == 413
+
+
+def test_compressed_request_body_is_not_buffered_past_limit(
+    test_app, monkeypatch
+):
+    """A body whose compressed size is already over the limit is rejected without decompressing it."""
+    monkeypatch.setattr(compression.utils, "MAX_DECOMPRESSED_SIZE", 10_000)
+
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds000001"},
+        content=gzip.compress(os.urandom(20_000)),
+        headers={"Content-Encoding": "gzip"},
+    )
+
+    assert response.status_code == 413
+    assert "compressed upload is larger" in response.json()["error"]
+
+
+def test_unsupported_content_encoding_is_rejected(test_app):
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds000001"},
+        content=b"...",
+        headers={"Content-Encoding": "br"},
+    )
+
+    assert response.status_code == 415
+    assert "gzip" in response.headers["accept-encoding"]
+
+
+def test_large_responses_are_compressed(test_app):
+    response = test_app.get("/metrics", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
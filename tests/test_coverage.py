@@ -0,0 +1,149 @@
+import json
+
+import orjson
+import pytest
+
+from app import cli
+from app.api import coverage
+from app.api.cache import MemoryCache
+from app.api.mirror import DatasetMirror
+from app.api.routers import openneuro
+from tests.conftest import make_data_dictionary
+
+
+def write_mirror(dataset_mirror: DatasetMirror, files: dict) -> None:
+    index = {}
+    dataset_mirror.datasets_path.mkdir(parents=True, exist_ok=True)
+    for dataset_id, content in files.items():
+        blob_sha = None
+        if content is not None:
+            blob_sha = f"sha-{hash(content)}"
+            (dataset_mirror.datasets_path / f"{dataset_id}.json").write_bytes(
+                content
+            )
+        index[dataset_id] = {"blob_sha": blob_sha, "head_sha": None}
+    dataset_mirror.index_path.write_bytes(orjson.dumps(index))
+
+
+@pytest.fixture()
+def populated_mirror(tmp_path, valid_data_dict):
+    """A mirror with two annotated, an unannotated, an unreadable and a missing participants.json."""
+    dataset_mirror = DatasetMirror(str(tmp_path / "mirror"))
+    write_mirror(
+        dataset_mirror,
+        {
+            "ds000001": json.dumps(make_data_dictionary(5)).encode(),
+            "ds000002": json.dumps(valid_data_dict).encode(),
+            "ds000003": b'{"participant_id": {"Description": "ID"}}',
+            "ds000004": b"{",
+            "ds000005": None,
+        },
+    )
+    return dataset_mirror
+
+
+@pytest.fixture(autouse=True)
+def coverage_cache(monkeypatch):
+    cache = MemoryCache()
+    monkeypatch.setattr(coverage, "shared_cache", cache)
+    return cache
+
+
+def test_summarize_dictionary_file():
+    summary = coverage.summarize_dictionary_file(
+        json.dumps(make_data_dictionary(5)).encode()
+    )
+
+    assert summary["annotated_columns"] == 5
+    assert summary["concepts"]["nb:Assessment"] == {
+        "columns": 2,
+        "variable_types": ["Collection"],
+        "terms": ["snomed:273712001"],
+    }
+    assert summary["concepts"]["nb:Sex"]["terms"] == [
+        "snomed:248152002",
+        "snomed:248153007",
+    ]
+    assert coverage.summarize_dictionary_file(b"[1]")["error"] is not None
+
+
+def test_report_counts_datasets_by_concept(populated_mirror):
+    statistics = coverage.CoverageStatistics()
+
+    assert statistics.refresh(populated_mirror) == 5
+    report = statistics.report()
+
+    assert report["summary"] == {
+        "annotated": 2,
+        "unannotated": 1,
+        "unreadable": 1,
+        "missing": 1,
+        "total": 5,
+    }
+    assert report["concepts"]["nb:ParticipantID"] == {
+        "datasets": 2,
+        "columns": 2,
+        "variable_types": {"Identifier": 2},
+        "terms": {},
+    }
+    assert report["concepts"]["nb:Age"]["terms"] == {"nb:FromFloat": 1}
+
+
+def test_refresh_only_summarizes_changed_files(populated_mirror, monkeypatch):
+    statistics = coverage.CoverageStatistics()
+    statistics.refresh(populated_mirror)
+    summarized = []
+    summarize = coverage.summarize_dictionary_file
+    monkeypatch.setattr(
+        coverage,
+        "summarize_dictionary_file",
+        lambda content: summarized.append(content) or summarize(content),
+    )
+
+    assert statistics.refresh(populated_mirror) == 0
+
+    # ds000001 drops its age column, and ds000002 is deleted
+    data_dict = make_data_dictionary(5)
+    del data_dict["age"]
+    files = {
+        "ds000001": json.dumps(data_dict).encode(),
+        "ds000003": b'{"participant_id": {"Description": "ID"}}',
+    }
+    write_mirror(populated_mirror, files)
+
+    assert statistics.refresh(populated_mirror) == 4
+    assert summarized == [files["ds000001"]]
+    report = statistics.report(include_datasets=True)
+    assert "nb:Age" not in report["concepts"]
+    assert report["concepts"]["nb:ParticipantID"]["datasets"] == 1
+    assert set(report["datasets"]) == {"ds000001", "ds000003"}
+
+
+def test_coverage_command_and_route(
+    populated_mirror, tmp_path, monkeypatch, test_app
+):
+    monkeypatch.setattr(cli, "mirror", populated_mirror)
+    # Without syncing, the command does not need the GitHub App's private key
+    monkeypatch.setattr(
+        cli.utils, "APP_PRIVATE_KEY_PATH", str(tmp_path / "missing.pem")
+    )
+    monkeypatch.setattr(
+        cli, "coverage_statistics", coverage.CoverageStatistics()
+    )
+    report_path = tmp_path / "report.json"
+
+    exit_code = cli.main(
+        ["coverage", "--no-sync", "--per-dataset", "-o", str(report_path)]
+    )
+
+    assert exit_code == 0
+    report = json.loads(report_path.read_text())
+    assert report["concepts"]["nb:Sex"]["datasets"] == 1
+    assert report["datasets"]["ds000005"]["summary"] is None
+
+    monkeypatch.setattr(openneuro, "mirror", populated_mirror)
+    monkeypatch.setattr(
+        openneuro, "coverage_statistics", coverage.CoverageStatistics()
+    )
+    response = test_app.get("/openneuro/coverage")
+    assert response.json()["concepts"] == report["concepts"]
@@ -0,0 +1,144 @@
+import json
+
+import pytest
+from github import Github
+
+from app.api import crud
+from app.api.cache import MemoryCache
+from app.api.dataset_index import DatasetIndex
+from benchmarks.github_stub import ORG, start_stub, stub_url
+from tests.conftest import make_data_dictionary
+
+
+@pytest.fixture()
+def github_stub():
+    server, state = start_stub(n_datasets=5)
+    yield Github(
+        base_url=stub_url(server), seconds_between_requests=None
+    ), state
+    server.shutdown()
+
+
+@pytest.fixture()
+def index():
+    return DatasetIndex(
+        ORG,
+        refresh_interval=300,
+        min_refresh_interval=0,
+        missing_ttl=300,
+        per_page=2,
+    )
+
+
+def test_index_lists_every_page(github_stub, index):
+    g, state = github_stub
+    metadata = index.get(g, "ds000004")
+
+    assert metadata["default_branch"] == "main"
+    assert metadata["html_url"] == f"https://github.com/{ORG}/ds000004"
+    assert len(index.datasets) == 5
+    assert state.request_counts["list_org_repos"] == 3
+
+
+def test_known_datasets_are_looked_up_without_requests(github_stub, index):
+    g, state = github_stub
+    index.get(g, "ds000000")
+    state.request_counts.clear()
+
+    for _ in range(10):
+        assert index.get(g, "ds000001") is not None
+
+    assert sum(state.request_counts.values()) == 0
+
+
+def test_unknown_datasets_are_remembered_as_missing(github_stub, index):
+    g, state = github_stub
+    index.get(g, "ds000000")
+    state.request_counts.clear()
+
+    assert index.get(g, "ds999999") is None
+    # The miss triggers a single (conditional) refresh, after which the ID is rejected without requests
+    assert state.request_counts["list_org_repos"] == 3
+    assert index.is_known_missing("ds999999")
+    assert index.get(g, "ds999999") is None
+    assert state.request_counts["list_org_repos"] == 3
+
+
+def test_new_datasets_are_found_after_a_miss(github_stub, index):
+    g, state = github_stub
+    index.get(g, "ds000000")
+    state.add_repo("ds000005", b"{}")
+
+    assert index.get(g, "ds000005") is not None
+
+
+def test_refresh_keeps_unchanged_pages(github_stub, index):
+    """Pages that were not modified (304 responses) keep their previously listed repositories."""
+    g, state = github_stub
+    index.refresh(g)
+    del state.repos["ds000004"]
+
+    index.refresh(g)
+
+    assert sorted(index.datasets) == [f"ds00000{i}" for i in range(4)]
+
+
+def test_upload_rejects_known_missing_dataset(test_app, monkeypatch, index):
+    """An upload to an ID that was recently confirmed not to exist is rejected without contacting GitHub."""
+    index._missing["ds999999"] = float("inf")
+    monkeypatch.setattr(crud, "dataset_index", index)
+
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds999999"},
+        files={"data_dictionary": json.dumps({}).encode()},
+        data={
+            "changes_summary": "Test summary",
+            "name": "Neurobagel User",
+            "email": "neurobageluser@email.com",
+        },
+    )
+
+    assert response.status_code == 400
+    assert (
+        response.json()["error"]
+        == "404: Not Found. Please ensure you have provided a correct existing dataset ID."
+    )
+
+
+@pytest.mark.parametrize(
+    "method, route", [("PUT", "upload"), ("POST", "preview")]
+)
+def test_upload_to_dataset_deleted_since_refresh_is_rejected(
+    test_app, monkeypatch, github_stub, index, method, route
+):
+    """A dataset renamed or deleted since the index was refreshed is rejected as unknown, and removed from the index."""
+    g, state = github_stub
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_github", lambda org: g
+    )
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    monkeypatch.setattr(crud, "dataset_index", index)
+    index.refresh(g)
+    del state.repos["ds000004"]
+
+    response = test_app.request(
+        method,
+        f"/openneuro/{route}",
+        params={"dataset_id": "ds000004"},
+        files={
+            "data_dictionary": json.dumps(make_data_dictionary(5)).encode()
+        },
+        data={
+            "changes_summary": "Test summary",
+            "name": "Neurobagel User",
+            "email": "neurobageluser@email.com",
+        },
+    )
+
+    assert response.status_code == 400
+    assert response.json()["error"] == crud.UNKNOWN_DATASET_MESSAGE
+    assert "ds000004" not in index.datasets
@@ -0,0 +1,178 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from github import Github
+
+from app.api import crud
+from app.api.cache import MemoryCache, SQLiteCache
+from app.api.dataset_index import DatasetIndex
+from app.api.locks import KeyedLock, LockTimeoutError
+from app.api.models import Contributor
+from benchmarks.github_stub import ORG, start_stub, stub_url
+from tests.conftest import dumps, make_data_dictionary
+
+
+@pytest.fixture()
+def github_stub(monkeypatch):
+    server, state = start_stub(
+        n_datasets=2,
+        participants_json=dumps(make_data_dictionary(5)),
+        latency_ms=20,
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    # Without PyGithub's throttling of consecutive requests, to keep the tests fast
+    monkeypatch.setattr(
+        crud.github_client,
+        "get_installation_github",
+        lambda org: Github(
+            base_url=stub_url(server),
+            seconds_between_requests=None,
+            seconds_between_writes=None,
+        ),
+    )
+    monkeypatch.setattr(crud.utils, "GITHUB_API_URL", stub_url(server))
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    monkeypatch.setattr(
+        crud,
+        "dataset_index",
+        DatasetIndex(
+            ORG, refresh_interval=300, min_refresh_interval=0, missing_ttl=0
+        ),
+    )
+    yield state
+    server.shutdown()
+
+
+CONTRIBUTOR = Contributor(
+    name="Neurobagel User",
+    email="neurobageluser@email.com",
+    changes_summary="Test summary",
+)
+
+
+def upload(dataset_id: str, seed: str):
+    return crud.upload_data_dictionary(
+        dataset_id=dataset_id,
+        uploaded_dict=make_data_dictionary(5, seed=seed),
+        contributor=CONTRIBUTOR,
+        dedup_key=f"upload:{dataset_id}:{seed}",
+        validation_warnings=[],
+    )
+
+
+def upload_concurrently(*uploads: tuple[str, str]) -> list:
+    """Start several uploads at the same moment, returning each one's result or raised exception."""
+    barrier = threading.Barrier(len(uploads))
+
+    def start(dataset_id, seed):
+        barrier.wait()
+        try:
+            return upload(dataset_id, seed)
+        except crud.UploadError as e:
+            return e
+
+    with ThreadPoolExecutor(len(uploads)) as executor:
+        return list(executor.map(lambda args: start(*args), uploads))
+
+
+def test_locks_serialize_the_same_key_only():
+    locks = KeyedLock()
+    with locks.hold("ds000000"):
+        with pytest.raises(LockTimeoutError):
+            with locks.hold("ds000000", timeout=0.01):
+                pass
+        with locks.hold("ds000001", timeout=0.01):
+            assert len(locks) == 2
+    assert len(locks) == 0
+
+
+def test_locks_with_a_directory_are_shared_between_processes(tmp_path):
+    """Two lock sets using the same directory (as in two worker processes) serialize the same key."""
+    worker_1 = KeyedLock(directory=str(tmp_path / "locks"))
+    worker_2 = KeyedLock(directory=str(tmp_path / "locks"))
+    with worker_1.hold("ds000000"):
+        with pytest.raises(LockTimeoutError):
+            with worker_2.hold("ds000000", timeout=0.05):
+                pass
+        with worker_2.hold("ds000001", timeout=0.05):
+            pass
+    with worker_2.hold("ds000000", timeout=0.05):
+        pass
+
+
+def test_concurrent_uploads_to_a_dataset_do_not_open_conflicting_pull_requests(
+    github_stub,
+):
+    results = upload_concurrently(("ds000000", " a"), ("ds000000", " b"))
+
+    conflicts = [r for r in results if isinstance(r, crud.UploadError)]
+    successes = [r for r in results if not isinstance(r, crud.UploadError)]
+    assert len(successes) == 1 and len(conflicts) == 1
+    assert isinstance(conflicts[0], crud.UploadConflictError)
+    assert successes[0].pull_request_url in str(conflicts[0])
+    assert len(github_stub.repos["ds000000"]["pulls"]) == 1
+    assert github_stub.request_counts["get_contents"] == 1
+
+
+def test_later_upload_reuses_state_of_unchanged_dataset(github_stub):
+    upload("ds000000", " a")
+    upload("ds000000", " b")
+
+    assert len(github_stub.repos["ds000000"]["pulls"]) == 2
+    assert github_stub.request_counts["get_branch"] == 2
+    assert github_stub.request_counts["get_contents"] == 1
+
+
+def test_later_upload_refetches_state_when_default_branch_moved(github_stub):
+    upload("ds000000", " a")
+    github_stub.repos["ds000000"]["branches"]["main"] = "1" * 40
+
+    upload("ds000000", " b")
+
+    assert github_stub.request_counts["get_contents"] == 2
+
+
+def test_uploads_to_different_datasets_run_in_parallel(github_stub):
+    results = upload_concurrently(("ds000000", " a"), ("ds000001", " a"))
+
+    assert not any(isinstance(r, crud.UploadError) for r in results)
+    assert len(github_stub.repos["ds000000"]["pulls"]) == 1
+    assert len(github_stub.repos["ds000001"]["pulls"]) == 1
+
+
+def test_upload_waiting_in_another_worker_sees_the_pull_request_opened_meanwhile(
+    github_stub, monkeypatch, tmp_path
+):
+    """Two workers sharing the cache file: the second one's queued upload is rejected, and reuses the state the first one read."""
+    worker_caches = [
+        SQLiteCache(str(tmp_path / "cache.sqlite3")) for _ in range(2)
+    ]
+    # The second worker's upload was requested before the first one's pull request was opened
+    requested_at = time.time()
+    monkeypatch.setattr(crud, "shared_cache", worker_caches[0])
+    first = upload("ds000000", " a")
+    monkeypatch.setattr(crud, "shared_cache", worker_caches[1])
+
+    with pytest.raises(
+        crud.UploadConflictError, match=re.escape(first.pull_request_url)
+    ):
+        crud._upload_data_dictionaries(
+            dataset_id="ds000000",
+            uploaded_files=[
+                crud.UploadedFile(
+                    path="participants.json",
+                    data_dict=make_data_dictionary(5, seed=" b"),
+                    validation_warnings=[],
+                )
+            ],
+            contributor=CONTRIBUTOR,
+            dedup_key="upload:ds000000: b",
+            requested_at=requested_at,
+        )
+    assert len(github_stub.repos["ds000000"]["pulls"]) == 1
+    assert github_stub.request_counts["get_contents"] == 1
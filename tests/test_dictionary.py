@@ -0,0 +1,144 @@
+import json
+
+import pytest
+from github import Github
+from github.Requester import Requester
+
+from app.api import audit, crud
+from app.api import utility as utils
+from app.api.cache import MemoryCache
+from app.api.dataset_index import DatasetIndex
+from benchmarks.github_stub import ORG, git_blob_sha, start_stub, stub_url
+from tests.conftest import make_data_dictionary
+
+PARTICIPANTS_JSON = json.dumps(make_data_dictionary(5), indent="\t").encode()
+
+
+@pytest.fixture()
+def github_stub(monkeypatch):
+    server, state = start_stub(
+        n_datasets=2, participants_json=PARTICIPANTS_JSON
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    monkeypatch.setattr(
+        crud.github_client,
+        "get_installation_github",
+        lambda org: Github(
+            base_url=stub_url(server),
+            seconds_between_requests=None,
+            seconds_between_writes=None,
+        ),
+    )
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    monkeypatch.setattr(audit, "shared_cache", crud.shared_cache)
+    monkeypatch.setattr(
+        crud,
+        "dataset_index",
+        DatasetIndex(
+            ORG, refresh_interval=300, min_refresh_interval=0, missing_ttl=0
+        ),
+    )
+    yield state
+    server.shutdown()
+
+
+def get_dictionary(test_app, dataset_id: str, **kwargs):
+    return test_app.get(f"/openneuro/{dataset_id}/dictionary", **kwargs)
+
+
+def test_dictionary_is_returned_with_etag_of_blob(test_app, github_stub):
+    response = get_dictionary(test_app, "ds000000")
+
+    assert response.status_code == 200
+    assert response.content == PARTICIPANTS_JSON
+    assert response.headers["etag"] == f'"{git_blob_sha(PARTICIPANTS_JSON)}"'
+
+    response = get_dictionary(
+        test_app,
+        "ds000000",
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
+    assert not response.content
+
+
+def test_dictionary_is_revalidated_with_conditional_request(
+    test_app, github_stub, monkeypatch
+):
+    get_dictionary(test_app, "ds000000")
+    github_stub.request_counts.clear()
+
+    # A fresh cached file is served without any requests to GitHub
+    get_dictionary(test_app, "ds000000")
+    assert not github_stub.request_counts
+
+    # An expired file is revalidated, and only downloaded again once it changed
+    monkeypatch.setattr(utils, "DICTIONARY_CACHE_TTL", -1)
+    crud.forget_current_data_dictionary("ds000000")
+    get_dictionary(test_app, "ds000000")
+    github_stub.request_counts.clear()
+    get_dictionary(test_app, "ds000000")
+    assert github_stub.request_counts["get_contents"] == 1
+    assert crud.DICTIONARY_CACHE_LOOKUPS.value(result="not_modified") >= 1
+
+    github_stub.repos["ds000000"]["files"]["participants.json"] = b"{}"
+    response = get_dictionary(test_app, "ds000000")
+    assert response.content == b"{}"
+    assert response.headers["etag"] == f'"{git_blob_sha(b"{}")}"'
+
+
+def test_dictionary_with_formatting_and_validation(test_app, github_stub):
+    response = get_dictionary(
+        test_app,
+        "ds000000",
+        params={"formatting": True, "validation": True},
+    )
+
+    body = response.json()
+    assert body["content"] == PARTICIPANTS_JSON.decode()
+    assert body["formatting"] == {
+        "indent_char": "\t",
+        "indent_level": 1,
+        "newline_char": "\n",
+        "multiline": True,
+    }
+    assert body["validation"]["status"] in ("valid", "warnings")
+    # Each representation has its own ETag
+    assert response.headers["etag"] != f'"{git_blob_sha(PARTICIPANTS_JSON)}"'
+    # The validation result is shared with the audit
+    assert crud.shared_cache.get(
+        audit.validation_cache_key(git_blob_sha(PARTICIPANTS_JSON))
+    ) == {key: body["validation"][key] for key in body["validation"]}
+
+
+def test_missing_dictionary_and_dataset(test_app, github_stub):
+    del github_stub.repos["ds000001"]["files"]["participants.json"]
+
+    assert get_dictionary(test_app, "ds000001").status_code == 404
+    response = get_dictionary(test_app, "ds999999")
+    assert response.status_code == 400
+    assert response.json()["error"] == crud.UNKNOWN_DATASET_MESSAGE
+
+
+@pytest.mark.parametrize(
+    "github_status, expected_status",
+    [(403, 400), (451, 400), (502, 503)],
+)
+def test_github_errors_reading_dictionary(
+    test_app, github_stub, monkeypatch, github_status, expected_status
+):
+    request_json = Requester.requestJson
+
+    def refuse_contents(self, verb, url, *args, **kwargs):
+        if "/contents/" in url:
+            return github_status, {}, '{"message": "Refused"}'
+        return request_json(self, verb, url, *args, **kwargs)
+
+    monkeypatch.setattr(Requester, "requestJson", refuse_contents)
+
+    response = get_dictionary(test_app, "ds000000")
+
+    assert response.status_code == expected_status
+    assert not crud.shared_cache.get(crud._current_dictionary_key("ds000000"))
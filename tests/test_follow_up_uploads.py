@@ -0,0 +1,297 @@
+import json
+import time
+
+import pytest
+from github import Github
+from github.GithubException import GithubException
+from github.Repository import Repository
+
+from app.api import crud, rate_limit
+from app.api.cache import MemoryCache
+from app.api.dataset_index import DatasetIndex
+from benchmarks.github_stub import ORG, branch_files, start_stub, stub_url
+from tests.conftest import make_data_dictionary
+
+UPLOAD_FORM = {
+    "changes_summary": "Test summary",
+    "name": "Neurobagel User",
+    "email": "neurobageluser@email.com",
+    "gh_username": "nb-user",
+}
+
+
+@pytest.fixture()
+def github_stub(monkeypatch):
+    server, state = start_stub(
+        n_datasets=1,
+        participants_json=json.dumps(
+            make_data_dictionary(5), indent="\t"
+        ).encode(),
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    monkeypatch.setattr(
+        crud.github_client,
+        "get_installation_github",
+        lambda org: Github(
+            base_url=stub_url(server),
+            seconds_between_requests=None,
+            seconds_between_writes=None,
+        ),
+    )
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    # The uploads of these tests are not counted against the rate limits of the uploads of other tests
+    monkeypatch.setattr(
+        rate_limit,
+        "token_buckets",
+        rate_limit.MemoryTokenBuckets(max_entries=100),
+    )
+    monkeypatch.setattr(
+        crud,
+        "dataset_index",
+        DatasetIndex(
+            ORG, refresh_interval=300, min_refresh_interval=0, missing_ttl=0
+        ),
+    )
+    yield state
+    server.shutdown()
+
+
+def updated_dict(label: str) -> dict:
+    data_dict = make_data_dictionary(5)
+    data_dict["age"]["Annotations"]["IsAbout"]["Label"] = label
+    return data_dict
+
+
+def upload(test_app, data_dict: dict, **form):
+    return test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds000000"},
+        files={
+            "data_dictionary": ("participants.json", json.dumps(data_dict))
+        },
+        data={**UPLOAD_FORM, **form},
+    )
+
+
+def pull_request_branch(state) -> str:
+    (pull,) = state.repos["ds000000"]["pulls"]
+    return pull["head"]["ref"]
+
+
+def commit_onto_branch(repo: dict) -> None:
+    """Commit onto the branch of the pull request as a reviewer would, without changing participants.json."""
+    branch = repo["pulls"][0]["head"]["ref"]
+    parent = repo["branches"][branch]
+    repo["commits"]["2" * 40] = {
+        **repo["commits"][parent],
+        "parents": [parent],
+    }
+    repo["branches"][branch] = "2" * 40
+
+
+def test_follow_up_upload_is_committed_onto_open_pull_request(
+    test_app, github_stub
+):
+    first = upload(test_app, updated_dict("Age (years)")).json()
+    github_stub.request_counts.clear()
+
+    response = upload(test_app, updated_dict("Age at scan"))
+
+    body = response.json()
+    assert body["pull_request_url"] == first["pull_request_url"]
+    assert crud.FOLLOW_UP_UPLOAD_WARNING in body["warnings"]
+    assert not {"create_ref", "create_pull"} & set(github_stub.request_counts)
+    # Reviewers are shown the contributor's summary of the new changes
+    (comment,) = github_stub.repos["ds000000"]["comments"][
+        int(first["pull_request_url"].split("/")[-1])
+    ]
+    assert UPLOAD_FORM["changes_summary"] in comment
+    branch_file = branch_files(
+        github_stub.repos["ds000000"], pull_request_branch(github_stub)
+    )["participants.json"]
+    assert json.loads(branch_file) == updated_dict("Age at scan")
+    # Formatting is still matched to the file on the default branch
+    assert branch_file.decode() == json.dumps(
+        updated_dict("Age at scan"), indent="\t"
+    )
+
+
+def test_follow_up_of_several_files_fast_forwards_the_branch(
+    test_app, github_stub
+):
+    first = upload(test_app, updated_dict("Age (years)")).json()
+
+    response = test_app.put(
+        "/openneuro/upload-files",
+        params={"dataset_id": "ds000000"},
+        files=[
+            (
+                "data_dictionaries",
+                (
+                    "participants.json",
+                    json.dumps(updated_dict("Age of participant")),
+                ),
+            ),
+            (
+                "data_dictionaries",
+                ("moca.json", json.dumps(make_data_dictionary(4))),
+            ),
+        ],
+        data={
+            **UPLOAD_FORM,
+            "paths": ["participants.json", "phenotype/moca.json"],
+        },
+    )
+
+    assert response.json()["pull_request_url"] == first["pull_request_url"]
+    assert github_stub.request_counts["update_ref"] == 1
+    files = branch_files(
+        github_stub.repos["ds000000"], pull_request_branch(github_stub)
+    )
+    assert set(files) == {"participants.json", "phenotype/moca.json"}
+    assert json.loads(files["participants.json"]) == updated_dict(
+        "Age of participant"
+    )
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        # The pull request was closed
+        lambda repo: repo["pulls"][0].update(state="closed"),
+        # The default branch moved
+        lambda repo: repo["branches"].update(main="1" * 40),
+        # The branch was changed by someone else since the last upload to it
+        lambda repo: repo["branches"].update(
+            {repo["pulls"][0]["head"]["ref"]: repo["branches"]["main"]}
+        ),
+        # Someone else committed to the branch, but not to the uploaded file
+        commit_onto_branch,
+    ],
+)
+def test_follow_up_opens_new_pull_request_when_branch_cannot_be_reused(
+    test_app, github_stub, change
+):
+    first = upload(test_app, updated_dict("Age (years)")).json()
+    change(github_stub.repos["ds000000"])
+
+    response = upload(test_app, updated_dict("Age at scan"))
+
+    assert response.json()["pull_request_url"] != first["pull_request_url"]
+    assert len(github_stub.repos["ds000000"]["pulls"]) == 2
+
+
+def test_follow_up_opens_new_pull_request_when_pull_request_is_gone(
+    test_app, github_stub
+):
+    upload(test_app, updated_dict("Age (years)"))
+    # The pull request can no longer be read (GitHub responds with a 404)
+    github_stub.repos["ds000000"]["pulls"].clear()
+    github_stub.request_counts.clear()
+
+    response = upload(test_app, updated_dict("Age at scan"))
+
+    assert response.status_code == 200
+    assert crud.FOLLOW_UP_UPLOAD_WARNING not in response.json().get(
+        "warnings", []
+    )
+    assert github_stub.request_counts["create_pull"] == 1
+
+
+def test_follow_up_is_rejected_when_github_fails_to_return_pull_request(
+    test_app, github_stub, monkeypatch
+):
+    upload(test_app, updated_dict("Age (years)"))
+
+    def get_pull(self, number):
+        raise GithubException(502, {"message": "Bad Gateway"})
+
+    monkeypatch.setattr(Repository, "get_pull", get_pull)
+
+    response = upload(test_app, updated_dict("Age at scan"))
+
+    assert response.status_code == 503
+    assert len(github_stub.repos["ds000000"]["pulls"]) == 1
+
+
+def test_uploads_of_other_contributors_open_new_pull_requests(
+    test_app, github_stub
+):
+    first = upload(test_app, updated_dict("Age (years)")).json()
+
+    other = upload(
+        test_app, updated_dict("Age at scan"), gh_username="other-user"
+    ).json()
+    anonymous = upload(
+        test_app, updated_dict("Age (y)"), gh_username=""
+    ).json()
+
+    assert (
+        len(
+            {
+                first["pull_request_url"],
+                other["pull_request_url"],
+                anonymous["pull_request_url"],
+            }
+        )
+        == 3
+    )
+
+
+def test_uploads_with_same_username_but_another_email_open_new_pull_requests(
+    test_app, github_stub
+):
+    first = upload(test_app, updated_dict("Age (years)")).json()
+
+    response = upload(
+        test_app, updated_dict("Age at scan"), email="someone@else.com"
+    )
+
+    assert response.json()["pull_request_url"] != first["pull_request_url"]
+    assert len(github_stub.repos["ds000000"]["pulls"]) == 2
+
+
+def test_follow_up_queued_behind_own_pull_request_is_not_a_conflict(
+    test_app, github_stub
+):
+    def opened_while_waiting():
+        """Make the last pull request look as if it was opened while the next upload was waiting for the dataset."""
+        state = crud.get_dataset_state("ds000000")
+        state.pull_request_opened_at = time.time() + 3600
+        crud.set_dataset_state("ds000000", state)
+
+    first = upload(test_app, updated_dict("Age (years)")).json()
+    opened_while_waiting()
+    follow_up = upload(test_app, updated_dict("Age at scan"))
+    opened_while_waiting()
+    other = upload(test_app, updated_dict("Age (y)"), gh_username="other-user")
+
+    assert follow_up.json()["pull_request_url"] == first["pull_request_url"]
+    assert other.status_code == 409
+
+
+def test_closed_pull_request_is_forgotten(test_app, github_stub):
+    first = upload(test_app, updated_dict("Age (years)")).json()
+
+    assert crud.forget_pull_request(first["pull_request_url"])
+    assert not crud.shared_cache.get(
+        crud._contributor_pull_requests_key("ds000000")
+    )
+
+
+def test_resubmissions_are_only_deduplicated_per_contributor(
+    test_app, github_stub
+):
+    data_dict = updated_dict("Age (years)")
+    first = upload(test_app, data_dict, gh_username="").json()
+
+    resubmitted = upload(test_app, data_dict, gh_username="").json()
+    other = upload(
+        test_app, data_dict, gh_username="", email="someone@else.com"
+    ).json()
+
+    assert resubmitted["pull_request_url"] == first["pull_request_url"]
+    assert crud.DUPLICATE_UPLOAD_WARNING in resubmitted["warnings"]
+    assert other["pull_request_url"] != first["pull_request_url"]
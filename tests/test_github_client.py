@@ -0,0 +1,160 @@
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from github import Github
+from github.GithubException import GithubException
+
+from app.api import github_client
+from app.api.cache import SQLiteCache
+from app.api.circuit_breaker import CircuitBreaker, CircuitState
+
+
+@pytest.fixture()
+def shared_cache(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(github_client, "shared_cache", cache)
+    return cache
+
+
+@pytest.fixture()
+def mock_integration(monkeypatch):
+    """Replace GithubIntegration with a mock that counts the installation tokens it hands out."""
+    calls = []
+
+    class MockGithubIntegration:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def get_org_installation(self, org):
+            return SimpleNamespace(id=1)
+
+        def get_access_token(self, installation_id):
+            calls.append(installation_id)
+            return SimpleNamespace(
+                token=f"token-{len(calls)}",
+                expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+            )
+
+    monkeypatch.setattr(github_client.utils, "APP_ID", 1)
+    monkeypatch.setattr(github_client.utils, "APP_PRIVATE_KEY", "key")
+    monkeypatch.setattr(
+        github_client, "GithubIntegration", MockGithubIntegration
+    )
+    return calls
+
+
+def test_installation_token_is_reused(shared_cache, mock_integration):
+    """Only the first request for an installation token authenticates with GitHub."""
+    tokens = [github_client.get_installation_token("org") for _ in range(3)]
+
+    assert tokens == ["token-1"] * 3
+    assert len(mock_integration) == 1
+
+
+def test_expired_installation_token_is_refreshed(
+    shared_cache, mock_integration
+):
+    """A token is not reused once it is within the expiry margin."""
+    github_client.get_installation_token("org")
+    shared_cache.clear()
+
+    assert github_client.get_installation_token("org") == "token-2"
+
+
+@pytest.fixture()
+def local_github():
+    """A local HTTP server that answers every request with a minimal repository payload."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = json.dumps(
+                {"full_name": "org/repo", "default_branch": "main"}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_github_clients_share_connections(local_github):
+    """Separate GitHub clients (e.g., for separate uploads) reuse the same pooled connection."""
+    requests_before = github_client.GITHUB_REQUESTS.value()
+    connections_before = github_client.GITHUB_CONNECTIONS_OPENED.value()
+
+    for _ in range(3):
+        g = Github(base_url=local_github, seconds_between_requests=None)
+        assert g.get_repo("org/repo").default_branch == "main"
+
+    assert github_client.GITHUB_REQUESTS.value() - requests_before == 3
+    assert (
+        github_client.GITHUB_CONNECTIONS_OPENED.value() - connections_before
+        == 1
+    )
+
+
+@pytest.mark.parametrize(
+    "method, retried",
+    [("GET", True), ("DELETE", True), ("POST", False), ("PUT", False)],
+)
+def test_only_requests_that_cannot_be_applied_twice_are_retried(
+    method, retried
+):
+    adapter = github_client.session.get_adapter("https://api.github.com")
+    assert adapter.max_retries.is_retry(method, 502) == retried
+
+
+@pytest.fixture()
+def forbidding_github():
+    """A local HTTP server that answers every request with a 403 that is not a rate limit."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = json.dumps({"message": "Resource not accessible"}).encode()
+            self.send_response(403)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_half_open_probe_answered_with_forbidden_closes_circuit(
+    forbidding_github, monkeypatch
+):
+    """A 403 raised by GithubRetry still releases the half-open probe, and counts as GitHub responding."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setattr(github_client, "breaker", breaker)
+
+    with pytest.raises(GithubException) as e:
+        github_client.send_request(
+            "GET", f"{forbidding_github}/repos/org/repo"
+        )
+
+    assert e.value.status == 403
+    assert breaker.state is CircuitState.CLOSED
+    breaker.before_request()
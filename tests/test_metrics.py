@@ -0,0 +1,32 @@
+from app.api import metrics
+
+
+def test_render_metrics(monkeypatch):
+    """Metrics are rendered in the Prometheus text format, with labelled samples rendered per label set."""
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    requests = metrics.Counter("test_requests_total", "Number of requests")
+    states = metrics.Gauge("test_state", "Current state", labelled=True)
+    metrics.Gauge("test_function", "Computed value", function=lambda: 42)
+
+    requests.inc()
+    requests.inc(2)
+    states.set(1, name="github")
+
+    assert metrics.render_metrics() == (
+        "# HELP test_requests_total Number of requests\n"
+        "# TYPE test_requests_total counter\n"
+        "test_requests_total 3\n"
+        "# HELP test_state Current state\n"
+        "# TYPE test_state gauge\n"
+        'test_state{name="github"} 1\n'
+        "# HELP test_function Computed value\n"
+        "# TYPE test_function gauge\n"
+        "test_function 42\n"
+    )
+
+
+def test_metrics_route(test_app):
+    response = test_app.get("/metrics")
+
+    assert response.status_code == 200
+    assert "nb_uploader_github_requests_total" in response.text
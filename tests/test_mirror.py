@@ -0,0 +1,170 @@
+import fcntl
+
+import pytest
+from github import Github
+from github.GithubException import GithubException
+from github.Repository import Repository
+
+from app.api import crud
+from app.api.mirror import DatasetMirror
+from benchmarks.github_stub import ORG, start_stub, stub_url
+
+
+@pytest.fixture()
+def github_stub():
+    server, state = start_stub(n_datasets=3, participants_json=b'{"a": 1}')
+    yield Github(
+        base_url=stub_url(server), seconds_between_requests=None
+    ), state
+    server.shutdown()
+
+
+@pytest.fixture()
+def dataset_mirror(tmp_path):
+    return DatasetMirror(str(tmp_path / "mirror"))
+
+
+def update_file(state, name, content):
+    repo = state.repos[name]
+    repo["files"]["participants.json"] = content
+    repo["branches"]["main"] = f"{name}-{len(repo['branches'])}".ljust(40, "0")
+    repo["pushed_at"] = "2025-02-01T00:00:00Z"
+
+
+def test_first_sync_mirrors_every_dataset(github_stub, dataset_mirror):
+    g, state = github_stub
+    summary = dataset_mirror.sync(g, ORG)
+
+    assert summary.listed == 3
+    assert summary.fetched == 3
+    assert dataset_mirror.read("ds000000").content == b'{"a": 1}'
+
+
+def test_unchanged_datasets_are_not_fetched_again(github_stub, dataset_mirror):
+    """A repeat sync only lists the repositories when nothing was pushed."""
+    g, state = github_stub
+    dataset_mirror.sync(g, ORG)
+    state.request_counts.clear()
+
+    summary = dataset_mirror.sync(g, ORG)
+
+    assert summary.skipped == 3
+    assert set(state.request_counts) == {"get_org", "list_org_repos"}
+
+
+def test_only_changed_blobs_are_fetched(github_stub, dataset_mirror):
+    g, state = github_stub
+    dataset_mirror.sync(g, ORG)
+    update_file(state, "ds000001", b'{"b": 2}')
+    # A push that does not change the default branch (e.g., a new pull request branch) needs no tree or blob requests
+    state.repos["ds000002"]["pushed_at"] = "2025-02-01T00:00:00Z"
+    state.request_counts.clear()
+
+    summary = dataset_mirror.sync(g, ORG)
+
+    assert (summary.skipped, summary.checked, summary.fetched) == (1, 1, 1)
+    assert state.request_counts["get_blob"] == 1
+    assert state.request_counts["get_tree"] == 1
+    assert dataset_mirror.read("ds000001").content == b'{"b": 2}'
+
+
+def test_failed_blob_fetch_is_retried_by_next_sync(
+    github_stub, dataset_mirror, monkeypatch
+):
+    """A sync that fails partway leaves the entry at its old head, instead of serving the old file at the new head."""
+    g, state = github_stub
+    dataset_mirror.sync(g, ORG)
+    old_head_sha = state.repos["ds000001"]["branches"]["main"]
+    update_file(state, "ds000001", b'{"b": 2}')
+    get_git_blob = Repository.get_git_blob
+
+    def fail(*args, **kwargs):
+        raise GithubException(502, {"message": "Bad Gateway"})
+
+    monkeypatch.setattr(Repository, "get_git_blob", fail)
+    assert dataset_mirror.sync(g, ORG).failed == 1
+    new_head_sha = state.repos["ds000001"]["branches"]["main"]
+    assert dataset_mirror.read("ds000001", new_head_sha) is None
+    assert dataset_mirror.read("ds000001", old_head_sha).content == b'{"a": 1}'
+
+    monkeypatch.setattr(Repository, "get_git_blob", get_git_blob)
+    assert dataset_mirror.sync(g, ORG).fetched == 1
+    assert dataset_mirror.read("ds000001", new_head_sha).content == b'{"b": 2}'
+
+
+def test_deleted_files_and_repositories_are_removed(
+    github_stub, dataset_mirror
+):
+    g, state = github_stub
+    dataset_mirror.sync(g, ORG)
+    del state.repos["ds000000"]
+    state.repos["ds000001"]["files"].clear()
+    update_file(state, "ds000002", b"{}")
+    state.repos["ds000002"]["files"].clear()
+
+    summary = dataset_mirror.sync(g, ORG)
+
+    assert summary.removed == 1
+    assert dataset_mirror.read("ds000000") is None
+    assert dataset_mirror.read("ds000002") is None
+
+
+def test_read_requires_matching_head(github_stub, dataset_mirror):
+    """A mirrored file is not returned for a different head commit than it was mirrored from."""
+    g, state = github_stub
+    dataset_mirror.sync(g, ORG)
+    head_sha = state.repos["ds000000"]["branches"]["main"]
+
+    assert dataset_mirror.read("ds000000", head_sha) is not None
+    assert dataset_mirror.read("ds000000", "0" * 40) is None
+
+
+def test_sync_is_skipped_while_another_process_syncs(
+    github_stub, dataset_mirror
+):
+    g, state = github_stub
+    dataset_mirror.path.mkdir(parents=True)
+    with open(dataset_mirror.path / ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert dataset_mirror.sync_exclusively(g, ORG) is None
+
+
+def test_upload_reads_participants_file_from_up_to_date_mirror(
+    github_stub, dataset_mirror, monkeypatch
+):
+    g, state = github_stub
+    dataset_mirror.sync(g, ORG)
+    monkeypatch.setattr(crud, "mirror", dataset_mirror)
+    monkeypatch.setattr(crud.utils, "READ_FROM_MIRROR", True)
+    repo = g.withLazy(True).get_repo(f"{ORG}/ds000000")
+    head_sha = state.repos["ds000000"]["branches"]["main"]
+
+    mirrored_file = crud.get_participants_file(repo, head_sha)
+    assert mirrored_file.content == b'{"a": 1}'
+    assert state.request_counts["get_contents"] == 0
+
+    # When the mirror is behind the default branch, the file is fetched from GitHub instead
+    update_file(state, "ds000000", b'{"b": 2}')
+    head_sha = state.repos["ds000000"]["branches"]["main"]
+    assert crud.get_participants_file(repo, head_sha).content == b'{"b": 2}'
+    assert state.request_counts["get_contents"] == 1
+
+
+def test_large_participants_file_is_fetched_as_raw_blob(
+    github_stub, monkeypatch
+):
+    """Files over 1 MB, whose contents the contents API does not include, are fetched from the blobs API."""
+    g, state = github_stub
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    monkeypatch.setattr(
+        crud.github_client.utils, "GITHUB_API_URL", g.requester.base_url
+    )
+    large_content = b'{"a": "' + b"x" * (2 * 1024 * 1024) + b'"}'
+    update_file(state, "ds000000", large_content)
+    repo = g.withLazy(True).get_repo(f"{ORG}/ds000000")
+    head_sha = state.repos["ds000000"]["branches"]["main"]
+
+    assert crud.get_participants_file(repo, head_sha).content == large_content
+    assert state.request_counts["get_blob"] == 1
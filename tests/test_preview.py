@@ -0,0 +1,124 @@
+import json
+
+import pytest
+from github import Github
+
+from app.api import crud
+from app.api.cache import MemoryCache
+from app.api.dataset_index import DatasetIndex
+from benchmarks.github_stub import ORG, start_stub, stub_url
+from tests.conftest import make_data_dictionary
+
+WRITE_HANDLERS = {"create_ref", "put_contents", "create_pull"}
+
+
+@pytest.fixture()
+def github_stub(monkeypatch):
+    # An existing file indented with tabs, whose formatting the preview should match
+    server, state = start_stub(
+        n_datasets=2,
+        participants_json=json.dumps(
+            make_data_dictionary(5), indent="\t"
+        ).encode(),
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    monkeypatch.setattr(
+        crud.github_client,
+        "get_installation_github",
+        lambda org: Github(
+            base_url=stub_url(server),
+            seconds_between_requests=None,
+            seconds_between_writes=None,
+        ),
+    )
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    monkeypatch.setattr(
+        crud,
+        "dataset_index",
+        DatasetIndex(
+            ORG, refresh_interval=300, min_refresh_interval=0, missing_ttl=0
+        ),
+    )
+    yield state
+    server.shutdown()
+
+
+def preview(test_app, dataset_id: str, data_dict: dict):
+    return test_app.post(
+        "/openneuro/preview",
+        params={"dataset_id": dataset_id},
+        files={
+            "data_dictionary": (
+                "participants.json",
+                json.dumps(data_dict),
+                "application/json",
+            )
+        },
+    )
+
+
+def test_preview_matches_formatting_without_writes(test_app, github_stub):
+    updated_dict = make_data_dictionary(5)
+    updated_dict["age"]["Units"] = "months"
+
+    response = preview(test_app, "ds000000", updated_dict)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["change_type"] == "includes_non_annotation_changes"
+    assert body["content"] == json.dumps(updated_dict, indent="\t")
+    assert '-\t\t"Units": "years"\n' in body["diff"]
+    assert '+\t\t"Units": "months"\n' in body["diff"]
+    assert body["diff"].startswith("--- a/participants.json\n")
+    assert (
+        "The uploaded data dictionary may contain changes that are not related to Neurobagel annotations."
+        in body["warnings"]
+    )
+    assert not WRITE_HANDLERS & set(github_stub.request_counts)
+
+
+def test_repeat_preview_is_cached_until_default_branch_moves(
+    test_app, github_stub
+):
+    updated_dict = make_data_dictionary(5)
+    updated_dict["age"]["Annotations"]["IsAbout"]["Label"] = "Age (years)"
+    first = preview(test_app, "ds000000", updated_dict).json()
+    github_stub.request_counts.clear()
+
+    assert preview(test_app, "ds000000", updated_dict).json() == first
+    # Only the head of the default branch is checked
+    assert set(github_stub.request_counts) == {"get_branch"}
+
+    github_stub.repos["ds000000"]["branches"]["main"] = "1" * 40
+    github_stub.request_counts.clear()
+    preview(test_app, "ds000000", updated_dict)
+    assert "get_contents" in github_stub.request_counts
+
+
+def test_preview_of_new_file(test_app, github_stub):
+    del github_stub.repos["ds000001"]["files"]["participants.json"]
+
+    response = preview(test_app, "ds000001", make_data_dictionary(5))
+
+    body = response.json()
+    assert body["change_type"] == "new_file"
+    assert body["diff"].startswith("--- /dev/null\n+++ b/participants.json")
+
+
+def test_preview_rejects_unchanged_file(test_app, github_stub):
+    response = preview(test_app, "ds000000", make_data_dictionary(5))
+
+    assert response.status_code == 400
+    assert (
+        "The content selected for upload is the same as in the target file."
+        in response.json()["error"]
+    )
+
+
+def test_preview_rejects_invalid_data_dictionary(test_app, github_stub):
+    response = preview(test_app, "ds000000", {"participant_id": {}})
+
+    assert response.status_code == 400
+    assert not github_stub.request_counts
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+from app.api import rate_limit
+from app.api.rate_limit import (
+    Limit,
+    MemoryTokenBuckets,
+    SQLiteTokenBuckets,
+    take_token,
+)
+
+
+@pytest.fixture()
+def token_buckets(monkeypatch):
+    buckets = MemoryTokenBuckets()
+    monkeypatch.setattr(rate_limit, "token_buckets", buckets)
+    return buckets
+
+
+def upload(test_app, email="neurobageluser@email.com"):
+    return test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds000001"},
+        files={"data_dictionary": b"not JSON"},
+        data={
+            "changes_summary": "Test summary",
+            "name": "Neurobagel User",
+            "email": email,
+        },
+    )
+
+
+def test_bucket_refills_at_the_limit_rate():
+    limit = Limit(per_minute=60, burst=2)
+
+    assert take_token(2, 0, limit, now=0) == (1, 0)
+    assert take_token(0, 0, limit, now=0.5) == (0.5, 0.5)
+    # A bucket never holds more than the burst
+    assert take_token(0, 0, limit, now=100) == (1, 0)
+
+
+def test_requests_beyond_the_burst_must_wait():
+    buckets = MemoryTokenBuckets()
+    limit = Limit(per_minute=6000, burst=2)
+
+    assert buckets.take(["a"], limit) == 0
+    assert buckets.take(["a"], limit) == 0
+    assert buckets.take(["a"], limit) > 0
+    # Other keys have their own bucket
+    assert buckets.take(["b"], limit) == 0
+    time.sleep(0.02)
+    assert buckets.take(["a"], limit) == 0
+
+
+@pytest.mark.parametrize(
+    "make_buckets",
+    [
+        lambda tmp_path: MemoryTokenBuckets(),
+        lambda tmp_path: SQLiteTokenBuckets(str(tmp_path / "cache.sqlite3")),
+    ],
+)
+def test_request_rejected_by_one_bucket_takes_no_token_from_the_others(
+    tmp_path, make_buckets
+):
+    buckets = make_buckets(tmp_path)
+    limit = Limit(per_minute=1, burst=1)
+    buckets.take(["gh:nb-user"], limit)
+
+    assert buckets.take(["email:a@email.com", "gh:nb-user"], limit) > 0
+    # The email address still has its token
+    assert buckets.take(["email:a@email.com"], limit) == 0
+
+
+def test_refilled_and_excess_buckets_are_evicted():
+    buckets = MemoryTokenBuckets(max_entries=2)
+    fast = Limit(per_minute=60_000, burst=1)
+    slow = Limit(per_minute=1, burst=1)
+
+    buckets.take(["refills"], fast)
+    time.sleep(0.01)
+    buckets.take(["a"], slow)
+    assert len(buckets) == 1
+
+    buckets.take(["b"], slow)
+    buckets.take(["c"], slow)
+    assert len(buckets) == 2
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    """Buckets stored in the same SQLite file (e.g., by different workers) share their tokens."""
+    limit = Limit(per_minute=1, burst=1)
+    first = SQLiteTokenBuckets(str(tmp_path / "cache.sqlite3"))
+    second = SQLiteTokenBuckets(str(tmp_path / "cache.sqlite3"))
+
+    assert first.take(["client:1.2.3.4"], limit) == 0
+    assert second.take(["client:1.2.3.4"], limit) > 0
+
+
+def test_client_over_limit_gets_429(test_app, token_buckets, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CLIENT_LIMIT", Limit(1, burst=1))
+
+    assert upload(test_app).status_code == 400
+    response = upload(test_app)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert "Too many requests from this client" in response.json()["error"]
+
+
+def test_contributor_over_limit_gets_429(test_app, token_buckets, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CLIENT_LIMIT", Limit(0, burst=0))
+    monkeypatch.setattr(rate_limit, "CONTRIBUTOR_LIMIT", Limit(1, burst=1))
+
+    assert upload(test_app, email="user@email.com").status_code == 400
+    assert upload(test_app, email="other@email.com").status_code == 400
+    # Email addresses are compared case-insensitively
+    response = upload(test_app, email="User@Email.com")
+
+    assert response.status_code == 429
+    assert (
+        "Too many requests from this contributor" in response.json()["error"]
+    )
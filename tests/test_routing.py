@@ -71,3 +71,49 @@ def test_docs_when_root_path_includes_trailing_slash(
     )
     assert docs_response.status_code == expected_status_code
     assert schema_response.status_code == expected_status_code
+
+
+@pytest.mark.parametrize("path", ["/", "/docs", "/redoc", "/openapi.json"])
+def test_static_routes_support_conditional_requests(
+    test_app, path, monkeypatch
+):
+    """Static routes are served with a strong ETag and caching headers, and answered with a 304 when unchanged."""
+    monkeypatch.setattr(app, "root_path", "")
+    response = test_app.get(path)
+    etag = response.headers["ETag"]
+
+    assert response.status_code == status.HTTP_200_OK
+    assert etag.startswith('"')
+    assert "max-age" in response.headers["Cache-Control"]
+
+    conditional_response = test_app.get(path, headers={"If-None-Match": etag})
+    assert conditional_response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert conditional_response.headers["ETag"] == etag
+    assert conditional_response.content == b""
+
+
+def test_large_static_responses_are_compressed(test_app, monkeypatch):
+    monkeypatch.setattr(app, "root_path", "")
+    compressed = test_app.get(
+        "/openapi.json", headers={"Accept-Encoding": "gzip"}
+    )
+    uncompressed = test_app.get(
+        "/openapi.json", headers={"Accept-Encoding": "identity"}
+    )
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in uncompressed.headers
+    assert compressed.headers["ETag"] != uncompressed.headers["ETag"]
+    assert compressed.json() == uncompressed.json()
+
+
+def test_static_responses_are_rendered_per_root_path(test_app, monkeypatch):
+    """The same app serves different bodies (e.g., links to the docs) under different root paths."""
+    monkeypatch.setattr(app, "root_path", "/upload")
+    prefixed = test_app.get("/upload/openapi.json").json()
+    monkeypatch.setattr(app, "root_path", "")
+    unprefixed = test_app.get("/openapi.json").json()
+
+    assert prefixed["servers"] == [{"url": "/upload"}]
+    assert "servers" not in unprefixed
+    assert prefixed["paths"] == unprefixed["paths"]
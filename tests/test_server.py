@@ -0,0 +1,56 @@
+import pytest
+
+from app import server
+from app.api import utility as utils
+
+
+def test_tuned_profile_prefers_uvloop_and_httptools(monkeypatch):
+    monkeypatch.setattr(utils, "SERVER_PROFILE", "tuned")
+    monkeypatch.setattr(server, "is_installed", lambda module: True)
+
+    options = server.get_server_options()
+
+    assert options["loop"] == "uvloop"
+    assert options["http"] == "httptools"
+    assert options["timeout_graceful_shutdown"] == (
+        utils.SERVER_GRACEFUL_SHUTDOWN_TIMEOUT
+    )
+
+
+def test_tuned_profile_falls_back_when_optional_packages_are_missing(
+    monkeypatch,
+):
+    monkeypatch.setattr(utils, "SERVER_PROFILE", "tuned")
+    monkeypatch.setattr(server, "is_installed", lambda module: False)
+
+    options = server.get_server_options()
+
+    assert (options["loop"], options["http"]) == ("asyncio", "h11")
+
+
+def test_uvicorn_profile_uses_uvicorn_defaults(monkeypatch):
+    monkeypatch.setattr(utils, "SERVER_PROFILE", "uvicorn")
+
+    assert set(server.get_server_options()) == {
+        "host",
+        "port",
+        "workers",
+        "proxy_headers",
+    }
+
+
+def test_unknown_profile_is_rejected(monkeypatch):
+    monkeypatch.setattr(utils, "SERVER_PROFILE", "fast")
+
+    with pytest.raises(ValueError, match="NB_UPLOADER_API_SERVER_PROFILE"):
+        server.get_server_options()
+
+
+def test_tuned_profile_has_no_concurrency_limit_unless_configured(
+    monkeypatch,
+):
+    monkeypatch.setattr(utils, "SERVER_PROFILE", "tuned")
+    assert server.get_server_options()["limit_concurrency"] is None
+
+    monkeypatch.setattr(utils, "SERVER_LIMIT_CONCURRENCY", 2000)
+    assert server.get_server_options()["limit_concurrency"] == 2000
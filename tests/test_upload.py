@@ -1,7 +1,13 @@
 import io
+import json
 
 import pytest
 
+from app.api import github_client
+from app.api import utility as utils
+from app.api.cache import MemoryCache
+from app.api.circuit_breaker import CircuitBreaker
+
 
 @pytest.mark.parametrize(
     "invalid_username",
@@ -36,3 +42,92 @@ def test_invalid_gh_usernames_produce_error(test_app, invalid_username):
         "GitHub username (gh_username) contains invalid characters."
         in response.text
     )
+
+
+def test_upload_fails_fast_when_github_circuit_is_open(
+    test_app, valid_data_dict, monkeypatch
+):
+    """When the circuit breaker for GitHub is open, uploads fail immediately with a 503 and a Retry-After header."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    monkeypatch.setattr(github_client, "breaker", breaker)
+    monkeypatch.setattr(github_client, "shared_cache", MemoryCache())
+    monkeypatch.setattr(
+        github_client, "get_installation_token", lambda org: "token"
+    )
+
+    response = test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds12345"},
+        files={"data_dictionary": json.dumps(valid_data_dict).encode()},
+        data={
+            "changes_summary": "Test summary",
+            "name": "Neurobagel User",
+            "email": "neurobageluser@email.com",
+        },
+    )
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert "GitHub is currently unavailable" in response.json()["error"]
+
+
+def upload_invalid_dict(test_app, data_dict: dict):
+    return test_app.put(
+        "/openneuro/upload",
+        params={"dataset_id": "ds12345"},
+        files={"data_dictionary": json.dumps(data_dict).encode()},
+        data={
+            "changes_summary": "Test summary",
+            "name": "Neurobagel User",
+            "email": "neurobageluser@email.com",
+        },
+    )
+
+
+def test_all_schema_errors_are_listed(test_app, valid_data_dict):
+    """Every invalid column is listed with the location of its error, alongside the error message of a single column."""
+    invalid_dict = {
+        **valid_data_dict,
+        "a": {},
+        "b": "not a column",
+        "c": {"Description": "C", "Annotations": {}},
+    }
+
+    response = upload_invalid_dict(test_app, invalid_dict)
+
+    assert response.status_code == 400
+    body = response.json()
+    assert "Entry that failed validation: c" in body["error"]
+    assert [
+        (error["column"], error["path"]) for error in body["schema_errors"]
+    ] == [("a", "$.a"), ("b", "$.b"), ("c", "$.c")]
+    assert (
+        body["schema_errors"][0]["message"]
+        == "{} is not valid under any of the given schemas"
+    )
+
+
+def test_listed_schema_errors_are_capped(
+    test_app, valid_data_dict, monkeypatch
+):
+    monkeypatch.setattr(utils, "VALIDATION_MAX_ERRORS", 2)
+    invalid_dict = {**valid_data_dict, **{f"col_{i}": {} for i in range(5)}}
+
+    response = upload_invalid_dict(test_app, invalid_dict)
+
+    assert [error["column"] for error in response.json()["schema_errors"]] == [
+        "col_0",
+        "col_1",
+    ]
+
+
+def test_other_validation_errors_do_not_list_schema_errors(
+    test_app, valid_data_dict
+):
+    response = upload_invalid_dict(
+        test_app, {"participant_id": {"Description": "An ID"}}
+    )
+
+    assert response.status_code == 400
+    assert response.json()["schema_errors"] is None
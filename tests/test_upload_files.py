@@ -0,0 +1,221 @@
+import asyncio
+import json
+import warnings
+
+import pytest
+from github import Github
+
+from app.api import crud
+from app.api.cache import MemoryCache
+from app.api.dataset_index import DatasetIndex
+from app.api.routers import openneuro
+from benchmarks.github_stub import ORG, start_stub, stub_url
+from tests.conftest import make_data_dictionary
+
+UPLOAD_FORM = {
+    "changes_summary": "Test summary",
+    "name": "Neurobagel User",
+    "email": "neurobageluser@email.com",
+}
+
+
+@pytest.fixture()
+def github_stub(monkeypatch):
+    # An existing participants.json indented with tabs, whose formatting the upload should match
+    server, state = start_stub(
+        n_datasets=1,
+        participants_json=json.dumps(
+            make_data_dictionary(5), indent="\t"
+        ).encode(),
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_token", lambda org: "token"
+    )
+    monkeypatch.setattr(
+        crud.github_client,
+        "get_installation_github",
+        lambda org: Github(
+            base_url=stub_url(server),
+            seconds_between_requests=None,
+            seconds_between_writes=None,
+        ),
+    )
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    monkeypatch.setattr(
+        crud,
+        "dataset_index",
+        DatasetIndex(
+            ORG, refresh_interval=300, min_refresh_interval=0, missing_ttl=0
+        ),
+    )
+    yield state
+    server.shutdown()
+
+
+def upload_files(test_app, files: dict[str, dict]):
+    return test_app.put(
+        "/openneuro/upload-files",
+        params={"dataset_id": "ds000000"},
+        files=[
+            ("data_dictionaries", ("data_dictionary.json", json.dumps(d)))
+            for d in files.values()
+        ],
+        data={**UPLOAD_FORM, "paths": list(files)},
+    )
+
+
+def test_files_are_committed_together_in_one_pull_request(
+    test_app, github_stub
+):
+    updated_dict = make_data_dictionary(5)
+    updated_dict["age"]["Annotations"]["IsAbout"]["Label"] = "Age (years)"
+    phenotype_dict = make_data_dictionary(4, seed=" (phenotype)")
+
+    response = upload_files(
+        test_app,
+        {
+            "participants.json": updated_dict,
+            "phenotype/moca.json": phenotype_dict,
+        },
+    )
+
+    assert response.status_code == 200
+    assert "phenotype/moca.json: No existing phenotype/moca.json file" in (
+        response.json()["warnings"][0]
+    )
+    # One tree, commit, branch and pull request, and no commit per file
+    counts = github_stub.request_counts
+    assert [
+        counts[handler]
+        for handler in (
+            "create_tree",
+            "create_commit",
+            "create_ref",
+            "create_pull",
+        )
+    ] == [1, 1, 1, 1]
+    assert "put_contents" not in counts
+
+    repo = github_stub.repos["ds000000"]
+    (pull,) = repo["pulls"]
+    assert pull["title"] == "Update 2 data dictionaries"
+    assert (
+        "- Update participants.json\n- Add phenotype/moca.json" in pull["body"]
+    )
+    commit = repo["commits"][repo["branches"][pull["head"]["ref"]]]
+    committed_files = repo["trees"][commit["tree"]]
+    # Each file matches the formatting of its existing file (or the default formatting, for a new file)
+    assert (
+        committed_files["participants.json"]
+        == json.dumps(updated_dict, indent="\t").encode()
+    )
+    assert (
+        committed_files["phenotype/moca.json"]
+        == json.dumps(phenotype_dict, indent=4).encode()
+    )
+
+
+def test_validation_warnings_do_not_change_the_warning_filters(
+    test_app, github_stub
+):
+    phenotype_dict = make_data_dictionary(4, seed=" (phenotype)")
+    phenotype_dict["age_at_visit"] = phenotype_dict["age"]
+    filters = list(warnings.filters)
+
+    response = upload_files(
+        test_app,
+        {
+            "participants.json": make_data_dictionary(5, seed=" (updated)"),
+            "phenotype/moca.json": phenotype_dict,
+        },
+    )
+
+    assert any(
+        warning.startswith("phenotype/moca.json: ")
+        and "more than one column about age" in warning
+        for warning in response.json()["warnings"]
+    )
+    assert warnings.filters == filters
+
+
+def test_files_are_validated_off_the_event_loop(
+    test_app, github_stub, monkeypatch
+):
+    validate = openneuro.get_validation_warnings
+    on_event_loop = []
+
+    def get_validation_warnings(uploaded_dict):
+        try:
+            asyncio.get_running_loop()
+            on_event_loop.append(True)
+        except RuntimeError:
+            on_event_loop.append(False)
+        return validate(uploaded_dict)
+
+    monkeypatch.setattr(
+        openneuro, "get_validation_warnings", get_validation_warnings
+    )
+
+    response = upload_files(
+        test_app,
+        {
+            "participants.json": make_data_dictionary(5, seed=" (updated)"),
+            "phenotype/moca.json": make_data_dictionary(4),
+        },
+    )
+
+    assert response.status_code == 200
+    assert on_event_loop == [False, False]
+
+
+def test_invalid_files_are_all_reported_before_any_github_request(
+    test_app, github_stub
+):
+    response = upload_files(
+        test_app,
+        {
+            "participants.json": {"participant_id": {"Annotations": {}}},
+            "phenotype/moca.json": make_data_dictionary(4),
+            "phenotype/updrs.json": {"item": "not a column"},
+        },
+    )
+
+    assert response.status_code == 400
+    body = response.json()
+    assert body["error"].startswith("participants.json: ")
+    assert "\n\nphenotype/updrs.json: " in body["error"]
+    assert [
+        (error["file"], error["column"]) for error in body["schema_errors"]
+    ] == [
+        ("participants.json", "participant_id"),
+        ("phenotype/updrs.json", "item"),
+    ]
+    assert not github_stub.request_counts
+
+
+@pytest.mark.parametrize(
+    "paths, error",
+    [
+        (
+            ["../participants.json"],
+            "cannot be uploaded to ../participants.json",
+        ),
+        (
+            ["participants.json", "participants.json"],
+            "only be uploaded to once",
+        ),
+    ],
+)
+def test_invalid_paths_are_rejected(test_app, github_stub, paths, error):
+    response = test_app.put(
+        "/openneuro/upload-files",
+        params={"dataset_id": "ds000000"},
+        files=[
+            ("data_dictionaries", ("data_dictionary.json", b"{}"))
+            for _ in paths
+        ],
+        data={**UPLOAD_FORM, "paths": paths},
+    )
+
+    assert response.status_code == 400
+    assert error in response.json()["error"]
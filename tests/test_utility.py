@@ -44,6 +44,42 @@ def test_get_newline_info(
     )
 
 
+@pytest.mark.parametrize(
+    "original_json",
+    [
+        "0_indents.json",
+        "0_indents_singleline_nonewline.json",
+        "0_indents_singleline_withnewline.json",
+        "2tab_indents.json",
+        "3_indents.json",
+    ],
+)
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n"])
+@pytest.mark.parametrize("max_line_bytes", [4, 1024])
+def test_get_formatting_sample(
+    original_dicts_path, original_json, newline, max_line_bytes
+):
+    """The formatting detected from a sample of a file is the same as the formatting of the whole file."""
+    content = (
+        (original_dicts_path / original_json)
+        .read_bytes()
+        .replace(b"\n", newline)
+    )
+    json_str = content.decode("utf-8")
+
+    sample = utils.get_formatting_sample(content, max_line_bytes)
+
+    assert utils.get_indentation(sample) == utils.get_indentation(json_str)
+    assert utils.get_newline_info(sample) == utils.get_newline_info(json_str)
+
+
+def test_load_json_bytes_falls_back_for_values_orjson_rejects():
+    assert utils.load_json_bytes(b'{"a": 1}') == {"a": 1}
+    assert utils.load_json_bytes(b'{"a": 18446744073709551616}') == {
+        "a": 18446744073709551616
+    }
+
+
 @pytest.mark.parametrize(
     "indent_char, indent_num, newline_char, multiline, expected_json",
     [
@@ -0,0 +1,97 @@
+import jsonschema
+import pytest
+
+from app.api import dictionary_utils
+from app.api.dictionary_utils import (
+    DICTIONARY_SCHEMA,
+    ColumnFactsCache,
+    validate_data_dict,
+)
+from tests.conftest import make_data_dictionary
+
+
+@pytest.fixture()
+def validation_cache(monkeypatch):
+    cache = ColumnFactsCache(max_entries=100)
+    monkeypatch.setattr(dictionary_utils, "validation_cache", cache)
+    return cache
+
+
+def count_lookups(result: str) -> float:
+    return dictionary_utils.VALIDATION_CACHE_LOOKUPS.value(result=result)
+
+
+def test_reupload_only_rechecks_changed_columns(validation_cache):
+    data_dict = make_data_dictionary(20)
+    validate_data_dict(data_dict)
+    misses, hits = count_lookups("miss"), count_lookups("hit")
+
+    data_dict["item_0"]["Description"] = "An updated description"
+    validate_data_dict(data_dict)
+
+    assert count_lookups("miss") - misses == 1
+    assert count_lookups("hit") - hits == 19
+
+
+def test_reordered_keys_do_not_recheck_columns(validation_cache):
+    data_dict = make_data_dictionary(5)
+    validate_data_dict(data_dict)
+    misses = count_lookups("miss")
+
+    validate_data_dict(
+        {
+            column: dict(reversed(list(content.items())))
+            for column, content in data_dict.items()
+        }
+    )
+
+    assert count_lookups("miss") == misses
+
+
+def test_cache_is_bounded(validation_cache):
+    validation_cache.max_entries = 5
+    validate_data_dict(make_data_dictionary(20))
+
+    assert len(validation_cache) == 5
+
+
+def test_document_level_checks_use_cached_columns(validation_cache):
+    """Columns that are valid on their own are still checked against the rest of the data dictionary."""
+    data_dict = make_data_dictionary(3)
+    validate_data_dict(data_dict)
+    data_dict["another_participant_id"] = data_dict["participant_id"]
+
+    with pytest.raises(ValueError, match="more than one column about"):
+        validate_data_dict(data_dict)
+
+
+@pytest.mark.parametrize(
+    "invalid_columns",
+    [
+        {"age": {"Annotations": {}}},
+        {"sex": "not a column", "age": {"Annotations": {}}},
+        {"item_0": {"Annotations": {"IsAbout": {"TermURL": "nb:Assessment"}}}},
+        {"zzz": {"Description": 1}, "aaa": {"Description": 2}},
+    ],
+)
+@pytest.mark.parametrize("max_entries", [0, 100])
+def test_schema_errors_match_whole_document_validation(
+    validation_cache, invalid_columns, max_entries
+):
+    """The reported schema error is the one that validating the whole data dictionary at once would report."""
+    validation_cache.max_entries = max_entries
+    data_dict = {**make_data_dictionary(4), **invalid_columns}
+    with pytest.raises(jsonschema.ValidationError) as expected:
+        jsonschema.validate(data_dict, DICTIONARY_SCHEMA)
+
+    # Validate twice so that the second validation uses any cached results
+    for _ in range(2):
+        with pytest.raises(ValueError) as actual:
+            validate_data_dict(data_dict)
+        assert actual.value.__cause__.path == expected.value.path
+        assert actual.value.__cause__.message == expected.value.message
+
+
+def test_non_object_data_dictionary_is_rejected(validation_cache):
+    with pytest.raises(ValueError, match="Entire document"):
+        validate_data_dict([])
@@ -0,0 +1,171 @@
+import copy
+import json
+from pathlib import Path
+
+import pytest
+
+from app.api import dictionary_utils
+from app.api.dictionary_utils import (
+    ColumnFactsCache,
+    JSONSchemaEngine,
+    PydanticEngine,
+    validate_data_dict,
+)
+from tests.conftest import make_data_dictionary
+
+TEST_DATA_PATH = Path(__file__).absolute().parent / "test_data"
+REPLACEMENTS = [None, 1, 1.5, True, "x", [], ["n/a", "n/a"], {}]
+
+
+def entries(node, prefix=()):
+    """Yield the path and value of every entry nested in a JSON document."""
+    if isinstance(node, dict):
+        items = node.items()
+    elif isinstance(node, list):
+        items = enumerate(node)
+    else:
+        return
+    for key, value in items:
+        yield prefix + (key,), value
+        yield from entries(value, prefix + (key,))
+
+
+def mutate(document, path: tuple, replacement):
+    mutated = copy.deepcopy(document)
+    parent = mutated
+    for key in path[:-1]:
+        parent = parent[key]
+    if replacement == "<deleted>":
+        del parent[path[-1]]
+    elif replacement == "<extra key>":
+        parent[path[-1]]["Extra"] = "x"
+    else:
+        parent[path[-1]] = replacement
+    return mutated
+
+
+def make_corpus() -> list:
+    """
+    Return valid data dictionaries, and invalid variants of them where a single entry
+    is deleted, replaced by a value of every JSON type, or (for objects) given an extra key.
+    """
+    corpus = [
+        json.loads(file.read_text())
+        for file in sorted(TEST_DATA_PATH.glob("*/*_indents*.json"))
+    ]
+    valid_dict = make_data_dictionary(4)
+    corpus.append(valid_dict)
+    for path, value in entries(valid_dict):
+        for replacement in REPLACEMENTS + ["<deleted>"]:
+            corpus.append(mutate(valid_dict, path, replacement))
+        if isinstance(value, dict):
+            corpus.append(mutate(valid_dict, path, "<extra key>"))
+    corpus += [[], "not a data dictionary", None]
+    return corpus
+
+
+@pytest.fixture()
+def validation_cache(monkeypatch):
+    cache = ColumnFactsCache(max_entries=100)
+    monkeypatch.setattr(dictionary_utils, "validation_cache", cache)
+    return cache
+
+
+@pytest.mark.parametrize("document", make_corpus())
+def test_engines_accept_and_reject_the_same_documents(document):
+    jsonschema_errors = JSONSchemaEngine().find_errors(document)
+    pydantic_errors = PydanticEngine().find_errors(document)
+
+    assert bool(jsonschema_errors) == bool(pydantic_errors)
+    # The same columns are invalid
+    assert [error.path[:1] for error in jsonschema_errors] == [
+        error.path[:1] for error in pydantic_errors
+    ]
+
+
+@pytest.mark.parametrize(
+    "path, replacement, expected_path, expected_message",
+    [
+        (
+            ("age", "Annotations", "VariableType"),
+            "Cont",
+            ("age", "Annotations", "VariableType"),
+            "Input should be 'Continuous'",
+        ),
+        (
+            ("sex", "Description"),
+            "<deleted>",
+            ("sex",),
+            "'Description' is a required property",
+        ),
+        (
+            ("participant_id", "Annotations"),
+            "<extra key>",
+            ("participant_id", "Annotations"),
+            "Additional properties are not allowed ('Extra' was unexpected)",
+        ),
+        (
+            ("sex", "Annotations", "MissingValues"),
+            ["n/a", "n/a"],
+            ("sex", "Annotations", "MissingValues"),
+            "['n/a', 'n/a'] is not a unique list",
+        ),
+    ],
+)
+def test_pydantic_errors_are_located_in_the_data_dictionary(
+    path, replacement, expected_path, expected_message
+):
+    """Errors are reported for the union member closest to the column, at their path in the data dictionary."""
+    document = mutate(make_data_dictionary(4), path, replacement)
+
+    (error,) = PydanticEngine().find_errors(document)
+
+    assert error.path == expected_path
+    assert error.message == expected_message
+
+
+@pytest.mark.parametrize("engine", [JSONSchemaEngine(), PydanticEngine()])
+def test_engines_report_errors_in_the_same_format(
+    engine, validation_cache, monkeypatch
+):
+    monkeypatch.setattr(dictionary_utils, "validation_engine", engine)
+    data_dict = make_data_dictionary(4)
+    data_dict["age"]["Annotations"]["VariableType"] = "Cont"
+
+    with pytest.raises(
+        ValueError,
+        match=r"Entry that failed validation: (age|VariableType)\nDetails: ",
+    ):
+        validate_data_dict(data_dict)
+    with pytest.raises(
+        ValueError, match="Entry that failed validation: Entire document"
+    ):
+        validate_data_dict([])
+
+
+def test_cached_results_are_not_shared_between_engines(
+    validation_cache, monkeypatch
+):
+    data_dict = make_data_dictionary(4)
+    data_dict["age"]["Annotations"]["VariableType"] = "Cont"
+    for engine in (JSONSchemaEngine(), PydanticEngine()):
+        monkeypatch.setattr(dictionary_utils, "validation_engine", engine)
+        with pytest.raises(ValueError):
+            validate_data_dict(data_dict)
+
+    assert len(validation_cache) == 8
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        (("age", "Annotations", "Format"), "$.age.Annotations.Format"),
+        (("age", "MissingValues", 0), "$.age.MissingValues[0]"),
+        (("participant id", "Description"), "$['participant id'].Description"),
+        (("age.years",), "$['age.years']"),
+        (("subject's group",), "$['subject\\'s group']"),
+        (("1st_visit",), "$['1st_visit']"),
+    ],
+)
+def test_json_paths_use_bracket_notation_for_other_keys(path, expected):
+    assert dictionary_utils.format_json_path(path) == expected
@@ -0,0 +1,120 @@
+import json
+import shutil
+
+import pytest
+
+from app import cli
+from app.api import vocabulary
+from app.api.dictionary_utils import validate_data_dict
+from tests.conftest import make_data_dictionary
+
+
+def test_valid_terms_are_recognized():
+    assert vocabulary.get_unrecognized_terms(make_data_dictionary(10)) == []
+
+
+@pytest.mark.parametrize(
+    "column,path,term,expected_suggestion",
+    [
+        ("age", ["IsAbout"], "nb:Agee", "nb:Age"),
+        ("age", ["Format"], "nb:FromFlaot", "nb:FromFloat"),
+        ("sex", ["Levels", "M"], "snomed:248153070", "snomed:248153007"),
+        ("item_0", ["IsPartOf"], "snomd:273712001", "snomed:273712001"),
+    ],
+)
+def test_unrecognized_terms_are_reported_with_suggestions(
+    column, path, term, expected_suggestion
+):
+    data_dict = make_data_dictionary(4)
+    annotation = data_dict[column]["Annotations"]
+    for key in path:
+        annotation = annotation[key]
+    annotation["TermURL"] = term
+
+    unrecognized = vocabulary.get_unrecognized_terms(data_dict)
+
+    assert len(unrecognized) == 1
+    assert f"'{column}'" in unrecognized[0]
+    assert f"did you mean '{expected_suggestion}'?" in unrecognized[0]
+
+
+@pytest.mark.parametrize(
+    "term,is_valid",
+    [
+        ("snomed:123456", True),
+        ("ncit:C94342", True),
+        ("snomed:C94342", False),
+        ("ncit:94342", False),
+        ("nb:Diagnosis", False),
+    ],
+)
+def test_terms_in_open_vocabularies_are_checked_by_namespace(term, is_valid):
+    """Diagnoses are not all bundled, so only their namespace and ID format can be checked."""
+    assert (term in vocabulary.LEVELS["nb:Diagnosis"]) is is_valid
+
+
+def test_full_iris_in_known_namespaces_are_recognized():
+    data_dict = make_data_dictionary(3)
+    data_dict["age"]["Annotations"]["IsAbout"][
+        "TermURL"
+    ] = "http://neurobagel.org/vocab/Age"
+
+    assert vocabulary.get_unrecognized_terms(data_dict) == []
+
+
+def test_validation_rejects_unrecognized_terms():
+    data_dict = make_data_dictionary(3)
+    data_dict["age"]["Annotations"]["IsAbout"]["TermURL"] = "nb:Agee"
+
+    with pytest.raises(ValueError, match="did you mean 'nb:Age'"):
+        validate_data_dict(data_dict)
+
+
+def test_curated_terms_are_imported_as_complete_namespaces(
+    monkeypatch, tmp_path
+):
+    vocab_dir = tmp_path / "vocab"
+    shutil.copytree(vocabulary.VOCAB_DIR, vocab_dir)
+    monkeypatch.setattr(vocabulary, "VOCAB_DIR", vocab_dir)
+    term_vocabulary = tmp_path / "assessment_terms.json"
+    term_vocabulary.write_text(
+        json.dumps(
+            [
+                {
+                    "namespace_prefix": "snomed",
+                    "terms": [{"id": "273712001", "name": "An assessment"}],
+                }
+            ]
+        )
+    )
+
+    assert (
+        cli.main(["import-vocabulary", "assessment", str(term_vocabulary)])
+        == 0
+    )
+
+    assessments = vocabulary.load_vocabulary("assessment")
+    assert "snomed:273712001" in assessments
+    # Other SNOMED CT terms are no longer accepted by their ID format alone
+    assert "snomed:123456" not in assessments
+    assert "cogatlas:tsk_4a57abb949e1a" in assessments
+
+
+def test_term_vocabulary_with_unknown_namespace_is_rejected(
+    monkeypatch, tmp_path
+):
+    bundled_dir = vocabulary.VOCAB_DIR
+    vocab_dir = tmp_path / "vocab"
+    shutil.copytree(bundled_dir, vocab_dir)
+    monkeypatch.setattr(vocabulary, "VOCAB_DIR", vocab_dir)
+    term_vocabulary = tmp_path / "terms.json"
+    term_vocabulary.write_text(
+        json.dumps([{"namespace_prefix": "mesh", "terms": []}])
+    )
+
+    assert (
+        cli.main(["import-vocabulary", "diagnosis", str(term_vocabulary)]) == 1
+    )
+    assert (vocab_dir / "diagnosis.json").read_bytes() == (
+        bundled_dir / "diagnosis.json"
+    ).read_bytes()
@@ -0,0 +1,274 @@
+import hashlib
+from pathlib import Path
+
+import orjson
+import pytest
+from github import Github
+
+from app import cli
+from app.api import branch_reaper, crud
+from app.api import utility as utils
+from app.api import webhooks
+from app.api.cache import MemoryCache
+from app.api.dataset_index import DatasetIndex
+from app.api.mirror import DatasetMirror
+from benchmarks.github_stub import ORG, start_stub, stub_url
+
+RECORDINGS_PATH = Path(__file__).absolute().parent / "test_data" / "webhooks"
+
+
+@pytest.fixture()
+def github_stub(monkeypatch, tmp_path):
+    server, state = start_stub(n_datasets=3, participants_json=b'{"a": 1}')
+    g = Github(
+        base_url=stub_url(server),
+        seconds_between_requests=None,
+        seconds_between_writes=None,
+    )
+    monkeypatch.setattr(
+        crud.github_client, "get_installation_github", lambda org: g
+    )
+    monkeypatch.setattr(utils, "WEBHOOK_SECRET", "secret")
+    monkeypatch.setattr(utils, "WEBHOOK_RECORD_PATH", None)
+    monkeypatch.setattr(crud, "shared_cache", MemoryCache())
+    monkeypatch.setattr(branch_reaper, "shared_cache", crud.shared_cache)
+    monkeypatch.setattr(
+        crud,
+        "dataset_index",
+        DatasetIndex(
+            ORG, refresh_interval=300, min_refresh_interval=0, missing_ttl=300
+        ),
+    )
+    monkeypatch.setattr(
+        webhooks, "mirror", DatasetMirror(str(tmp_path / "mirror"))
+    )
+    crud.dataset_index.refresh(g)
+    yield g, state
+    server.shutdown()
+
+
+def load_payload(recording: str) -> dict:
+    return webhooks.load_recording(RECORDINGS_PATH / recording)[1]
+
+
+DELIVERY = "72d3162e-cc78-11e3-81ab-4c9367dc0958"
+
+
+def deliver(
+    test_app,
+    event: str,
+    payload: dict,
+    secret: str = "secret",
+    delivery: str = DELIVERY,
+):
+    body = orjson.dumps(payload)
+    return test_app.post(
+        "/openneuro/webhooks/github",
+        content=body,
+        headers={
+            "X-GitHub-Event": event,
+            "X-GitHub-Delivery": delivery,
+            "X-Hub-Signature-256": webhooks.sign(secret, body),
+        },
+    )
+
+
+def test_verify_signature():
+    body = b'{"zen": "Keep it logically awesome."}'
+    signature = webhooks.sign("secret", body)
+
+    assert webhooks.verify_signature("secret", body, signature)
+    assert not webhooks.verify_signature("other", body, signature)
+    assert not webhooks.verify_signature("secret", body + b" ", signature)
+    assert not webhooks.verify_signature("secret", body, None)
+
+
+def test_deliveries_with_invalid_signature_are_rejected(test_app, github_stub):
+    response = deliver(
+        test_app, "push", load_payload("1-push.json"), secret="wrong"
+    )
+
+    assert response.status_code == 401
+    assert crud.dataset_index.datasets["ds000000"]["pushed_at"] == (
+        "2025-01-01T00:00:00Z"
+    )
+
+
+def test_webhooks_are_disabled_without_secret(
+    test_app, github_stub, monkeypatch
+):
+    monkeypatch.setattr(utils, "WEBHOOK_SECRET", None)
+
+    response = deliver(test_app, "push", load_payload("1-push.json"))
+
+    assert response.status_code == 404
+
+
+def test_push_without_participants_changes_advances_mirror(
+    test_app, github_stub
+):
+    g, state = github_stub
+    webhooks.mirror.sync(g, ORG)
+    crud.set_dataset_state(
+        "ds000000",
+        crud.DatasetState(head_sha="0" * 40, participants_file=None),
+    )
+    state.request_counts.clear()
+
+    response = deliver(test_app, "push", load_payload("1-push.json"))
+
+    assert response.status_code == 200
+    assert response.json()["actions"] == [
+        "index update of ds000000",
+        "dataset state of ds000000 forgotten",
+        "mirror head of ds000000 advanced",
+    ]
+    # The push time is converted from the Unix timestamp of push events
+    assert crud.dataset_index.datasets["ds000000"]["pushed_at"] == (
+        "2025-02-01T00:00:00Z"
+    )
+    assert crud.get_dataset_state("ds000000") is None
+    assert webhooks.mirror.read("ds000000", "1" * 40).content == b'{"a": 1}'
+    assert not state.request_counts
+
+
+def test_push_with_participants_changes_updates_mirror(test_app, github_stub):
+    g, state = github_stub
+    webhooks.mirror.sync(g, ORG)
+    state.repos["ds000000"]["files"]["participants.json"] = b'{"b": 2}'
+    state.repos["ds000000"]["branches"]["main"] = "2" * 40
+    payload = load_payload("1-push.json")
+    payload["after"] = "2" * 40
+    payload["commits"][0]["modified"] = ["participants.json"]
+
+    response = deliver(test_app, "push", payload)
+
+    # The test client runs the background update before returning the response
+    assert "mirror update of ds000000" in response.json()["actions"]
+    assert (
+        "current data dictionary of ds000000 forgotten"
+        in response.json()["actions"]
+    )
+    assert webhooks.mirror.read("ds000000", "2" * 40).content == b'{"b": 2}'
+
+
+def test_push_with_too_many_commits_to_list_updates_mirror(
+    test_app, github_stub
+):
+    g, state = github_stub
+    webhooks.mirror.sync(g, ORG)
+    state.repos["ds000000"]["files"]["participants.json"] = b'{"b": 2}'
+    state.repos["ds000000"]["branches"]["main"] = "2" * 40
+    payload = load_payload("1-push.json")
+    payload["after"] = "2" * 40
+    # The commit changing participants.json is not among the listed commits
+    payload["commits"] = [
+        {**payload["commits"][0], "added": [], "modified": [], "removed": []}
+    ] * webhooks.PUSH_PAYLOAD_MAX_COMMITS
+
+    response = deliver(test_app, "push", payload)
+
+    assert "mirror head of ds000000 advanced" not in response.json()["actions"]
+    assert (
+        "current data dictionary of ds000000 forgotten"
+        in response.json()["actions"]
+    )
+    assert webhooks.mirror.read("ds000000", "2" * 40).content == b'{"b": 2}'
+
+
+def test_closed_pull_request_forgets_its_upload(test_app, github_stub):
+    payload = load_payload("2-pull_request-closed.json")
+    pull_request_url = payload["pull_request"]["html_url"]
+    crud.shared_cache.set("upload:ds000001:abc", pull_request_url)
+    crud.shared_cache.set(
+        f"pull-request-upload:{pull_request_url}", "upload:ds000001:abc"
+    )
+    crud.set_dataset_state(
+        "ds000001",
+        crud.DatasetState(
+            head_sha="0" * 40,
+            participants_file=None,
+            pull_request_url=pull_request_url,
+            pull_request_opened_at=1.0,
+        ),
+    )
+    crud.shared_cache.set(f"branch-sweep:clean:{ORG}/ds000001", "2025")
+
+    response = deliver(test_app, "pull_request", payload)
+
+    assert response.json()["actions"] == [
+        f"upload of {pull_request_url} forgotten",
+        "branch sweep of ds000001 scheduled",
+    ]
+    assert crud.shared_cache.get("upload:ds000001:abc") is None
+    assert crud.get_dataset_state("ds000001").pull_request_opened_at is None
+    assert crud.shared_cache.get(f"branch-sweep:clean:{ORG}/ds000001") is None
+
+
+def test_renamed_repository_updates_every_workers_index(test_app, github_stub):
+    g, state = github_stub
+    assert crud.dataset_index.get(g, "ds000002-renamed") is None
+    state.request_counts.clear()
+
+    response = deliver(
+        test_app, "repository", load_payload("3-repository-renamed.json")
+    )
+
+    assert response.json()["actions"] == [
+        "ds000002 removed from index",
+        "index update of ds000002-renamed",
+    ]
+    assert "ds000002" not in crud.dataset_index.datasets
+    # The new name is no longer known to be missing, and is found without a refresh
+    assert crud.dataset_index.get(g, "ds000002-renamed") is not None
+    assert not state.request_counts
+
+    # Other workers refresh their index on their next upload
+    crud.apply_dataset_index_changes()
+    assert crud.dataset_index.refreshed_at > float("-inf")
+    crud.dataset_index.changed_at = float("-inf")
+    crud.apply_dataset_index_changes()
+    assert crud.dataset_index.refreshed_at == float("-inf")
+
+
+def test_events_from_other_organizations_are_ignored(test_app, github_stub):
+    payload = load_payload("3-repository-renamed.json")
+    payload["repository"]["owner"]["login"] = "someone-else"
+
+    response = deliver(test_app, "repository", payload)
+
+    assert response.json()["actions"] == []
+    assert "ds000002" in crud.dataset_index.datasets
+
+
+def test_replay_recorded_deliveries(github_stub, capsys):
+    assert cli.main(["replay-webhooks", str(RECORDINGS_PATH)]) == 0
+
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 3
+    assert output[0].endswith("push -> index update of ds000000")
+    assert "ds000002-renamed" in crud.dataset_index.datasets
+
+
+def test_received_deliveries_can_be_recorded(
+    test_app, github_stub, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(utils, "WEBHOOK_RECORD_PATH", str(tmp_path / "rec"))
+    payload = load_payload("1-push.json")
+
+    deliver(test_app, "push", payload)
+
+    assert webhooks.load_recording(tmp_path / "rec" / f"{DELIVERY}.json") == (
+        "push",
+        payload,
+    )
+
+    # The delivery header is not signed, so cannot choose where the recording is written
+    deliver(test_app, "push", payload, delivery="../../escaped")
+
+    assert not (tmp_path / "escaped.json").exists()
+    assert (
+        tmp_path
+        / "rec"
+        / f"{hashlib.sha256(orjson.dumps(payload)).hexdigest()}.json"
+    ).exists()